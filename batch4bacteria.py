@@ -2,27 +2,90 @@
 # -*- coding: utf-8 -*-
 
 import argparse
-import tempfile
-import subprocess
-import shlex
 import os
 import datetime
+import pickle
 
 import tools
+import batch4pred
+import catalog
+import constants
 
 # To do IS element prediction before summarizing prediction if PREDICT = 1
 # To summarize prediction based on the previous prediction to save time if PREDICT = 0
 #PREDICT = 1
 PREDICT = 0
 
-python3 = '/usr/local/bin/python3'
-#cmd = '/u/zhiqxie/xie/is/isfinder/isPredict.py'
-#cmd = '/u/zhiqxie/xie/is/isfinder/pred.py'
-#cmd = 'isPredict.py'
-cmd = 'pred.py'
-
 #taxfile = 'tax.dat'
 
+# Write organism.sum, organism4genome.sum, organism4plasmid.sum and organism4phage.sum in each
+# organism directory and is.sum, is4genome.sum, is4plasmid.sum and is4phage.sum in current directory,
+# where the summarizations are aggregated by SQL queries on catalog, refer to catalog.summarize()
+#
+# file4orgs: {org: files, ..., org: files}
+# files: [file4fileid, ..., file4fileid]
+def sum4catalog(file4orgs, dir4prediction):
+	# dnaType: None for all DNA sequences, 2, 1 and 0 for genome, plasmid and phage DNA
+	for dnaType, sumfile4org, sumfile in (
+			(None, 'organism.sum', 'is.sum'),
+			(2, 'organism4genome.sum', 'is4genome.sum'),
+			(1, 'organism4plasmid.sum', 'is4plasmid.sum'),
+			(0, 'organism4phage.sum', 'is4phage.sum')):
+		# sum4seqs: {org: {seqid: sum4seq, ...}, ...}
+		sum4seqs = catalog.summarize(file4orgs, dnaType, bySeq=True)
+		for org in sorted(sum4seqs.keys()):
+			path = os.path.join(dir4prediction, org)
+			tools.makedir(path)
+			tools.output4sumFull(sum4seqs[org], os.path.join(path, sumfile4org))
+		# sum4is: {org: sum4org, ...}
+		sum4is = catalog.summarize(file4orgs, dnaType)
+		if len(sum4is) > 0:
+			tools.output4sumFull(sum4is, sumfile)
+	for org in sorted(file4orgs.keys()):
+		if org not in sum4is.keys():
+			print('Warning: no DNA sequence of', org, 'was found in catalog', constants.file4catalog)
+
+# summarizations of organisms read by the last batch, which is kept in current directory with is.sum
+file4cache = 'is.sum.cache'
+
+# Return cache of the summarizations of organisms
+# cache: {'files': {sumFileByOrg: (size, mtime, sum4org), ...}, 'keys': {sumfile: key, ...}}
+#	sum4org: summarization returned by tools.getSumFull(sumFileByOrg, org)
+#	key: fingerprint of the organism summarizations in sumfile, e.g. is.sum, refer to rdSum4orgs()
+def rdCache4sum(file):
+	if os.path.isfile(file):
+		try:
+			with open(file, 'rb') as fp:
+				return pickle.load(fp)
+		except (OSError, EOFError, pickle.UnpicklingError):
+			print('Warning: ignore broken cache file', file)
+	return {'files': {}, 'keys': {}}
+
+def wrCache4sum(file, cache):
+	tmpfile = '{}.{}.tmp'.format(file, os.getpid())
+	with open(tmpfile, 'wb') as fp:
+		pickle.dump(cache, fp, protocol=pickle.HIGHEST_PROTOCOL)
+	os.replace(tmpfile, file)
+
+# Return [sum4is, key]
+# sum4is: {org: sum4org, ...}, summarization read from file sumfile4org in each organism directory,
+#	where the file is parsed again only if its size or mtime changed since it was cached
+# key: fingerprint of the files summarized in sum4is
+def rdSum4orgs(orgs, dir4prediction, sumfile4org, cache):
+	sum4is = {}
+	files = []
+	for org in sorted(orgs):
+		sumFileByOrg = os.path.join(dir4prediction, org, sumfile4org)
+		if os.path.isfile(sumFileByOrg) and os.stat(sumFileByOrg).st_size > 0:
+			stat = os.stat(sumFileByOrg)
+			cached = cache['files'].get(sumFileByOrg)
+			if cached is None or cached[:2] != (stat.st_size, stat.st_mtime_ns):
+				cached = (stat.st_size, stat.st_mtime_ns, tools.getSumFull(sumFileByOrg, org))
+				cache['files'][sumFileByOrg] = cached
+			sum4is[org] = cached[2]
+			files.append((sumFileByOrg,) + cached[:2])
+	return [sum4is, tools.fingerprint(files)]
+
 def batch(args):
 	dnaListFile4orgs = args['fileList']
 	print('Batch running begins at', datetime.datetime.now().ctime())
@@ -47,21 +110,11 @@ def batch(args):
 		'''
 		dir2proteome4org = '/home/data/insertion_sequence/output4FragGeneScan1.19_illumina_5'
 		dir2hmmsearchResults = '/home/data/insertion_sequence/output4hmmsearch_illumina_5_cdhit30'
-		cmdargs = [python3, cmd, '', dir2proteome4org, dir2hmmsearchResults]
 		# summarize IS elements in each genome DNA and each organism 
-		for org in file4orgs.keys():
-			files = file4orgs[org]
-			fp = tempfile.NamedTemporaryFile(delete=False)
-			fp.write(('\n'.join(files)+'\n').encode())
-			fp.close()
-			cmdargs[2] = fp.name
-			cmdline = ' '.join(cmdargs)
-			callcmd = shlex.split(cmdline)
-			#subprocess.check_call(callcmd, shell=False, universal_newlines=False, stdout=subprocess.DEVNULL)
-			#subprocess.check_call(callcmd, shell=False, universal_newlines=False)
-			subprocess.check_output(callcmd, shell=False, universal_newlines=False, stderr=subprocess.STDOUT)
-			os.remove(fp.name)
-			print(org, 'was processed')
+		# pred.pred() is run for the organisms in a pool of worker processes, refer to batch4pred.py
+		failed = batch4pred.predOrgs(file4orgs, dir2proteome4org, dir2hmmsearchResults)
+		if len(failed) > 0:
+			print('Warning: no prediction for {} organisms: {}'.format(len(failed), ' '.join(failed)))
 
 	# get summarization of IS elements for each organism and write summarization 
 	# for all organisms into file 'is.sum'.
@@ -75,54 +128,37 @@ def batch(args):
 	tax = []
 
 	dir4prediction = args['dir2prediction']
-	# write 'organism.sum' in each organism directory
+	# summarize the predictions recorded in catalog by pred.py
+	if constants.catalog4pred == True and os.path.isfile(constants.file4catalog):
+		sum4catalog(file4orgs, dir4prediction)
+		print('Batch running finishes at', datetime.datetime.now().ctime())
+		return
+
+	# write 'organism.sum' in each organism directory, only for the organisms whose
+	# predictions or DNA files changed since the last batch
 	mDNA, dir4data = tools.fnaFileList2mDNA(dnaListFile4orgs)
-	tools.sum4org(mDNA, dir4data, tax, dir4prediction=dir4prediction)
+	orgs4update = tools.sum4org(mDNA, dir4data, tax, dir4prediction=dir4prediction)
+	print('number of organisms summarized again:', len(orgs4update))
 
-	dir4prediction = args['dir2prediction']
-	# prepare and write 'is.sum' in current directory
-	sum4is = {}
-	for org in file4orgs.keys():
-		sumFileByOrg = os.path.join(dir4prediction, org, 'organism.sum')
-		if os.path.isfile(sumFileByOrg) and os.stat(sumFileByOrg).st_size > 0:
-			sum4is[org] = tools.getSumFull(sumFileByOrg, org)
-		#if org in sum4is.keys() and len(sum4is[org]) > 0:
-		#	print(org, 'will be integrated into total summarization')
-	if len(sum4is) > 0:
-		tools.output4sumFull(sum4is, 'is.sum')
-
-	# summarize genome DNAs
-	sum4is4genome = {}
-	for org in file4orgs.keys():
-		sumFileByOrg = os.path.join(dir4prediction, org, 'organism4genome.sum')
-		if os.path.isfile(sumFileByOrg) and os.stat(sumFileByOrg).st_size > 0:
-			sum4is4genome[org] = tools.getSumFull(sumFileByOrg, org)
-		#if org in sum4is4genome.keys() and len(sum4is4genome[org]) > 0:
-		#	print(org, 'will be integrated into total summarization for genome DNAs')
-	if len(sum4is4genome) > 0:
-		tools.output4sumFull(sum4is4genome, 'is4genome.sum')
-
-	# summarize plasmid DNAs
-	sum4is4plasmid = {}
-	for org in file4orgs.keys():
-		sumFileByOrg = os.path.join(dir4prediction, org, 'organism4plasmid.sum')
-		if os.path.isfile(sumFileByOrg) and os.stat(sumFileByOrg).st_size > 0:
-			sum4is4plasmid[org] = tools.getSumFull(sumFileByOrg, org)
-		#if org in sum4is4plasmid.keys() and len(sum4is4plasmid[org]) > 0:
-		#	print(org, 'will be integrated into total summarization for plasmid DNAs')
-	if len(sum4is4plasmid) > 0:
-		tools.output4sumFull(sum4is4plasmid, 'is4plasmid.sum')
-
-	# summarize phage DNAs
-	sum4is4phage = {}
-	for org in file4orgs.keys():
-		sumFileByOrg = os.path.join(dir4prediction, org, 'organism4phage.sum')
-		if os.path.isfile(sumFileByOrg) and os.stat(sumFileByOrg).st_size > 0:
-			sum4is4phage[org] = tools.getSumFull(sumFileByOrg, org)
-		#if org in sum4is4phage.keys() and len(sum4is4phage[org]) > 0:
-		#	print(org, 'will be integrated into total summarization for phage DNAs')
-	if len(sum4is4phage) > 0:
-		tools.output4sumFull(sum4is4phage, 'is4phage.sum')
+	# prepare and write 'is.sum', 'is4genome.sum', 'is4plasmid.sum' and 'is4phage.sum' in current directory
+	cache = rdCache4sum(file4cache)
+	for sumfile4org, sumfile in (
+			('organism.sum', 'is.sum'),
+			# summarize genome DNAs
+			('organism4genome.sum', 'is4genome.sum'),
+			# summarize plasmid DNAs
+			('organism4plasmid.sum', 'is4plasmid.sum'),
+			# summarize phage DNAs
+			('organism4phage.sum', 'is4phage.sum')):
+		sum4is, key = rdSum4orgs(file4orgs.keys(), dir4prediction, sumfile4org, cache)
+		if len(sum4is) == 0:
+			continue
+		# totals are written again only if any organism changed
+		if os.path.isfile(sumfile) and cache['keys'].get(sumfile) == key:
+			continue
+		tools.output4sumFull(sum4is, sumfile)
+		cache['keys'][sumfile] = key
+	wrCache4sum(file4cache, cache)
 	print('Batch running finishes at', datetime.datetime.now().ctime())
 	
 if __name__ == "__main__":
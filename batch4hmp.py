@@ -2,25 +2,16 @@
 # -*- coding: utf-8 -*-
 
 import argparse
-import tempfile
-import subprocess
-import shlex
-import os
 import datetime
 
 import tools
+import batch4pred
 
 # To do IS element prediction before summarizing prediction if PREDICT = 1
 # To summarize prediction based on the previous prediction to save time if PREDICT = 0
 #PREDICT = 1
 PREDICT = 0
 
-python3 = '/usr/local/bin/python3'
-#cmd = '/u/zhiqxie/xie/is/isfinder/isPredict.py'
-#cmd = '/u/zhiqxie/xie/is/isfinder/pred.py'
-#cmd = 'isPredict.py'
-cmd = 'pred.py'
-
 def batch(args):
 	dnaListFile4orgs = args['fileList']
 	print('Batch running begins at', datetime.datetime.now().ctime())
@@ -45,21 +36,11 @@ def batch(args):
 		'''
 		dir2proteome4org = '/home/data/insertion_sequence/output4FragGeneScan1.19_illumina_5'
 		dir2hmmsearchResults = '/home/data/insertion_sequence/output4hmmsearch_illumina_5_cdhit30'
-		cmdargs = [python3, cmd, '', dir2proteome4org, dir2hmmsearchResults]
 		# summarize IS elements in each genome DNA and each organism 
-		for org in file4orgs.keys():
-			files = file4orgs[org]
-			fp = tempfile.NamedTemporaryFile(delete=False)
-			fp.write(('\n'.join(files)+'\n').encode())
-			fp.close()
-			cmdargs[2] = fp.name
-			cmdline = ' '.join(cmdargs)
-			callcmd = shlex.split(cmdline)
-			#subprocess.check_call(callcmd, shell=False, universal_newlines=False, stdout=subprocess.DEVNULL)
-			#subprocess.check_call(callcmd, shell=False, universal_newlines=False)
-			subprocess.check_output(callcmd, shell=False, universal_newlines=False, stderr=subprocess.STDOUT)
-			os.remove(fp.name)
-			print(org, 'was processed')
+		# pred.pred() is run for the organisms in a pool of worker processes, refer to batch4pred.py
+		failed = batch4pred.predOrgs(file4orgs, dir2proteome4org, dir2hmmsearchResults)
+		if len(failed) > 0:
+			print('Warning: no prediction for {} organisms: {}'.format(len(failed), ' '.join(failed)))
 
 	# get summarization of IS elements for each organism and write summarization 
 	# for all organisms into file 'is.sum'.
@@ -0,0 +1,373 @@
+# Run pred.pred() for the organisms in a batch, which is used by batch4bacteria.py and batch4hmp.py
+# instead of running pred.py in a new python process for each organism.
+#
+# The organisms are processed by a pool of nproc4batch worker processes, which are forked after
+# pred.py and the packages it requires (numpy, scipy and fastcluster) are imported, so the startup of
+# python is paid once for each worker instead of once for each organism. At most 2*nproc4batch
+# organisms are submitted to the pool at a time. The prediction of an organism is retried
+# retry4batch times if it fails, and the failure does not stop the other organisms.
+#
+# For the batch running on many computers, the organisms are put into a work queue in a directory
+# shared by the computers (constants.dir4queue), and each worker (python3 batch4pred.py work ...)
+# claims one organism at a time from the queue, refer to enqueue() and work(). The queue needs only
+# the atomic os.rename() of POSIX filesystem:
+#	dir4queue/todo/org: organism waiting to be processed
+#	dir4queue/claimed/org@worker: organism being processed by worker (hostname:pid), which is
+#		claimed by renaming todo/org to claimed/org@worker. The worker touches its claimed file
+#		every heartbeat4queue seconds, and the claimed file not touched in lease4queue seconds is
+#		put back to todo/org by another worker, e.g. when the computer running the worker is down.
+#		The worker having lost the claimed file stops processing the organism, and it neither
+#		moves nor puts back the file claimed again by another worker, whose name is different.
+#	dir4queue/done/org: organism processed
+#	dir4queue/failed/org: organism not processed after retry4batch retries
+# Each task file holds the organism and the number of tries in the first line and the DNA files
+# of organism in the following lines.
+
+import os
+import io
+import time
+import socket
+import argparse
+import signal
+import threading
+import tempfile
+import datetime
+import contextlib
+import traceback
+import collections
+import concurrent.futures
+
+import constants
+import tools
+import dnastore
+import pred
+
+
+# Run pred.pred() for one organism
+# args: (org, files, dir2proteome4org, dir2hmmsearchResults)
+# files: [file4fileid, ..., file4fileid], DNA files of organism
+# Return (org, error, log)
+# error: None if organism is processed, else the traceback of exception
+# log: lines printed by pred.pred()
+def pred4org(args):
+	org, files, dir2proteome4org, dir2hmmsearchResults = args
+	fp = tempfile.NamedTemporaryFile('w', suffix='.list', delete=False)
+	fp.write('\n'.join(files)+'\n')
+	fp.close()
+	args4pred = {
+			'dna_list': fp.name,
+			'path_to_proteome': dir2proteome4org,
+			'path_to_hmmsearch_results': dir2hmmsearchResults,
+			}
+	log = io.StringIO()
+	error = None
+	try:
+		with contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+			pred.pred(args4pred)
+	except Exception:
+		error = traceback.format_exc()
+	finally:
+		os.remove(fp.name)
+		# DNA stores of the organism are not used by the next organism in the same process
+		dnastore.stores.clear()
+		dnastore.revcomp4seq.cache_clear()
+	return (org, error, log.getvalue())
+
+# Run pred.pred() for each organism in file4orgs
+# file4orgs: {org: files, ..., org: files}
+# files: [file4fileid, ..., file4fileid]
+# Return failed: [org, ..., org], organisms which are not processed after retry4batch retries
+def predOrgs(file4orgs, dir2proteome4org, dir2hmmsearchResults, nproc=None):
+	if nproc is None:
+		nproc = constants.nproc4batch
+	nproc = min(nproc, len(file4orgs))
+	norg = len(file4orgs)
+	queue = collections.deque(file4orgs.keys())
+	ntries = dict.fromkeys(file4orgs.keys(), 0)
+	failed = []
+	# nprocessed: number of organisms processed successfully
+	nprocessed = 0
+
+	# Return True if org will be retried
+	def report(org, error, log):
+		nonlocal nprocessed
+		if error is None:
+			nprocessed += 1
+			print('{} was processed ({}/{}) at {}'.format(org, nprocessed, norg, datetime.datetime.now().ctime()))
+			return False
+		if ntries[org] <= constants.retry4batch:
+			print('Warning: failed to process {} and retry it, {}'.format(org, error.strip().splitlines()[-1]))
+			queue.append(org)
+			return True
+		failed.append(org)
+		print('Error: failed to process {} after {} tries'.format(org, ntries[org]))
+		print(log + error)
+		return False
+
+	if nproc < 2:
+		while len(queue) > 0:
+			org = queue.popleft()
+			ntries[org] += 1
+			report(*pred4org((org, file4orgs[org], dir2proteome4org, dir2hmmsearchResults)))
+		return failed
+
+	executor = concurrent.futures.ProcessPoolExecutor(max_workers = nproc)
+	# futures: {future: org, ...}, organisms submitted and not finished
+	futures = {}
+	# suspects: organisms running when a worker was killed, e.g. by out of memory, which are
+	# processed again one by one at last, so that the killed one does not fail the others
+	suspects = collections.deque()
+	while len(queue) > 0 or len(futures) > 0:
+		while len(queue) > 0 and len(futures) < 2 * nproc:
+			org = queue.popleft()
+			ntries[org] += 1
+			future = executor.submit(pred4org, (org, file4orgs[org], dir2proteome4org, dir2hmmsearchResults))
+			futures[future] = org
+		done, pending = concurrent.futures.wait(futures.keys(), return_when=concurrent.futures.FIRST_COMPLETED)
+		broken = False
+		for future in done:
+			org = futures.pop(future)
+			try:
+				report(*future.result())
+			except concurrent.futures.process.BrokenProcessPool:
+				broken = True
+				ntries[org] -= 1
+				suspects.append(org)
+		if broken == True:
+			# the pool is not usable after a worker was killed
+			executor.shutdown(wait=False, cancel_futures=True)
+			for future, org in futures.items():
+				ntries[org] -= 1
+				suspects.append(org)
+			futures = {}
+			executor = concurrent.futures.ProcessPoolExecutor(max_workers = nproc)
+	executor.shutdown()
+
+	while len(suspects) > 0:
+		org = suspects.popleft()
+		ntries[org] += 1
+		with concurrent.futures.ProcessPoolExecutor(max_workers = 1) as executor:
+			future = executor.submit(pred4org, (org, file4orgs[org], dir2proteome4org, dir2hmmsearchResults))
+			try:
+				result = future.result()
+			except concurrent.futures.process.BrokenProcessPool:
+				result = (org, 'BrokenProcessPool: worker process was killed\n', '')
+		if report(*result) == True:
+			# report() put org in queue to retry
+			suspects.append(queue.pop())
+	return failed
+
+
+states4queue = ('todo', 'claimed', 'done', 'failed')
+
+# Return (org, ntries, files) in task file
+def rdTask(file):
+	with open(file, 'r') as fp:
+		lines = fp.read().splitlines()
+	org, ntries = lines[0].split('\t')
+	return (org, int(ntries), lines[1:])
+
+def wrTask(file, org, ntries, files):
+	# the name beginning with '.' is not claimed by workers
+	tmpfile = os.path.join(os.path.dirname(file), '.{}.{}.{}.tmp'.format(os.path.basename(file),
+		socket.gethostname(), os.getpid()))
+	with open(tmpfile, 'w') as fp:
+		fp.write('\n'.join(['{}\t{}'.format(org, ntries)] + files) + '\n')
+	os.replace(tmpfile, file)
+
+# Put the organisms in file4orgs into work queue, where the organism already in queue is skipped
+# file4orgs: {org: files, ..., org: files}
+# files: [file4fileid, ..., file4fileid]
+def enqueue(file4orgs, dir4queue=None):
+	if dir4queue is None:
+		dir4queue = constants.dir4queue
+	for state in states4queue:
+		os.makedirs(os.path.join(dir4queue, state), exist_ok=True)
+	orgs = set()
+	for state in states4queue:
+		orgs.update(org4name(name) for name in os.listdir(os.path.join(dir4queue, state)) if name[0] != '.')
+	n = 0
+	for org, files in file4orgs.items():
+		if org in orgs:
+			continue
+		# the DNA files are located by workers running in other directories
+		wrTask(os.path.join(dir4queue, 'todo', org), org, 0, [os.path.abspath(file) for file in files])
+		n += 1
+	print(n, 'organisms were put into queue', dir4queue)
+
+# Return the number of organisms in each state of queue
+def status4queue(dir4queue=None):
+	if dir4queue is None:
+		dir4queue = constants.dir4queue
+	return {state: len([name for name in os.listdir(os.path.join(dir4queue, state)) if name[0] != '.'])
+			for state in states4queue}
+
+# Return org of the task file named name in queue, e.g. org for todo/org and claimed/org@worker
+def org4name(name):
+	return name.rsplit('@', maxsplit=1)[0]
+
+# Return name of the task file claimed/org@worker, or None if there is no organism to claim
+def claim(dir4queue, worker):
+	for org in sorted(os.listdir(os.path.join(dir4queue, 'todo'))):
+		if org[0] == '.':
+			continue
+		file = os.path.join(dir4queue, 'todo', org)
+		name = '{}@{}'.format(org, worker)
+		try:
+			# mtime of claimed file is the beginning of lease, and it is kept by rename
+			os.utime(file)
+			os.rename(file, os.path.join(dir4queue, 'claimed', name))
+		except FileNotFoundError:
+			# claimed by another worker
+			continue
+		return name
+	return None
+
+# Move task file claimed/name to todo/org (or to failed/org if the organism was tried retry4batch+1
+# times), where the task file is renamed at first so that only one worker moves it.
+# Return False if claimed/name was already moved by another worker.
+def release(dir4queue, name):
+	file = os.path.join(dir4queue, 'claimed', name)
+	tmpfile = os.path.join(dir4queue, 'claimed', '.{}.{}.{}'.format(name, socket.gethostname(), os.getpid()))
+	try:
+		os.rename(file, tmpfile)
+	except FileNotFoundError:
+		return False
+	org, ntries, files = rdTask(tmpfile)
+	ntries += 1
+	wrTask(tmpfile, org, ntries, files)
+	if ntries <= constants.retry4batch:
+		os.rename(tmpfile, os.path.join(dir4queue, 'todo', org))
+	else:
+		os.rename(tmpfile, os.path.join(dir4queue, 'failed', org))
+		print('Error: failed to process {} after {} tries'.format(org, ntries))
+	return True
+
+# Put back the organisms whose lease expired, return the number of organisms put back
+def reclaim(dir4queue):
+	n = 0
+	now = time.time()
+	for name in os.listdir(os.path.join(dir4queue, 'claimed')):
+		if name[0] == '.':
+			continue
+		try:
+			mtime = os.path.getmtime(os.path.join(dir4queue, 'claimed', name))
+		except FileNotFoundError:
+			continue
+		if now - mtime > constants.lease4queue and release(dir4queue, name) == True:
+			print('Warning: lease of {} expired and it was put back to queue'.format(name))
+			n += 1
+	return n
+
+# Touch claimed file every heartbeat4queue seconds until stop is set, lost is set if the claimed
+# file was put back to queue by another worker
+def heartbeat(file, stop, lost):
+	while not stop.wait(constants.heartbeat4queue):
+		try:
+			os.utime(file)
+		except FileNotFoundError:
+			print('Warning: lost the lease of', os.path.basename(file))
+			lost.set()
+			return
+
+# Terminate the process group of pid, refer to pred4orgOnLease()
+def killGroup4org(pid):
+	try:
+		os.killpg(pid, signal.SIGTERM)
+	except ProcessLookupError:
+		pass
+
+# Run pred4org(args) in a child process while the lease of the claimed file is kept by heartbeat(),
+# return the result of pred4org(), or None if the lease was lost before the organism was processed,
+# where the child process is terminated.
+#
+# The child process is the worker of ProcessPoolExecutor, which is not daemonic and may start the
+# processes of pred.pred(), e.g. pred.pred4seqsInParallel(). It leads its own process group, so that
+# it is terminated with its processes, and the tools they run are killed by tools.stopTools4signal().
+def pred4orgOnLease(args, file):
+	executor = concurrent.futures.ProcessPoolExecutor(max_workers = 1, initializer = os.setpgrp)
+	pid = executor.submit(os.getpid).result()
+	# heartbeat starts after the child process is forked
+	stop = threading.Event()
+	lost = threading.Event()
+	thread = threading.Thread(target=heartbeat, args=(file, stop, lost), daemon=True)
+	thread.start()
+	try:
+		future = executor.submit(pred4org, args)
+		while len(concurrent.futures.wait([future], timeout=1).done) == 0:
+			if lost.is_set():
+				killGroup4org(pid)
+				return None
+		return future.result()
+	except BaseException:
+		killGroup4org(pid)
+		raise
+	finally:
+		stop.set()
+		thread.join()
+		executor.shutdown(cancel_futures=True)
+
+# Claim and process the organisms in queue one by one until there is no organism in todo and claimed
+def work(dir2proteome4org, dir2hmmsearchResults, dir4queue=None):
+	if dir4queue is None:
+		dir4queue = constants.dir4queue
+	worker = '{}:{}'.format(socket.gethostname(), os.getpid())
+	nprocessed = 0
+	while True:
+		name = claim(dir4queue, worker)
+		if name is None:
+			if reclaim(dir4queue) > 0:
+				continue
+			if status4queue(dir4queue)['claimed'] == 0:
+				break
+			# wait for the organisms being processed by other workers, which may be put back
+			time.sleep(constants.heartbeat4queue)
+			continue
+		file = os.path.join(dir4queue, 'claimed', name)
+		org, ntries, files = rdTask(file)
+		result = pred4orgOnLease((org, files, dir2proteome4org, dir2hmmsearchResults), file)
+		if result is None:
+			print('Warning: {} was put back to queue by another worker and it was stopped by {}'.format(org, worker))
+			continue
+		org, error, log = result
+		if error is None:
+			try:
+				os.rename(file, os.path.join(dir4queue, 'done', org))
+			except FileNotFoundError:
+				# the organism claimed again by another worker is left to that worker
+				print('Warning: {} was put back to queue by another worker before it was processed'.format(org))
+				continue
+			nprocessed += 1
+			print('{} was processed by {} at {}'.format(org, worker, datetime.datetime.now().ctime()))
+		else:
+			print('Warning: failed to process {} by {}, {}'.format(org, worker, error.strip().splitlines()[-1]))
+			print(log + error)
+			if release(dir4queue, name) == False:
+				print('Warning: {} was put back to queue by another worker before it failed'.format(org))
+	print('Worker {} processed {} organisms, queue: {}'.format(worker, nprocessed, status4queue(dir4queue)))
+
+
+if __name__ == "__main__":
+	descriptionStr = 'Run IS prediction for organisms in a work queue shared by workers on many computers. A typical invocation would be: python3 batch4pred.py enqueue bacteria.fna.list on one computer and then python3 batch4pred.py work proteome hmm on each computer'
+	parser = argparse.ArgumentParser(description = descriptionStr)
+	helpStr = 'enqueue: put organisms in fileList into queue; work: process organisms in queue; status: count organisms in queue'
+	parser.add_argument('action', choices = ['enqueue', 'work', 'status'], help = helpStr)
+	helpStr = 'input file containing DNA sequence files for enqueue, one file per line, or directory holding files produced by FragGeneScan for work'
+	parser.add_argument('input', nargs = '?', help = helpStr)
+	helpStr = 'directory holding files produced by hmmsearch for work'
+	parser.add_argument('path_to_hmmsearch_results', nargs = '?', help = helpStr)
+	helpStr = 'directory of work queue shared by workers, default: constants.dir4queue'
+	parser.add_argument('--queue', default = constants.dir4queue, help = helpStr)
+	args = parser.parse_args()
+
+	if args.action == 'enqueue':
+		file4orgs = {}
+		for file, org in tools.rdDNAlist(args.input):
+			if org not in file4orgs.keys():
+				file4orgs[org] = []
+			file4orgs[org].append(file)
+		enqueue(file4orgs, args.queue)
+	elif args.action == 'work':
+		work(args.input, args.path_to_hmmsearch_results, args.queue)
+	else:
+		print(status4queue(args.queue))
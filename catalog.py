@@ -0,0 +1,182 @@
+# SQLite catalog of IS elements predicted by pred.py and the DNA sequences where they are searched.
+#
+# Catalog consists of two tables:
+#	sequence: one row for each DNA sequence in the DNA files processed by pred.pred(),
+#		org fileid seqid dnaLen dnaType
+#		dnaType: 0, 1 or 2 to represent phage or plasmid or genome DNA, refer to tools.dnaType4header()
+#	prediction: one row for each IS element, same as the line in .out file written by pred.py,
+#		org fileid seqid family cluster isBegin isEnd len4is ncopy4is start1 end1 start2 end2
+#		score irId irLen nGaps orfBegin orfEnd strand len4orf evalue ov
+#
+# Each run of pred.pred() replaces all rows of its DNA files, so that the summaries written by
+# tools.sum4org() and batch4bacteria.py can be computed by SQL aggregation on catalog instead of
+# reading the DNA sequences and .sum files of all organisms again.
+
+import os
+import sqlite3
+
+import constants
+import tools
+
+
+schema = [
+	'''CREATE TABLE IF NOT EXISTS sequence (
+		org TEXT NOT NULL, fileid TEXT NOT NULL, seqid TEXT NOT NULL,
+		dnaLen INTEGER NOT NULL, dnaType INTEGER NOT NULL,
+		PRIMARY KEY (org, fileid, seqid))''',
+	'''CREATE TABLE IF NOT EXISTS prediction (
+		org TEXT NOT NULL, fileid TEXT NOT NULL, seqid TEXT NOT NULL,
+		family TEXT NOT NULL, cluster TEXT NOT NULL,
+		isBegin INTEGER, isEnd INTEGER, len4is INTEGER, ncopy4is INTEGER,
+		start1 INTEGER, end1 INTEGER, start2 INTEGER, end2 INTEGER,
+		score INTEGER, irId INTEGER, irLen INTEGER, nGaps INTEGER,
+		orfBegin INTEGER, orfEnd INTEGER, strand TEXT, len4orf INTEGER,
+		evalue REAL, ov INTEGER)''',
+	'CREATE INDEX IF NOT EXISTS prediction4org ON prediction (org, fileid)',
+	'CREATE INDEX IF NOT EXISTS prediction4seqid ON prediction (seqid)',
+	'CREATE INDEX IF NOT EXISTS prediction4family ON prediction (family)',
+	'CREATE INDEX IF NOT EXISTS sequence4seqid ON sequence (seqid)',
+	# number of IS elements and bps covered by IS elements in each DNA sequence
+	'''CREATE VIEW IF NOT EXISTS sum4seq AS
+		SELECT s.org, s.fileid, s.seqid, s.dnaLen, s.dnaType,
+			COUNT(p.seqid) AS nis, COALESCE(SUM(p.len4is), 0) AS bps4is
+		FROM sequence AS s LEFT JOIN prediction AS p USING (org, fileid, seqid)
+		GROUP BY s.org, s.fileid, s.seqid''',
+	]
+
+# Return connection to catalog, the tables are created if they do not exist
+def connect(file=None):
+	if file is None:
+		file = constants.file4catalog
+	dir = os.path.dirname(file)
+	if dir != '':
+		tools.makedir(dir)
+	conn = sqlite3.connect(file, timeout=constants.timeout4catalog)
+	with conn:
+		for sql in schema:
+			conn.execute(sql)
+	return conn
+
+# Replace the rows of DNA files in catalog with the sequences in mDNA and the predictions in mhits
+#
+# mDNA:	{seqid: (org, fileid, sequence), ..., seqid: (org, fileid, sequence)}
+# mhits: {seqid: hits, ..., seqid: hits}, refer to pred.outputIndividual()
+# dnaTypes: {seqid: dnaType, ..., seqid: dnaType}
+def addPredictions(mDNA, mhits, dnaTypes, file=None):
+	conn = connect(file)
+	orgfiles = sorted(set((org, fileid) for org, fileid, seq in mDNA.values()))
+	rows4seq = []
+	for seqid in sorted(mDNA.keys()):
+		org, fileid, seq = mDNA[seqid]
+		rows4seq.append((org, fileid, seqid, len(seq), dnaTypes[seqid]))
+	rows4is = rows4predictions(mDNA, mhits)
+	# one transaction, the other processes see either the old or the new rows of DNA files
+	with conn:
+		conn.executemany('DELETE FROM sequence WHERE org = ? AND fileid = ?', orgfiles)
+		conn.executemany('DELETE FROM prediction WHERE org = ? AND fileid = ?', orgfiles)
+		conn.executemany('INSERT INTO sequence VALUES (?, ?, ?, ?, ?)', rows4seq)
+		conn.executemany('INSERT INTO prediction VALUES ({})'.format(', '.join(['?'] * 23)), rows4is)
+	conn.close()
+
+# Add the predictions in mhits to catalog, where the rows of sequences in mDNA have been written by
+# addPredictions(), e.g. by pred.pred4chunks() for each chunk of sequences
+def appendPredictions(mDNA, mhits, file=None):
+	conn = connect(file)
+	rows4is = rows4predictions(mDNA, mhits)
+	with conn:
+		conn.executemany('INSERT INTO prediction VALUES ({})'.format(', '.join(['?'] * 23)), rows4is)
+	conn.close()
+
+# Return rows4is, the rows of table prediction for the predictions in mhits
+# rows4is: [row, ..., row], row: (org, fileid, seqid, family, cluster, isBegin, ..., evalue, ov)
+def rows4predictions(mDNA, mhits):
+	rows4is = []
+	for seqid in sorted(mhits.keys()):
+		org, fileid, seq = mDNA[seqid]
+		for hit in sorted(mhits[seqid], key = lambda x: x.bd[0]):
+			orfBegin, orfEnd, strand = hit.orf[1:]
+			cluster, best1domE, fullSeqE, ov, = hit.hmmhit
+			family = tools.familyInfo(cluster).family
+			if len(hit.tirs) > 0:
+				score, irId, irLen, nGaps, start1, end1, start2, end2, seq1, seq2 = hit.tirs[0]
+			else:
+				score, irId, irLen, nGaps, start1, end1, start2, end2 = (0, 0, 0, 0, 0, 0, 0, 0)
+			isBegin, isEnd = hit.bd
+			rows4is.append((org, fileid, seqid, family, cluster,
+				isBegin, isEnd, isEnd - isBegin + 1, hit.ncopy4is,
+				start1, end1, start2, end2,
+				score, irId, irLen, nGaps,
+				orfBegin, orfEnd, strand, orfEnd - orfBegin + 1,
+				best1domE, ov))
+	return rows4is
+
+# Return sum4is, summarization of IS elements in DNA files of file4orgs, in the format returned
+# by tools.getSumFull() and written by tools.output4sumFull()
+#
+# file4orgs: {org: files, ..., org: files}
+# files: [file4fileid, ..., file4fileid]
+# dnaType: None for all DNA sequences, or 0, 1 or 2 for only phage or plasmid or genome DNA
+#	sequences, same as organism.sum, organism4phage.sum, organism4plasmid.sum and
+#	organism4genome.sum written by tools.sum4org(), where the numbers of DNA sequences
+#	(ngenome, nplasmid and nphage) are counted for all DNA sequences
+# bySeq: False to summarize each organism, sum4is: {org: sum4org, ..., org: sum4org}
+#	True to summarize each DNA sequence, sum4is: {org: sum4seqs, ..., org: sum4seqs}
+#	sum4seqs: {seqid: sum4seq, ..., seqid: sum4seq}
+# sum4org, sum4seq: [nis, %genome, bps4is, dnaLen4is, familySum,
+#		dnaLen, ngenome4is, ngenome, nplasmid4is, nplasmid, nphage4is, nphage]
+# familySum: {family: [nis, %genome, bps4is], ..., family: [nis, %genome, bps4is]}
+def summarize(file4orgs, dnaType=None, bySeq=False, file=None):
+	conn = connect(file)
+	conn.execute('CREATE TEMP TABLE file4sum (org TEXT, fileid TEXT, PRIMARY KEY (org, fileid))')
+	conn.executemany('INSERT OR IGNORE INTO file4sum VALUES (?, ?)',
+			[(org, os.path.basename(file4fileid)) for org, files in file4orgs.items() for file4fileid in files])
+	if bySeq == True:
+		keys = 'org, seqid'
+	else:
+		keys = 'org'
+	# selected: 1 if the sequence is summarized, else 0
+	selected = '(:dnaType IS NULL OR dnaType = :dnaType)'
+	sql = '''SELECT {keys},
+			SUM(nis * selected), SUM(bps4is * selected),
+			SUM(dnaLen * selected * (nis > 0)), SUM(dnaLen * selected),
+			SUM(dnaType = 2 AND nis > 0 AND selected), SUM(dnaType = 2),
+			SUM(dnaType = 1 AND nis > 0 AND selected), SUM(dnaType = 1),
+			SUM(dnaType = 0 AND nis > 0 AND selected), SUM(dnaType = 0)
+		FROM (SELECT *, {selected} AS selected FROM sum4seq JOIN file4sum USING (org, fileid))
+		GROUP BY {keys}'''.format(keys=keys, selected=selected)
+	sql4family = '''SELECT {keys}, family, COUNT(*), SUM(len4is)
+		FROM prediction JOIN sequence USING (org, fileid, seqid) JOIN file4sum USING (org, fileid)
+		WHERE {selected}
+		GROUP BY {keys}, family'''.format(keys=keys, selected=selected)
+	sum4is = {}
+	# dnaLen4is: {key: dnaLen4is, ..., key: dnaLen4is}
+	dnaLen4is = {}
+	for row in conn.execute(sql, {'dnaType': dnaType}):
+		if bySeq == True:
+			key, values = row[:2], row[2:]
+		else:
+			key, values = row[0], row[1:]
+		nis, bps4is, dnaLen4is[key], dnaLen = values[:4]
+		# same as %genome in the total line written by tools.output4sumFull()
+		if dnaLen4is[key] == 0:
+			percent = 0
+		else:
+			percent = (bps4is/dnaLen)*100
+		sum4is[key] = [nis, percent, bps4is, dnaLen4is[key], {}, dnaLen] + list(values[4:])
+	for row in conn.execute(sql4family, {'dnaType': dnaType}):
+		if bySeq == True:
+			key, values = row[:2], row[2:]
+		else:
+			key, values = row[0], row[1:]
+		family, nis, bps4is = values
+		sum4is[key][4][family] = [nis, (bps4is/dnaLen4is[key])*100, bps4is]
+	conn.close()
+
+	if bySeq == True:
+		sum4seqs = {}
+		for (org, seqid), sum4seq in sum4is.items():
+			if org not in sum4seqs.keys():
+				sum4seqs[org] = {}
+			sum4seqs[org][seqid] = sum4seq
+		sum4is = sum4seqs
+	return sum4is
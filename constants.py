@@ -13,6 +13,9 @@ hmmsearch = '/u/zhiqxie/informatics/inst/hmmer-3.1b2/bin/hmmsearch'
 # Blast 
 blastn = '/l/ncbi-blast/bin/blastn'
 makeblastdb = '/l/ncbi-blast/bin/makeblastdb'
+# Optional multithreaded compressors, refer to compression4output
+pigz = 'pigz'
+bgzip = 'bgzip'
 '''
 FragGeneScan = '/N/u/zhiqxie/Mason/informatics/inst/FragGeneScan1.19/run_FragGeneScan.pl'
 phmmer = '/N/u/zhiqxie/Mason/informatics/inst/hmmer-3.1b2/bin/phmmer'
@@ -43,6 +46,23 @@ translateGenome = True
 # from ncbi genome database, and the corresponding .fna and .ptt files in the same folder
 # are required to map proteins to genome locations.
 #translateGenome = False
+# When filter4contig is True and removeShortIS is True, the DNA sequences shorter than the minimal
+# length of IS element in all families, which can never hold a full-length IS element, are not
+# translated by FragGeneScan, refer to isPredict.filterContigs()
+filter4contig = True
+
+# Compression of the files written by ISEScan, '' (no compression), 'gz', 'bgzf' or 'zst'.
+# 'gz' and 'bgzf' files are compressed by pigz and bgzip, respectively, in nthread threads if they
+# are available, otherwise by python gzip module. 'zst' requires python package zstandard.
+# Compressed input files (DNA sequence, proteome and HMM hits) are always read whatever the
+# settings are.
+#
+# compression4output: prediction files, .out, .gff, .is.fna, .orf.fna and .orf.faa
+compression4output = ''
+# compression4intermediate: HMM hits files and the .ffn, .out and .gff files of FragGeneScan
+compression4intermediate = ''
+# compression level, 1 (fastest) to 9 (best compression) for gzip, 1 to 19 for zstd
+level4compression = 6
 
 # set temporary directory used by ISEScan
 #tmpdir = 'tmpdir'
@@ -64,6 +84,42 @@ file4clusterHMM = 'clusters.faa.hmm'
 # blast database will be put here
 dir4blastout = os.path.join(path2results, 'blastout')
 
+# 2-bit packed DNA sequences (refer to dnastore.py) will be put here
+dir4dnastore = os.path.join(path2results, 'dnastore')
+
+# Checkpoints of the stages in pred.pred() will be put here, refer to tools.saveCheckpoint().
+# Each checkpoint is keyed by the fingerprint of the input of stage and the settings in constants,
+# so a rerun of pred.pred() resumes from the last stage completed with the same input and settings.
+dir4checkpoint = os.path.join(path2results, 'checkpoint')
+# When checkpoint4pred is True, checkpoints are written and reused by pred.pred()
+checkpoint4pred = False
+
+# SQLite catalog of the predictions and DNA sequences, refer to catalog.py.
+# When catalog4pred is True, each run of pred.pred() replaces the records of its DNA files in
+# catalog, and batch4bacteria.py summarizes predictions by SQL queries on catalog instead of
+# reading the .sum file of each DNA sequence.
+file4catalog = os.path.join(path2results, 'catalog.sqlite')
+catalog4pred = False
+# seconds to wait for the lock of catalog held by another process
+timeout4catalog = 600
+
+# Timeouts of the external programs, refer to tools.callTool().
+# timeout4tool: {tool: (seconds, seconds4MB), ...}, a run of tool is killed together with its child
+#	processes if it runs longer than seconds + seconds4MB * size of input in MB, where input is DNA
+#	sequence file for FragGeneScan, proteome file for hmmsearch and phmmer, and query and subject
+#	sequences for blastn
+# retry4tool: number of times to run the tool again after it is killed
+# file4timeout: the runs killed for timeout are recorded here, one line for each run:
+#	time tool input timeout ntry
+timeout4tool = {
+		'FragGeneScan': (3600, 600),
+		'hmmsearch': (3600, 600),
+		'phmmer': (3600, 600),
+		'blastn': (1800, 300),
+		}
+retry4tool = 1
+file4timeout = os.path.join(path2results, 'timeout.log')
+
 # Optimal values for SSW to find TIR in ISfinder database
 # (gapopen, gapextend, match, mismatch)
 #
@@ -276,6 +332,10 @@ evalue2filterHMMhits = min4evalue
 # width of line in fasta file created by us
 fastaLineWidth = 60
 
+# number of lines of blastn output parsed at a time while blastn output is streamed to 
+# pred.py, which bounds the memory used by the raw text output of blastn
+nline4blastout = 100000
+
 # complementary table for DNA
 #------------------------------------------
 # Code	Represents		Complement
@@ -343,3 +403,55 @@ nproc = 16
 # default number of threads to use in calculation if it is not given
 #nthread = 2
 nthread = 16
+# number of processes used by pred.pred() to identify IS elements after HMM hits are grouped by
+# DNA sequence, each process handles a partition of the DNA sequences; all sequences are processed
+# in the current process if nproc4pred < 2
+nproc4pred = 1
+# maximal memory (MB) used by pred.pred() to identify IS elements in a chunk of DNA sequences, where
+# the sequences are processed chunk by chunk and the predictions are appended to the output files
+# if mem4pred > 0, else all sequences are processed at once, refer to pred.pred4chunks().
+# mem4orfhit is the estimated memory (bytes) used for each ORF hit in a chunk.
+# Note: mem4pred does not bound the memory used before the first chunk, which grows with the number
+# of sequences, i.e. the ORF hits of all sequences (refer to pred.hmmHits2orfHits()) and the index
+# of all proteomes (refer to pred.getProteomes()), which holds the proteins of a compressed proteome.
+mem4pred = 0
+mem4orfhit = 1 << 16
+# DNA sequences shorter than size4bucket bps, e.g. contigs in metagenome assembly, are packed into
+# buckets of about size4bucket bps in total, and the copies of Tpase ORFs in all sequences of a bucket
+# are searched by one blastn process, refer to pred.getCopies4orfHits()
+size4bucket = 1000000
+# number of worker processes used by batch4bacteria.py and batch4hmp.py to run pred.pred() for
+# organisms, refer to batch4pred.py, and the number of retries for the organism whose prediction fails
+nproc4batch = 4
+retry4batch = 1
+# work queue of organisms shared by the workers running on many computers, refer to batch4pred.py.
+# A worker touches the organism it is processing every heartbeat4queue seconds, and the organism
+# not touched in lease4queue seconds is put back to queue by another worker.
+dir4queue = os.path.join(path2results, 'queue')
+heartbeat4queue = 60
+lease4queue = 600
+
+# settings used by each stage of pred.pred() whose result is saved in checkpoint, refer to pred.pred4seqs().
+# The fingerprint of a stage includes only the settings used by it and the fingerprint of its input, so
+# that only the stages using the changed settings and the stages after them are done again, e.g. the
+# copies of Tpase ORFs found by blastn are reused when filters4ssw4trial is changed. The settings
+# neither listed here nor in ignored4checkpoint are included in the fingerprints of all stages.
+constants4stage = {
+		'hits': ['evalue2filterHMMhits'],
+		'merge': ['maxDistBetweenOrfs'],
+		'copy': ['SIM4ISO', 'blastn', 'minMaxLen4is', 'minMax4tpase', 'minMax4tir', 'fastaLineWidth'],
+		'near': ['filters4ssw4trial', 'outerDist4ter2tpase', 'minDist4ter2orf', 'splitAlign2orf', 'useOPTtir',
+			'minMaxLen4is', 'minMax4tpase', 'minMax4tir'],
+		'far': ['filters4ssw4trial', 'outerDist4ter2tpase', 'minDist4ter2orf', 'splitAlign2orf', 'useOPTtir',
+			'minMaxLen4is', 'minMax4tpase', 'minMax4tir'],
+		'refine': ['removeShortIS', 'min4evalue', 'evalue4singleCopy', 'irSim4singleCopy', 'overlap2removeRedundancy',
+			'intersected2remove', 'min4intersect', 'minMaxLen4is', 'minMax4tpase', 'minMax4tir'],
+		}
+
+# settings which do not change the predictions and are excluded from the fingerprint of checkpoints
+ignored4checkpoint = {'nproc', 'nthread', 'nproc4pred', 'nline4blastout', 'checkpoint4pred', 'ignored4checkpoint',
+		'file4catalog', 'catalog4pred', 'timeout4catalog', 'nproc4batch', 'retry4batch',
+		'dir4queue', 'heartbeat4queue', 'lease4queue', 'size4bucket',
+		'mem4pred', 'mem4orfhit', 'constants4stage', 'timeout4tool', 'retry4tool', 'file4timeout',
+		'compression4output', 'compression4intermediate', 'level4compression', 'pigz', 'bgzip',
+		'path2results', 'dir4prediction', 'dir4blastout', 'dir4dnastore', 'dir4checkpoint'}
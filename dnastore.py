@@ -0,0 +1,239 @@
+# Memory-mapped store of DNA sequences, where each base is packed into 2 bits.
+#
+# A store is built once for each input FASTA file and consists of two files:
+#	<store>: binary file holding, for each sequence, the packed bases followed by the exception runs
+#		and the lowercase runs
+#	<store>.idx: text index, one line for each sequence:
+#		seqid length offset4bases offset4exceptions nexceptions offset4lowercases nlowercases
+#
+# Bases A/C/G/T (case-insensitive) are coded as 0/1/2/3 and packed 4 bases per byte. Any other
+# character, e.g. N or other ambiguity code, is kept in an exception run (start, end, char) of
+# identical characters, and lowercase letters are kept in lowercase runs (start, end), so the
+# sequence read from store is exactly the same as the sequence read by tools.getFasta().
+# start and end are 0-based and end is excluded, like the slicing of python string.
+
+import os
+import mmap
+import functools
+import numpy
+
+import constants
+import tools
+
+
+codes4base = numpy.full(256, 255, dtype=numpy.uint8)
+for i, base in enumerate(b'ACGT'):
+	codes4base[base] = i
+	codes4base[base + 32] = i
+bases4code = numpy.frombuffer(b'ACGT', dtype=numpy.uint8)
+# unpack4byte[b]: 4 codes packed in byte b
+unpack4byte = numpy.array([[(b >> 6) & 3, (b >> 4) & 3, (b >> 2) & 3, b & 3] for b in range(256)],
+		dtype=numpy.uint8)
+exceptDtype = [('start', numpy.int64), ('end', numpy.int64), ('char', numpy.uint8)]
+lowerDtype = [('start', numpy.int64), ('end', numpy.int64)]
+
+# number of bases converted at a time when a store is built, it must be the multiple of 4.
+block4build = 1 << 22
+
+
+# Return runs: [(start, end, value), ..., (start, end, value)], runs of identical values in mask
+# positions where mask is False are not included, offset is added to start and end.
+def mask2runs(mask, values, offset):
+	idx = numpy.flatnonzero(mask)
+	if len(idx) == 0:
+		return []
+	# a run breaks where positions are not consecutive or values change
+	breaks = numpy.flatnonzero((numpy.diff(idx) != 1) | (numpy.diff(values[idx].astype(numpy.int64)) != 0)) + 1
+	starts = numpy.concatenate(([0], breaks))
+	ends = numpy.concatenate((breaks, [len(idx)]))
+	return [(int(idx[s]) + offset, int(idx[e-1]) + 1 + offset, int(values[idx[s]])) for s, e in zip(starts, ends)]
+
+# append runs to allRuns and merge the first run with the last run in allRuns if they are adjacent
+def extendRuns(allRuns, runs):
+	if len(runs) == 0:
+		return
+	if len(allRuns) > 0 and allRuns[-1][1] == runs[0][0] and allRuns[-1][2] == runs[0][2]:
+		allRuns[-1] = (allRuns[-1][0], runs[0][1], runs[0][2])
+		runs = runs[1:]
+	allRuns.extend(runs)
+
+class SeqWriter(object):
+	def __init__(self, fp, seqid):
+		self.fp = fp
+		self.seqid = seqid
+		self.offset = fp.tell()
+		self.length = 0
+		self.rest = numpy.empty(0, dtype=numpy.uint8)
+		self.exceptions = []
+		self.lowercases = []
+
+	# seq: bytes, a block of sequence
+	def write(self, seq):
+		chars = numpy.frombuffer(seq, dtype=numpy.uint8)
+		codes = codes4base[chars]
+		# lowercase letters, a-z
+		lower = (chars >= 97) & (chars <= 122)
+		extendRuns(self.exceptions, mask2runs(codes == 255, numpy.where(lower, chars - 32, chars), self.length))
+		extendRuns(self.lowercases, mask2runs(lower, numpy.zeros(len(chars), dtype=numpy.uint8), self.length))
+		self.length += len(chars)
+		codes[codes == 255] = 0
+		codes = numpy.concatenate((self.rest, codes))
+		n = len(codes) - len(codes) % 4
+		self.pack(codes[:n])
+		self.rest = codes[n:]
+
+	def pack(self, codes):
+		codes = codes.reshape(-1, 4)
+		packed = (codes[:, 0] << 6) | (codes[:, 1] << 4) | (codes[:, 2] << 2) | codes[:, 3]
+		self.fp.write(packed.astype(numpy.uint8).tobytes())
+
+	# Return index line of the sequence
+	def close(self):
+		if len(self.rest) > 0:
+			self.pack(numpy.concatenate((self.rest, numpy.zeros(4 - len(self.rest), dtype=numpy.uint8))))
+		offset4except = self.fp.tell()
+		self.fp.write(numpy.array(self.exceptions, dtype=exceptDtype).tobytes())
+		offset4lower = self.fp.tell()
+		self.fp.write(numpy.array([run[:2] for run in self.lowercases], dtype=lowerDtype).tobytes())
+		return '\t'.join(str(x) for x in (self.seqid, self.length, self.offset,
+			offset4except, len(self.exceptions), offset4lower, len(self.lowercases)))
+
+# Build store from a FASTA file read by tools.iterFasta(), sequence ID is the first word in header
+# and the records without sequence are dropped, same as tools.getFasta().
+def build(fastaFile, store):
+	os.makedirs(os.path.dirname(store), exist_ok=True)
+	tmpfile = '{}.{}.tmp'.format(store, os.getpid())
+	index = []
+	with open(tmpfile, 'wb') as fp:
+		for header, seq in tools.iterFasta(fastaFile):
+			if len(seq) == 0:
+				continue
+			writer = SeqWriter(fp, tools.id4header(header))
+			for i in range(0, len(seq), block4build):
+				writer.write(seq[i: i+block4build].encode('latin-1'))
+			index.append(writer.close())
+	with open(tmpfile + '.idx', 'w') as fp:
+		for line in index:
+			fp.write(line + '\n')
+	os.replace(tmpfile, store)
+	os.replace(tmpfile + '.idx', store + '.idx')
+
+
+class DNAStore(object):
+	def __init__(self, store):
+		self.store = store
+		# index: {seqid: (length, offset4bases, exceptions, lowercases), ...}
+		self.index = {}
+		self.seqids = []
+		with open(store + '.idx', 'r') as fp:
+			lines = [line.split('\t') for line in fp.read().splitlines()]
+		if os.path.getsize(store) > 0:
+			with open(store, 'rb') as fp:
+				self.data = numpy.frombuffer(mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ),
+						dtype=numpy.uint8)
+		else:
+			self.data = numpy.empty(0, dtype=numpy.uint8)
+		for items in lines:
+			seqid = items[0]
+			length, offset, offset4except, nexcept, offset4lower, nlower = [int(x) for x in items[1:]]
+			exceptions = numpy.frombuffer(self.data, dtype=exceptDtype, count=nexcept, offset=offset4except)
+			lowercases = numpy.frombuffer(self.data, dtype=lowerDtype, count=nlower, offset=offset4lower)
+			if seqid not in self.index:
+				self.seqids.append(seqid)
+			self.index[seqid] = (length, offset, exceptions, lowercases)
+
+	def __len__(self):
+		return len(self.seqids)
+
+	def __contains__(self, seqid):
+		return seqid in self.index
+
+	def __getitem__(self, seqid):
+		return PackedSeq(self, seqid)
+
+	# the store is opened again instead of being copied when it is sent to another process
+	def __reduce__(self):
+		return (openStore, (self.store,))
+
+	# Return bases from start to end (excluded) in sequence seqid, 0 <= start <= end <= length
+	def fetch(self, seqid, start, end):
+		length, offset, exceptions, lowercases = self.index[seqid]
+		if start >= end:
+			return ''
+		packed = self.data[offset + start // 4: offset + (end - 1) // 4 + 1]
+		shift = start % 4
+		chars = bases4code[unpack4byte[packed].ravel()[shift: shift + end - start]]
+		for runs, lower in ((exceptions, False), (lowercases, True)):
+			if len(runs) == 0:
+				continue
+			# runs overlapped with [start, end)
+			first = numpy.searchsorted(runs['end'], start, side='right')
+			last = numpy.searchsorted(runs['start'], end, side='left')
+			for run in runs[first:last]:
+				s = max(int(run['start']), start) - start
+				e = min(int(run['end']), end) - start
+				if lower:
+					chars[s:e] |= 0x20
+				else:
+					chars[s:e] = run['char']
+		return chars.tobytes().decode('latin-1')
+
+
+# View of one sequence in store, which can be used like a python string in len() and slicing
+# seq[begin:end], where a new string is returned by slicing.
+class PackedSeq(object):
+	__slots__ = ('store', 'seqid', 'length')
+
+	def __init__(self, store, seqid):
+		self.store = store
+		self.seqid = seqid
+		self.length = store.index[seqid][0]
+
+	def __len__(self):
+		return self.length
+
+	def __getitem__(self, key):
+		if isinstance(key, slice):
+			start, end, step = key.indices(self.length)
+			if step != 1:
+				return self.store.fetch(self.seqid, 0, self.length)[key]
+			return self.store.fetch(self.seqid, start, max(start, end))
+		if key < 0:
+			key += self.length
+		if not 0 <= key < self.length:
+			raise IndexError('sequence index out of range')
+		return self.store.fetch(self.seqid, key, key+1)
+
+	def __reduce__(self):
+		return (PackedSeq, (self.store, self.seqid))
+
+	# Return the reverse complement of seq[start:end], same as
+	# tools.complementDNA(seq[start:end], '1')[::-1]
+	def revcomp(self, start, end):
+		return revcomp4seq(self, start, end)
+
+complement4na1u = str.maketrans(constants.na1u, constants.na2u)
+
+# the reverse complement of the same region is often asked for more than once, e.g. by the
+# searches of TIR in the near and far regions of Tpase ORF and by the writers of .is.fna
+@functools.lru_cache(maxsize=1024)
+def revcomp4seq(seq, start, end):
+	return seq[start:end].translate(complement4na1u)[::-1]
+
+
+# stores: {store: DNAStore, ...}, stores opened in current process
+stores = {}
+
+def openStore(store):
+	if store not in stores:
+		stores[store] = DNAStore(store)
+	return stores[store]
+
+# Return the store of fastaFile, constants.dir4dnastore/org/fileid.2bit, the store is built only if it does not exist or is older than fastaFile
+def getStore(fastaFile, org, fileid):
+	store = os.path.join(constants.dir4dnastore, org, fileid + '.2bit')
+	if (not os.path.isfile(store + '.idx') or not os.path.isfile(store) or
+			os.path.getmtime(store + '.idx') < os.path.getmtime(fastaFile)):
+		stores.pop(store, None)
+		build(fastaFile, store)
+	return openStore(store)
@@ -8,11 +8,13 @@ import sys
 import datetime
 import operator
 import concurrent.futures
+import numpy
 
 import constants
 import tools
 import is_analysis
 import pred
+import metrics
 
 
 def genome2proteome(args2concurrent):
@@ -32,7 +34,9 @@ def genome2proteome(args2concurrent):
 	else:
 		nthread = constants.nthread
 	with concurrent.futures.ThreadPoolExecutor(max_workers = nthread) as executor:
-		for arg, outs in zip(args2concurrent, executor.map(is_analysis.translate_genome_dna_v3, args2concurrent)):
+		# the largest genome is translated first, refer to tools.mapLPT()
+		for arg, outs in zip(args2concurrent, tools.mapLPT(executor, is_analysis.translate_genome_dna_v3,
+				args2concurrent, lambda arg: os.path.getsize(arg[0]))):
 			dna_file = arg[0]
 			if outs == 0:
 				print('Translating genome into proteome for', dna_file, ', return ', outs)
@@ -60,8 +64,13 @@ def prepare4phmmer(clusterSeqFile4phmmer, proteome_files, path_to_hmmsearch_resu
 		fileName = '.'.join([query, os.path.basename(faaFileName)])
 		output_file = os.path.join(path_to_hmmsearch_results, org, fileName)
 		callhmmer = False
+		# output_file is compressed only after hmmer finishes, refer to compression4intermediate
+		compressed = tools.compressedFile(output_file)
 		if update == True:
 			callhmmer = True
+		elif compressed is not None:
+			callhmmer = False
+			output_file = compressed
 		elif os.path.isfile(output_file) and os.stat(output_file).st_size > 0:
 			fp = open(output_file, 'r')
 			fp.seek(fp.seek(0,2)-len('# [ok]\n'))
@@ -74,6 +83,8 @@ def prepare4phmmer(clusterSeqFile4phmmer, proteome_files, path_to_hmmsearch_resu
 			callhmmer = True
 
 		if callhmmer == True:
+			if compressed is not None:
+				os.remove(compressed)
 			args2concurrent.append((clusterSeqFile4phmmer, faaFileName, output_file))
 			tools.makedir(os.path.dirname(output_file))
 		else:
@@ -96,8 +107,13 @@ def prepare4hmmsearch(hmms_file, proteome_files, path_to_hmmsearch_results):
 		fileName = '.'.join([query, os.path.basename(faaFileName)])
 		output_file = os.path.join(path_to_hmmsearch_results, org, fileName)
 		callhmmer = False
+		# output_file is compressed only after hmmer finishes, refer to compression4intermediate
+		compressed = tools.compressedFile(output_file)
 		if update == True:
 			callhmmer = True
+		elif compressed is not None:
+			callhmmer = False
+			output_file = compressed
 		elif os.path.isfile(output_file) and os.stat(output_file).st_size > 0:
 			fp = open(output_file, 'r')
 			fp.seek(fp.seek(0,2)-len('# [ok]\n'))
@@ -109,6 +125,8 @@ def prepare4hmmsearch(hmms_file, proteome_files, path_to_hmmsearch_results):
 		else:
 			callhmmer = True
 		if callhmmer == True:
+			if compressed is not None:
+				os.remove(compressed)
 			args2concurrent.append((hmms_file, faaFileName, output_file))
 			tools.makedir(os.path.dirname(output_file))
 		else:
@@ -132,8 +150,11 @@ def hmmSearch(args2concurrent):
 		nthread = nproteome
 	else:
 		nthread = constants.nthread
+	metrics.count('nhmmsearch', nproteome)
 	with concurrent.futures.ThreadPoolExecutor(max_workers = nthread) as executor:
-		for arg, outs in zip(args2concurrent, executor.map(is_analysis.is_hmmsearch_v2, args2concurrent)):
+		# the largest proteome is searched first, refer to tools.mapLPT()
+		for arg, outs in zip(args2concurrent, tools.mapLPT(executor, is_analysis.is_hmmsearch_v2,
+				args2concurrent, lambda arg: os.path.getsize(arg[1]))):
 			hmms_file, proteome_file, hmmHitsFile = arg
 			if outs == 0:
 				print('Finish Profile HMM searching', hmms_file, ' against', proteome_file, ', output', hmmHitsFile)
@@ -165,8 +186,11 @@ def phmmerSearch(args2concurrent4phmmer):
 		nthread = nproteome
 	else:
 		nthread = constants.nthread
+	metrics.count('nphmmer', nproteome)
 	with concurrent.futures.ThreadPoolExecutor(max_workers = nthread) as executor:
-		for arg, outs in zip(args2concurrent4phmmer, executor.map(is_analysis.is_phmmer, args2concurrent4phmmer)):
+		# the largest proteome is searched first, refer to tools.mapLPT()
+		for arg, outs in zip(args2concurrent4phmmer, tools.mapLPT(executor, is_analysis.is_phmmer,
+				args2concurrent4phmmer, lambda arg: os.path.getsize(arg[1]))):
 			seqFile, proteome_file, hmmHitsFile = arg
 			if outs == 0:
 				print('Finish phmmer searching', seqFile, ' against', proteome_file, ', output', hmmHitsFile)
@@ -176,6 +200,56 @@ def phmmerSearch(args2concurrent4phmmer):
 	print("\nFinish phmmer searching against proteome database.", datetime.datetime.now().ctime())
 
 
+# Return dna4fgs, the DNA sequence file translated by FragGeneScan, which is dna_file if no
+# sequence is dropped, else output_file + '.filtered.fna' containing only the sequences in dna_file 
+# not shorter than the minimal length of IS element in all families.
+#
+# The sequences are written into filtered file with their original headers, so that the coordinates
+# of genes predicted in filtered file are the same as those in dna_file. The map of sequences
+# is written into output_file + '.map', one line per sequence in dna_file:
+#	index4dna index4fgs seqid dnaLen nN
+#	index4dna, index4fgs: index of sequence in dna_file and in dna4fgs, index4fgs is -1 if dropped
+#	nN: number of 'N' and 'n' in sequence
+#
+# dna_file is read once, the sequences kept are written into filtered file while they are read,
+# and filtered file is removed if no sequence is dropped.
+def filterContigs(dna_file, output_file):
+	if constants.removeShortIS != True or constants.filter4contig != True:
+		return dna_file
+	minLen = min(minMax[0] for minMax in constants.minMaxLen4is.values())
+
+	seqids = []
+	dnaLens = []
+	nNs = []
+	dna4fgs = output_file + '.filtered.fna'
+	with open(dna4fgs, 'w') as fp:
+		for header, seq in tools.iterFasta(dna_file):
+			# bases: sequence in bytes with lowercase letters, where b'N' | 0x20 == b'n'
+			bases = numpy.frombuffer(seq.encode('latin-1'), dtype=numpy.uint8) | 0x20
+			seqids.append(tools.id4header(header))
+			dnaLens.append(len(bases))
+			nNs.append(numpy.count_nonzero(bases == ord('n')))
+			if len(bases) >= minLen:
+				pred.writeDNA2file(fp, header, seq)
+	dnaLens = numpy.array(dnaLens, dtype=numpy.int64)
+	nNs = numpy.array(nNs, dtype=numpy.int64)
+	keep = dnaLens >= minLen
+	if numpy.all(keep):
+		os.remove(dna4fgs)
+		return dna_file
+
+	# index4fgs: index of sequence in filtered file, -1 if dropped
+	index4fgs = numpy.where(keep, numpy.cumsum(keep) - 1, -1)
+	with open(output_file + '.map', 'w') as fp:
+		for i, seqid in enumerate(seqids):
+			print(i, index4fgs[i], seqid, dnaLens[i], nNs[i], sep='\t', file=fp)
+
+	nskip = numpy.count_nonzero(~keep)
+	print('Skip translating {} of {} sequences ({} of {} bps, {} Ns) shorter than {} bps in {}, refer to {}'.format(
+		nskip, len(seqids), dnaLens[~keep].sum(), dnaLens.sum(), nNs[~keep].sum(), minLen, dna_file,
+		output_file + '.map'))
+	return dna4fgs
+
 # dnaFiles: [(file, org), ..., (file, org)]
 def translateGenomeByFGS_v2(dnaFiles, dir2proteome):
 	#seq_type = '1'
@@ -202,7 +276,8 @@ def translateGenomeByFGS_v2(dnaFiles, dir2proteome):
 		update = False
 		if not os.path.isfile(faaFile):
 			tools.makedir(os.path.dirname(faaFile))
-			args2concurrent.append((dna_file, output_file, seq_type, train_model))
+			dna4fgs = filterContigs(dna_file, output_file)
+			args2concurrent.append((dna4fgs, output_file, seq_type, train_model))
 			update = True
 		elif os.stat(faaFile).st_size > 0:
 			print('Skip translating {} into {}'.format(dna_file, faaFile))
@@ -215,6 +290,13 @@ def translateGenomeByFGS_v2(dnaFiles, dir2proteome):
 	# Translate genome into proteome.
 	if len(args2concurrent) > 0:
 		genome2proteome(args2concurrent)
+		metrics.count('nFragGeneScan', len(args2concurrent))
+		# proteome (.faa) is not compressed because it is searched by hmmer and read by offset
+		for arg in args2concurrent:
+			output_file = arg[1]
+			for suffix in ('.ffn', '.out', '.gff', '.filtered.fna'):
+				if os.path.isfile(output_file + suffix):
+					tools.compressFile(output_file + suffix, constants.compression4intermediate)
 	else:
 		print('Skip translating genome into proteome.')
 	return proteome_files
@@ -224,29 +306,57 @@ def translateGenomeByFGS_v2(dnaFiles, dir2proteome):
 # dnaFiles: [(file, org), ..., (file, org)]
 def proteinFromNCBI(dnaFiles, dir2proteome):
 	proteome_files = []
+	args2concurrent = []
 	# Convert GeneBank protein info (NC_000913.faa and NC_000913.ptt)
 	# into FragGeneScan protein file format(NC_000913.fna.faa)
-	update = True
 	for item in dnaFiles:
 		fnaFile, org = item
 		#faaFile = fnaFile[:-4] + '.faa'
 		#pttFile = fnaFile[:-4] + '.ptt'
 		gbkFile = fnaFile[:-4] + '.gbk'
+		if not os.path.isfile(gbkFile):
+			# NC_000913.gbk.gz or NC_000913.gbk.zst
+			gbkFile = tools.compressedFile(gbkFile) or gbkFile
 		fgsFile = os.path.join(dir2proteome, org, os.path.basename(fnaFile + '.faa'))
-		#tools.gb2fgs4protein(fnaFile, faaFile, pttFile, fgsFile)
-		tools.gbk2fgs4protein(fnaFile, gbkFile, fgsFile)
+		# convert only if protein file is not available or older than .gbk and .fna files
+		update = False
+		if (not os.path.isfile(fgsFile) or 
+				os.path.getmtime(fgsFile) < max(os.path.getmtime(gbkFile), os.path.getmtime(fnaFile))):
+			args2concurrent.append((fnaFile, gbkFile, fgsFile))
+			update = True
+		else:
+			print('Skip converting {} into {}'.format(gbkFile, fgsFile))
 		proteome_files.append((fgsFile, org, update))
+
+	nfile = len(args2concurrent)
+	if nfile < constants.nproc:
+		nproc = nfile
+	else:
+		nproc = constants.nproc
+	if nproc > 1:
+		# the largest GenBank file is converted first
+		args2concurrent.sort(key = lambda args: os.path.getsize(args[1]), reverse=True)
+		with concurrent.futures.ProcessPoolExecutor(max_workers = nproc) as executor:
+			for outs in executor.map(tools.gbk2fgs4protein, *zip(*args2concurrent)):
+				pass
+	else:
+		for fnaFile, gbkFile, fgsFile in args2concurrent:
+			#tools.gb2fgs4protein(fnaFile, faaFile, pttFile, fgsFile)
+			tools.gbk2fgs4protein(fnaFile, gbkFile, fgsFile)
 	return proteome_files
 
 #def isPredict(args):
 def isPredict(dna_list, path_to_proteome, path_to_hmmsearch_results):
 	print('isPredict begins at', datetime.datetime.now().ctime())
+	# the stages of isPredict and pred are reported in one metrics file, refer to pred.file4metrics()
+	metrics.reset()
 
 	dnaFiles = tools.rdDNAlist(dna_list)
-	if constants.translateGenome == True:
-		proteome_files = translateGenomeByFGS_v2(dnaFiles, path_to_proteome)
-	else:
-		proteome_files = proteinFromNCBI(dnaFiles, path_to_proteome)
+	with metrics.Stage('FragGeneScan'):
+		if constants.translateGenome == True:
+			proteome_files = translateGenomeByFGS_v2(dnaFiles, path_to_proteome)
+		else:
+			proteome_files = proteinFromNCBI(dnaFiles, path_to_proteome)
 
 	clusterSeqFile4phmmer = constants.file4clusterSeqFile4phmmer
 	hmms_file = constants.file4clusterHMM
@@ -255,17 +365,23 @@ def isPredict(dna_list, path_to_proteome, path_to_hmmsearch_results):
 	#
 	args2concurrent4phmmer, outFiles4phmmer = prepare4phmmer(clusterSeqFile4phmmer, proteome_files, path_to_hmmsearch_results)
 	if len(args2concurrent4phmmer) > 0:
-		phmmerSearch(args2concurrent4phmmer)
+		with metrics.Stage('phmmer'):
+			phmmerSearch(args2concurrent4phmmer)
 
 	args2concurrent4hmmsearch, outFiles4hmmsearch = prepare4hmmsearch(hmms_file, proteome_files, path_to_hmmsearch_results)
 	if len(args2concurrent4hmmsearch) > 0:
-		hmmSearch(args2concurrent4hmmsearch)
+		with metrics.Stage('hmmsearch'):
+			hmmSearch(args2concurrent4hmmsearch)
 
 	print('isPredict ends at', datetime.datetime.now().ctime())
 
 	# Select significant ones (predictions) from hits returned by HMM search, and 
 	# do optional benchmark which comparing predictions with ISfinder genome annotations.
 	hitsFile = outFiles4phmmer + outFiles4hmmsearch
+	with metrics.Stage('tblout'):
+		hitsFile = [tools.compressFile(file, constants.compression4intermediate) for file in hitsFile]
+		# pred reads the hits from the binary hits files instead of parsing the text output of hmmer
+		hitsFile = [pred.writeBinaryHits(file) for file in hitsFile]
 	if len(hitsFile) > 0:
 		args4pred = {'dna_list': dna_list,
 			'path_to_proteome': path_to_proteome,
@@ -276,6 +392,7 @@ def isPredict(dna_list, path_to_proteome, path_to_hmmsearch_results):
 	else:
 		e = 'No hit was returned by HMM search against protein database. ' + datetime.datetime.now().ctime()
 		print(e)
+		metrics.write(pred.file4metrics(dna_list))
 
 
 if __name__ == "__main__":
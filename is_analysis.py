@@ -4,9 +4,11 @@ import operator
 import re
 import constants
 import tools
+import metrics
 import concurrent.futures
 import os.path
 import itertools
+import math
 import ssw_wrap
 import sys
 import datetime
@@ -83,10 +85,12 @@ def prepare4ssw2findIRbyDNAbyFar(mOrfHits, mDna):
 	return (mInput4ssw, mboundary)
 
 # mispairs: {seqid: ispairs, ..., seqid: ispairs}
-# ispairs: {qseqid: g, ..., qseqid: g}, alignment pairs in blast.out
-# g: [ispair, ..., ispair]
-# ispair: {'orfhit': orfhit, 'qseqid':qseqid, 'sseqid':sseqid, 'orfBegin':orfBegin, 'orfEnd':orfEnd, 
-#		'qstart':qstart, 'qend':qend, 'sstart':sstart, 'send':send, ..., 'length':length}
+# ispairs: {orfid: (orfhit, g), ..., orfid: (orfhit, g)}, alignment pairs in blast.out grouped by ORF
+# g: numpy structured array of dtype tools.blastDtype4dna, [ispair, ..., ispair]
+# ispair: ('qid', 'length', 'qstart', 'qend', 'sstart', 'send', 'nident', 'qlen', 'slen', 'pident',
+#		'orfBegin', 'orfEnd')
+# orfhit: (orf, familyName, best_1_domain_E-value, full_sequence_E-value, overlap_number, orfid)
+# orfid: integer, ID of orfhit, which is used as isName in the returned mInput4ssw and mboundary
 # orfhitsNeighbors: {orf: orfhitneighbors, ..., orfhitneighbors}
 # orfhitneighbors: [before, orfhit, after], before/after is None or orfhit
 def prepare4ssw2findIRbyDNAbyFar4ispair(misapirs, mDna, maxDist4ter2orf, minDist4ter2orf,
@@ -98,25 +102,13 @@ def prepare4ssw2findIRbyDNAbyFar4ispair(misapirs, mDna, maxDist4ter2orf, minDist
 			continue
 		orfhitsNeighbors = morfhitsNeighbors[seqid]
 		DNAlen = len(mDna[seqid][-1])
-		for qseqid, g in ispairs.items():
-			orfHit = g[0]['orfhit']
+		for orfid, (orfHit, g) in ispairs.items():
 			familyName = orfHit[1]
-			orf = g[0]['orfhit'][0]
+			orf = orfHit[0]
 			orfBegin, orfEnd = orf[1:3]
 			orfLen = orfEnd - orfBegin + 1
 
-			# familyName example: 'IS200/IS605_4|IS200/IS605|IS1341|ISCARN12|', 
-			#	'IS30_0', 'IS110_25|IS110||ISLIN1|'
-			if '|' in familyName:
-				familyCluster = familyName.split('|',1)[0]
-			else:
-				familyCluster = familyName
-			family, cluster = familyCluster.rsplit('_', 1)
-
-			if familyCluster == 'IS200/IS605_8':
-				minMax4tir = constants.minMax4tir[familyCluster]
-			else:
-				minMax4tir = constants.minMax4tir[family]
+			minMax4tir = tools.familyInfo(familyName).minMax4tir
 			#minMax4dr = constants.minMax4dr[family]
 
 			if constants.useOPTtir == True:
@@ -130,7 +122,7 @@ def prepare4ssw2findIRbyDNAbyFar4ispair(misapirs, mDna, maxDist4ter2orf, minDist
 				virtualORF = True
 				# consider the identified aligned-region as a virtual ORF
 				# g is sorted by alignment length.
-				qstart, qend = g[1]['qstart'], g[1]['qend']
+				qstart, qend = int(g[1]['qstart']), int(g[1]['qend'])
 
 				# if aligned region spans two or more Tpases, eg. composite transposon,
 				# the current hit in the aligned region is trimmed to the tpase ORF.
@@ -185,18 +177,13 @@ def prepare4ssw2findIRbyDNAbyFar4ispair(misapirs, mDna, maxDist4ter2orf, minDist
 			# The strand does not matter when extracting two terminal sequences to align, namely,
 			# which sequence is the first sequence in pairwise alignement does not make sense.
 			lSeq = mDna[seqid][-1][start1-1: end1]
-			rSeq = tools.complementDNA(mDna[seqid][-1][start2-1: end2], '1')[::-1]
+			rSeq = mDna[seqid][-1].revcomp(start2-1, end2)
 
 			minScore = 0.0
 
-
-			# transformat orf to a string, for example,
-			# orf == ('gi|256374160|ref|NC_013093.1|', 20, 303, '+') 
-			#	-> orfStr == 'gi|256374160|ref|NC_013093.1|_20_303_+'
-			# So, orfStr can be used an ID like isName in other called sub-functions
-			orfStr = '_'.join((orf[0], str(orf[1]), str(orf[2]), orf[3]))
-			mInput4ssw.append((familyName, orfStr, lSeq, rSeq, minScore, minLen))
-			mboundary[orfStr] = (start1, end1, start2, end2)
+			# orfid is used as an ID like isName in other called sub-functions
+			mInput4ssw.append((familyName, orfid, lSeq, rSeq, minScore, minLen))
+			mboundary[orfid] = (start1, end1, start2, end2)
 		#mInput4ssw.append(input4orfHits)
 	return (mInput4ssw, mboundary)
 
@@ -1044,6 +1031,12 @@ def findIR4elementBySSW(args):
 	return ir
 
 
+# Return irs, the best IRs of a batch of elements, refer to findIR4elementBySSW()
+# args: (batch, filter), batch: [input4IS1, .., input4ISn]
+def findIR4batchBySSW(args):
+	batch, filter = args
+	return [findIR4elementBySSW((input4IS, filter)) for input4IS in batch]
+
 # Find best IR for each element, and return all best IRs with one IR per element
 # mInput4ssw: [input4IS1, .., input4ISn]
 # input4ISn: (familyName, isName, seq1, seq2, minScore, minLen)
@@ -1051,8 +1044,21 @@ def findIR4elementBySSW(args):
 # filter: (gapopen, gapextend, match, mismatch)
 # ir: [] or [score, irId, irLen, nGaps, start1, end1, start2, end2, seq1, seq2]
 # seq1, seq2: inverted repeat sequences
-def findIRbySSW(mInput4ssw, filter):
+# nthread: number of threads aligning the batches of mInput4ssw at the same time, where SSW
+#	runs without holding GIL, all elements are aligned in the current thread if nthread < 2
+def findIRbySSW(mInput4ssw, filter, nthread=1):
 	mBestIR = []
+	metrics.count('nssw', len(mInput4ssw))
+
+	if nthread > 1 and len(mInput4ssw) > 1:
+		# a few batches for each thread in order to balance the load of threads
+		size = math.ceil(len(mInput4ssw) / (nthread * 4))
+		margs = [(mInput4ssw[i: i+size], filter) for i in range(0, len(mInput4ssw), size)]
+		with concurrent.futures.ThreadPoolExecutor(max_workers = nthread) as executor:
+			for args, irs in zip(margs, executor.map(findIR4batchBySSW, margs)):
+				for input4IS, ir in zip(args[0], irs):
+					mBestIR.append([input4IS[0], input4IS[1], ir])
+		return mBestIR
 
 	'''
 	args2concurrent = []
@@ -1474,6 +1480,12 @@ def translate_genome_dna_v2(dna, output_file, seq_type, train_model):
 
 def translate_genome_dna_v3(args):
 	dna, output_file, seq_type, train_model = args
+	# FragGeneScan reads only uncompressed DNA sequence file
+	tmpfile = None
+	if tools.compression4file(dna) != '':
+		tmpfile = output_file + '.fna.tmp'
+		tools.decompressFile(dna, tmpfile)
+		dna = tmpfile
 	#./run_FragGeneScan.pl -genome=./example/NC_000913.fna -out=./example/NC_000913.test  -complete=1  -train=complete -thread==4
 
 	gene_translate_cmd = constants.FragGeneScan
@@ -1490,7 +1502,17 @@ def translate_genome_dna_v3(args):
 	do_FragGeneScan = shlex.split(cmd_line)
 
 	#return subprocess.call(do_FragGeneScan, shell=False, universal_newlines=False)
-	return subprocess.call(cmd_line, shell=True, universal_newlines=False)
+	# FragGeneScan is killed and run again if it runs out of time, refer to tools.callTool()
+	returncode = tools.callTool('FragGeneScan', cmd_line, dna, shell=True, universal_newlines=False)
+	if tmpfile is not None:
+		os.remove(tmpfile)
+	# the output of killed FragGeneScan is incomplete and removed, so that it is not taken as 
+	# the proteome translated in the next run
+	if returncode is None:
+		for suffix in ('.faa', '.ffn', '.out', '.gff'):
+			if os.path.isfile(output_file + suffix):
+				os.remove(output_file + suffix)
+	return returncode
 
 def is_hmmsearch(hmm, database, output):
 	hmmsearch_cmd = "/u/zhiqxie/informatics/inst/hmmer-3.1b2/bin/hmmsearch"
@@ -1522,7 +1544,8 @@ def is_hmmsearch_v2(args):
 	do_hmmsearch = shlex.split(cmd_line)
 
 	#return subprocess.call(cmd_line, shell=True, universal_newlines=False, stdout=subprocess.DEVNULL)
-	return subprocess.call(do_hmmsearch, shell=False, universal_newlines=False, stdout=subprocess.DEVNULL)
+	# the output of killed hmmsearch misses the last line '# [ok]' and is searched again in the next run
+	return tools.callTool('hmmsearch', do_hmmsearch, database, universal_newlines=False, stdout=subprocess.DEVNULL)
 	#return subprocess.check_call(do_hmmsearch, shell=False, universal_newlines=False, stdout=subprocess.DEVNULL)
 
 # run phmmer as:
@@ -1540,7 +1563,7 @@ def is_phmmer(args):
 	do_search = shlex.split(cmd_line)
 
 	#return subprocess.call(cmd_line, shell=True, universal_newlines=False, stdout=subprocess.DEVNULL)
-	return subprocess.call(do_search, shell=False, universal_newlines=False, stdout=subprocess.DEVNULL)
+	return tools.callTool('phmmer', do_search, database, universal_newlines=False, stdout=subprocess.DEVNULL)
 	#return subprocess.check_call(do_search, shell=False, universal_newlines=False, stdout=subprocess.DEVNULL)
 
 
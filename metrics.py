@@ -0,0 +1,117 @@
+# Metrics of the stages in a run of isPredict.isPredict() and pred.pred(), which are written into
+# a JSON file next to the predictions, refer to pred.file4metrics().
+#
+# A stage is measured by running it in "with metrics.Stage(name):", and the counters of the
+# stage running in current process are added by count(), e.g. count('nblastn') in tools.py.
+#
+# stages: {stage: metrics4stage, ..., stage: metrics4stage}, in order of the first start of stage
+# metrics4stage: {'ncall': ncall, 'wall': wall, 'cpu': cpu, 'cpu4children': cpu4children,
+#		'maxrss': maxrss, 'maxrss4children': maxrss4children, 'read': read, 'written': written,
+#		counter: n, ..., counter: n}
+#	ncall: number of times stage is run, the times and bytes below are summed over all runs
+#	wall: wall-clock time in seconds
+#	cpu: CPU time in seconds (user + system) used by all threads of current process
+#	cpu4children: CPU time in seconds used by the child processes finished in stage, e.g.
+#		FragGeneScan, hmmsearch and blastn
+#	maxrss, maxrss4children: peak resident set size (KB) of current process and of the largest
+#		child process when stage ends
+#	read, written: bytes read and written by current process, 0 if /proc/self/io is not available
+#	counter: e.g. nhit, norf, nblastn, nssw, ntir, nis
+#
+# The stages run by the worker processes of pred.pred4seqsInParallel() are measured in the workers
+# and merged into stages by merge(), where the times of a stage are summed over the workers.
+
+import os
+import time
+import json
+import datetime
+import resource
+import threading
+
+
+stages = {}
+# active: [stage, ..., stage], stages running in current process, the last one receives the counters
+active = []
+lock = threading.Lock()
+
+def reset():
+	with lock:
+		stages.clear()
+		del active[:]
+
+# Return (read, written), bytes read and written by current process so far
+def io4proc():
+	try:
+		with open('/proc/self/io', 'r') as fp:
+			io = dict(line.split(': ', maxsplit=1) for line in fp.read().splitlines())
+		return (int(io['rchar']), int(io['wchar']))
+	except (OSError, KeyError, ValueError):
+		return (0, 0)
+
+class Stage(object):
+	def __init__(self, name):
+		self.name = name
+
+	def __enter__(self):
+		self.wall = time.perf_counter()
+		self.cpu = time.process_time()
+		usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+		self.cpu4children = usage.ru_utime + usage.ru_stime
+		self.io = io4proc()
+		with lock:
+			if self.name not in stages:
+				stages[self.name] = {'ncall': 0, 'wall': 0.0, 'cpu': 0.0, 'cpu4children': 0.0,
+						'maxrss': 0, 'maxrss4children': 0, 'read': 0, 'written': 0}
+			active.append(self.name)
+		return self
+
+	def __exit__(self, *excinfo):
+		wall = time.perf_counter() - self.wall
+		cpu = time.process_time() - self.cpu
+		usage4children = resource.getrusage(resource.RUSAGE_CHILDREN)
+		cpu4children = usage4children.ru_utime + usage4children.ru_stime - self.cpu4children
+		maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+		read, written = io4proc()
+		with lock:
+			metrics4stage = stages[self.name]
+			metrics4stage['ncall'] += 1
+			metrics4stage['wall'] += wall
+			metrics4stage['cpu'] += cpu
+			metrics4stage['cpu4children'] += cpu4children
+			metrics4stage['maxrss'] = max(metrics4stage['maxrss'], maxrss)
+			metrics4stage['maxrss4children'] = max(metrics4stage['maxrss4children'], usage4children.ru_maxrss)
+			metrics4stage['read'] += read - self.io[0]
+			metrics4stage['written'] += written - self.io[1]
+			active.remove(self.name)
+		return False
+
+# Add n to counter of the last stage running in current process, nothing is done if no stage is running
+def count(counter, n=1):
+	with lock:
+		if len(active) == 0:
+			return
+		metrics4stage = stages[active[-1]]
+		metrics4stage[counter] = metrics4stage.get(counter, 0) + n
+
+# Add the metrics of stages4other, e.g. those measured in a worker process, into stages, where
+# maxrss and maxrss4children are the maximum and the others are summed
+def merge(stages4other):
+	with lock:
+		for name, metrics4other in stages4other.items():
+			metrics4stage = stages.setdefault(name, {})
+			for key, value in metrics4other.items():
+				if key in ('maxrss', 'maxrss4children'):
+					metrics4stage[key] = max(metrics4stage.get(key, 0), value)
+				else:
+					metrics4stage[key] = metrics4stage.get(key, 0) + value
+
+# Write the metrics of stages into file in JSON format
+def write(file):
+	report = {'end': datetime.datetime.now().ctime(), 'pid': os.getpid(), 'stages': stages}
+	dir = os.path.dirname(file)
+	if dir != '':
+		os.makedirs(dir, exist_ok=True)
+	tmpfile = '{}.{}.tmp'.format(file, os.getpid())
+	with lock, open(tmpfile, 'w') as fp:
+		json.dump(report, fp, indent='\t')
+	os.replace(tmpfile, file)
@@ -18,6 +18,9 @@ import scipy.cluster.hierarchy
 
 import tools
 import is_analysis
+import dnastore
+import catalog
+import metrics
 import constants
 
 
@@ -25,6 +28,52 @@ import constants
 SORT_BY = 4
 
 
+# IS element candidate (hit), passed from mTIR2hits4ispair() through chooseHits(), refineHits(),
+# removeRedundantIS(), removeOverlappedHits(), scoreHits() and down to the output writers
+# without being copied at any stage.
+#
+# orf: (seqid, begin, end, strand)
+# hmmhit: (familyName, best_1_domain_E-value, full_sequence_E-value, overlap_number)
+# tirs: [tir, ..., tir]
+# tir: (score, irId, irLen, nGaps, start1, end1, start2, end2, seq1, seq2)
+# bd: [start, end], boundary of hit (IS element)
+# ncopy4is: copy number of the specific IS element with sim > constants.sim4iso in same DNA sequence
+# ncopy4orf: copy number of the specific Tpase ORF with sim > constants.sim4iso in same DNA sequence
+# sim4is, sim4orf: similarity cutoffs used to define the copies of IS element and Tpase ORF
+# isScore: None or {'evalue': score4evalue, 'tir': score4tir, 'dr': score4dr, 'occurence': score4occurence,
+#		'score': isScore, 'ncopy4orf': ncopy4orf, 'ncopy4is': ncopy4is, 'irSim': irSim}
+class ISHit(object):
+	__slots__ = ('orf', 'hmmhit', 'tirs', 'bd', 'ncopy4is', 'ncopy4orf', 'sim4is', 'sim4orf', 'isScore')
+
+	def __init__(self, orf, hmmhit, tirs, bd=None, ncopy4is=1, ncopy4orf=0, sim4is=0.0, sim4orf=0.0):
+		self.orf = orf
+		self.hmmhit = hmmhit
+		self.tirs = tirs
+		self.bd = bd
+		self.ncopy4is = ncopy4is
+		self.ncopy4orf = ncopy4orf
+		self.sim4is = sim4is
+		self.sim4orf = sim4orf
+		self.isScore = None
+
+	# occurence: {'ncopy4orf': ncopy4orf, 'sim4orf': sim4orf, 'ncopy4is': ncopy4is, 'sim4is': sim4is}
+	def occurence(self):
+		return {'ncopy4is': self.ncopy4is, 'ncopy4orf': self.ncopy4orf,
+				'sim4orf': self.sim4orf, 'sim4is': self.sim4is}
+
+	# Return hit in the form of dict used by the previous versions,
+	# {'orf': orf, 'tirs': tirs, 'hmmhit': hmmhit, 'bd': bd, 'occurence': occurence, 'isScore': isScore}
+	def to_dict(self):
+		hit = {'orf': self.orf, 'hmmhit': self.hmmhit, 'tirs': self.tirs, 'bd': self.bd,
+				'occurence': self.occurence()}
+		if self.isScore is not None:
+			hit['isScore'] = self.isScore
+		return hit
+
+	def __repr__(self):
+		return 'ISHit({})'.format(self.to_dict())
+
+
 # process_tblout(tblout):
 # > Sort hits by ov, best 1 domain E-value and full sequence E-value
 # > Remove unsatisfying hits based on ov, best 1 domain E-value and full sequence E-value
@@ -45,7 +94,7 @@ SORT_BY = 4
 #
 def process_tblout(tblout):
 	hits = []
-	fp_tblout = open(tblout, 'r')
+	fp_tblout = tools.openFile(tblout, 'r')
 	for line in fp_tblout:
 		if line[0] == '#':
 			continue
@@ -137,6 +186,50 @@ def process_tblout(tblout):
 	'''
 
 
+# Return the name of binary hits file of tblout, tblout.npz, where the compression suffix of tblout is removed
+def binaryHitsFile(tblout):
+	for suffix in ('.gz', '.zst'):
+		if tblout.endswith(suffix):
+			tblout = tblout[:-len(suffix)]
+	return tblout + '.npz'
+
+# Return the binary hits file of tblout if it exists and is not older than tblout, otherwise tblout
+def hitsFile4tblout(tblout):
+	hitsFile = binaryHitsFile(tblout)
+	if os.path.isfile(hitsFile) and os.path.getmtime(hitsFile) >= os.path.getmtime(tblout):
+		return hitsFile
+	return tblout
+
+# Write hits in tblout into the binary hits file if it is not up to date, and return the binary hits file.
+# The binary hits file is a numpy .npz file holding the fields of hits returned by process_tblout(),
+# one array for each field: compoundID, queryName, evalue (best 1 domain E-value) and ov (overlap number),
+# where the hit lines are not kept.
+def writeBinaryHits(tblout):
+	hitsFile = hitsFile4tblout(tblout)
+	if hitsFile != tblout:
+		return hitsFile
+	hitsFile = binaryHitsFile(tblout)
+	hits = process_tblout(tblout)
+	tmpfile = '{}.{}.tmp'.format(hitsFile, os.getpid())
+	with open(tmpfile, 'wb') as fp:
+		numpy.savez_compressed(fp,
+			compoundID = numpy.array([hit[2] for hit in hits], dtype=str),
+			queryName = numpy.array([hit[3] for hit in hits], dtype=str),
+			evalue = numpy.array([hit[0] for hit in hits], dtype=numpy.float64),
+			ov = numpy.array([hit[5] for hit in hits], dtype=numpy.int64))
+	os.replace(tmpfile, hitsFile)
+	return hitsFile
+
+# Return hits in hitsFile, same as process_tblout() but line is '' in each hit if hitsFile is a binary
+# hits file written by writeBinaryHits(), otherwise hitsFile is a tblout file parsed by process_tblout().
+def loadHits(hitsFile):
+	if not hitsFile.endswith('.npz'):
+		return process_tblout(hitsFile)
+	with numpy.load(hitsFile) as data:
+		evalues = data['evalue'].tolist()
+		return list(zip(evalues, itertools.repeat('', len(evalues)), data['compoundID'].tolist(), 
+			data['queryName'].tolist(), evalues, data['ov'].tolist()))
+
 # refine_hmm_hits() removes the redundant hits (same genome location hitted by different family HMM models) 
 # and keeps only the best one (sorted by ov and E-values) 
 # among the hits mapped to the same genome coordinate pair.
@@ -208,7 +301,7 @@ def refine_hmm_hits_evalue(tblout_hits_sorted, e_value):
 # (45, 22, 25, 0, 4518470, 4518494, 4519217, 4519241, 'TCGGTAATGCTGCCAACTTACTGAT', 'TCGGTAATGACTCCAACTTACTGAT').
 # mhits: {seqid: hits, ..., seqid: hits}
 # hits: [hit, ..., hit]
-# hit: {'orf': orf, 'tirs': tirs, 'hmmhit': hmmhit, 'bd': bd}
+# hit: ISHit, record with attributes orf, tirs, hmmhit and bd
 # orf: (seqid, begin, end, strand)
 # tirs: [tir, ..., tir]
 # tir: (score, irId, irLen, nGaps, start1, end1, start2, end2, seq1, seq2)
@@ -225,15 +318,15 @@ def removeRedundantIS(mhits):
 	mhitsNew = {}
 	for accid, hits in mhits.items():
 		hitsNew = []
-		sortedHits = sorted(hits, key=lambda x: x['bd'])
-		for k, g in itertools.groupby(sortedHits, key=lambda x: x['bd']):
+		sortedHits = sorted(hits, key=lambda x: x.bd)
+		for k, g in itertools.groupby(sortedHits, key=lambda x: x.bd):
 			redundantHits = list(g)
 			if len(redundantHits) > 1:
-				redundantHits.sort(key = lambda x: x['hmmhit'][sortby])
+				redundantHits.sort(key = lambda x: x.hmmhit[sortby])
 				print('Remove redundant IS elements and keep only one with the least evalue:')
 				for hit in redundantHits:
-					print('redundant hit', hit['bd'], hit['occurence']['ncopy4is'], 
-							hit['orf'], hit['hmmhit'])
+					print('redundant hit', hit.bd, hit.ncopy4is, 
+							hit.orf, hit.hmmhit)
 			hitsNew.append(redundantHits[0])
 		mhitsNew[accid] = hitsNew
 	return mhitsNew
@@ -250,7 +343,7 @@ def clusterIntersect(hits, ids):
 	# 
 	data = []
 	for id in idsList:
-		data.append(hits[id]['bd'])
+		data.append(hits[id].bd)
 
 	Y = numpy.array(data, int)
 	print('data: {}\n{}'.format(Y.shape, Y))
@@ -269,7 +362,7 @@ def clusterIntersect(hits, ids):
 	#for i, cluster in enumerate(hclusters):
 	#	print('cluster {:>3} {:>6} {:>6} {:>9.2g} {:>6}'.format(i, int(cluster[0]), int(cluster[1]), cluster[2], int(cluster[3])))
 	for i, id in enumerate(idsList):
-		print('intersected hits', i, hits[id]['bd'], hits[id]['orf'], hits[id]['occurence'], hits[id]['hmmhit'], hits[id]['tirs'])
+		print('intersected hits', i, hits[id].bd, hits[id].orf, hits[id].occurence(), hits[id].hmmhit, hits[id].tirs)
 
 	# dengrogram of hierachical clustering
 	#scipy.cluster.hierarchy.dendrogram(hclusters)
@@ -295,22 +388,22 @@ def clusterIntersect(hits, ids):
 	for cluster in clustersDic.values():
 		# sort and group hits into two groups, multiple-copy and single-copy, where multiple-copy hits with 
 		# different copy number are grouped into same group, multiple-copy group.
-		cluster.sort(key = lambda x: 2 if hits[idsList[x]]['occurence']['ncopy4is']>1 else 1, reverse=True)
-		gs = itertools.groupby(cluster, key = lambda x: 2 if hits[idsList[x]]['occurence']['ncopy4is']>1 else 1)
+		cluster.sort(key = lambda x: 2 if hits[idsList[x]].ncopy4is>1 else 1, reverse=True)
+		gs = itertools.groupby(cluster, key = lambda x: 2 if hits[idsList[x]].ncopy4is>1 else 1)
 
 		# len(gs) == 2 if both multiple- and single-copy groups are available in cluster, 
 		# len(gs) == 1 if either multiple-copy only or single-copy only group is available in cluster.
 		# sort hits by e-value where gs[0] is groups containing hits with the most of copy number.
 		k_g = next(gs) # get the first tuple from gs, (k,g)
 		g = list(k_g[1])
-		g.sort(key = lambda x: hits[idsList[x]]['hmmhit'][1])
+		g.sort(key = lambda x: hits[idsList[x]].hmmhit[1])
 		# id of the representative hit with the least e-value, where hit == hits[idsList[id]]
 		repid = g[0]
 		hit = hits[idsList[repid]]
 		hitsNew.append(hit)
 		print('representative hit: repid={} hitid={} hitbd={} cluster={}'.format(
-			repid, idsList[repid], hit['bd'], cluster))
-	hitsNew.sort(key = lambda x: x['bd'][0])
+			repid, idsList[repid], hit.bd, cluster))
+	hitsNew.sort(key = lambda x: x.bd[0])
 	return hitsNew
 
 def removeOverlappedHits(mhits):
@@ -318,11 +411,11 @@ def removeOverlappedHits(mhits):
 	for accid, hits in mhits.items():
 		ids = set()
 		for pair in itertools.combinations(range(len(hits)), 2):
-			#if hits[pair[0]]['orf'][3] != hits[pair[1]]['orf'][3]:
+			#if hits[pair[0]].orf[3] != hits[pair[1]].orf[3]:
 			#	continue # count hits with orf on different strands as different IS
 
-			bd1 = hits[pair[0]]['bd']
-			bd2 = hits[pair[1]]['bd']
+			bd1 = hits[pair[0]].bd
+			bd2 = hits[pair[1]].bd
 			measure, threshold = tools.chooseMeasure(bd1, bd2)
 			if measure < threshold:
 				continue
@@ -342,12 +435,12 @@ def removeOverlappedHits(mhits):
 # 
 # mhits: {accid: hits, ..., accid: hits}
 # hits: [hit, ..., hit]
-# hit: {'orf': orf, 'tirs': tirs, 'hmmhit': hmmhit, 'occurence': occurence, 'isScore': isScore}
+# hit: ISHit, record with attributes orf, tirs, hmmhit, bd, ncopy4is, sim4is, ncopy4orf, sim4orf and isScore
 # orf: (accid, begin, end, strand)
 # tirs: [tir, ..., tir]
 # tir: (score, irId, irLen, nGaps, start1, end1, start2, end2, seq1, seq2)
 # hmmhit: (clusterName, best_1_domain_E-value, full_sequence_E-value, overlap_number)
-# occurence: {'ncopy4orf': ncopy4orf, 'sim4orf': sim4orf, 'ncopy4is': ncopy4is, 'sim4is': sim4is}
+# ncopy4orf, sim4orf, ncopy4is, sim4is: occurence of IS element
 # 	ncopy4orf: copy number of the specific Tpase ORF with sim > constants.sim4iso in same DNA sequence
 # 	ncopy4is: copy number of the specific IS element with sim > constants.sim4iso in same DNA sequence
 # 	sim4orf: Tpase ORF with identicalBases/lengthOfAlignment > sim are regarded as the same Tpase
@@ -389,7 +482,7 @@ def outputIndividual(mhits, mDNA, proteomes, morfsMerged):
 		org, fileid, seq = mDNA[seqid]
 
 		# proteomes: {seqid: (filename, genes), ..., seqid: (filename, genes)}
-		#	genes: {orfseqid: faa, ..., orfseqid: faa}
+		#	genes: tools.FastaIndex, {orfseqid: faa, ..., orfseqid: faa}
 		#	orfseqid: 'seqid_orfid', orfid = 'begin_end_strand'
 		if seqid not in proteomes.keys():
 			continue
@@ -406,28 +499,29 @@ def outputIndividual(mhits, mDNA, proteomes, morfsMerged):
 		outFile = os.path.join(dir4output, '.'.join([fileid, 'out']))
 		sumFile = os.path.join(dir4output, '.'.join([fileid, 'sum']))
 		gffFile =  os.path.join(dir4output, '.'.join([fileid, 'gff']))
-		fp = open(outFile, 'w')
-		fp4sum = open(sumFile, 'w')
-		fp4gff = open(gffFile, 'w')
 		outFile4isfna = os.path.join(dir4output, '.'.join([fileid, 'is', 'fna']))
 		outFile4orffna = os.path.join(dir4output, '.'.join([fileid, 'orf', 'fna']))
 		outFile4orffaa = os.path.join(dir4output, '.'.join([fileid, 'orf', 'faa']))
-		fp4isfna = open(outFile4isfna, 'w')
-		fp4orffna = open(outFile4orffna, 'w')
-		fp4orffaa = open(outFile4orffaa, 'w')
+		# the lines (and FASTA records) of each prediction file are collected and written at once
+		lines = []
+		lines4sum = []
+		lines4gff = []
+		seqs4isfna = []
+		seqs4orffna = []
+		seqs4orffaa = []
 
 		# sort by isBegin if tirs exist, else by orfBegin
-		#hits.sort(key = lambda x: x['tirs'][0][-6] if len(x['tirs'])>0 and len(x['tirs'][0])>0 else x['orf'][1])
+		#hits.sort(key = lambda x: x.tirs[0][-6] if len(x.tirs)>0 and len(x.tirs[0])>0 else x.orf[1])
 		# sort by isBegin
-		hits.sort(key = lambda x: x['bd'][0])
+		hits.sort(key = lambda x: x.bd[0])
 		# familySumBySeq: {'family1': nis4family1, ..., 'familyn': nis4familyn}
 		# bpsBySeq: {'family1': bps, ..., 'familyn': bps}
 		familySumBySeq = {}
 		bpsBySeq = {}
 
-		print('##gff-version 3', file = fp4gff)
+		lines4gff.append('##gff-version 3')
 
-		print(fmtStrTitlePredictionNoSeq.format(
+		lines.append(fmtStrTitlePredictionNoSeq.format(
 			'seqID', # NCBI sequence ID
 			'family', # family name from ISfinder
 			'cluster', # cluster ID created by CD-hit clustering
@@ -437,30 +531,25 @@ def outputIndividual(mhits, mDNA, proteomes, morfsMerged):
 			'score', 'irId', 'irLen', 'nGaps', # characteristics of tir: 
 			'orfBegin', 'orfEnd', 'strand', 'len4orf', # tpase ORF: orfBegin, orfEnd, strand, length
 			'E-value', 'ov', # hmmhit: best1domain e-value and overlap number output by hmmer
-			), 
-			file = fp)
-		print('#', '-' * 139, file = fp)
+			))
+		lines.append('# ' + '-' * 139)
 
 		IDnum = 0 
 		#for hit in hits:
 		for hitID, hit in enumerate(hits):
-			orfBegin, orfEnd, strand = hit['orf'][1:]
+			orfBegin, orfEnd, strand = hit.orf[1:]
 			len4orf = orfEnd - orfBegin + 1
-			cluster, best1domE, fullSeqE, ov, = hit['hmmhit']
-			if 'IS200_IS605_' in cluster:
-				family = 'IS200/IS605'
-			else:
-				family = cluster.split('_',1)[0]
-			occurence = hit['occurence']
-			ncopy4is, sim4is, ncopy4orf, sim4orf = occurence['ncopy4is'], occurence['sim4is'], occurence['ncopy4orf'], occurence['sim4orf']
-			if len(hit['tirs']) > 0:
-				tirs = hit['tirs']
+			cluster, best1domE, fullSeqE, ov, = hit.hmmhit
+			family = tools.familyInfo(cluster).family
+			ncopy4is, sim4is, ncopy4orf, sim4orf = hit.ncopy4is, hit.sim4is, hit.ncopy4orf, hit.sim4orf
+			if len(hit.tirs) > 0:
+				tirs = hit.tirs
 				score, irId, irLen, nGaps, start1, end1, start2, end2, seq1, seq2 = tirs[0]
 				#isBegin, isEnd = start1, end2
 			else:
 				score, irId, irLen, nGaps, start1, end1, start2, end2, seq1, seq2 = (0, 0, 0, 0, 0, 0, 0, 0, '-', '-')
 				#isBegin, isEnd = orfBegin, orfEnd
-			isBegin, isEnd = hit['bd']
+			isBegin, isEnd = hit.bd
 			len4is = isEnd - isBegin + 1
 
 			# output .gff file
@@ -470,7 +559,7 @@ def outputIndividual(mhits, mDNA, proteomes, morfsMerged):
 			IDnum += 1
 			ID = str(IDnum)
 			# IS element
-			print('{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}'.format(
+			lines4gff.append('{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}'.format(
 				seqid, # NCBI sequence ID
 				'ISEScan',
 				'insertion_sequence',
@@ -480,11 +569,11 @@ def outputIndividual(mhits, mDNA, proteomes, morfsMerged):
 				strand, # IS element is DNA transposon and not stranded but usually labeled by strand of Tpase main ORF.
 				'.',
 				';'.join(['ID=is'+ID, 'family='+family, 'cluster='+str(cluster)])
-				), file = fp4gff)
+				))
 			# with TIR
 			if irLen > 0:
 				# the first part of TIR
-				print('{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}'.format(
+				lines4gff.append('{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}'.format(
 					seqid, # NCBI sequence ID
 					'ISEScan',
 					'terminal_inverted_repeat',
@@ -494,9 +583,9 @@ def outputIndividual(mhits, mDNA, proteomes, morfsMerged):
 					strand, # IS element is DNA transposon and not stranded but usually labeled by strand of Tpase main ORF.
 					'.',
 					';'.join(['ID=tir'+ID, 'parent=is'+ID])
-					), file = fp4gff)
+					))
 				# the second part of TIR
-				print('{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}'.format(
+				lines4gff.append('{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}'.format(
 					seqid, # NCBI sequence ID
 					'ISEScan',
 					'terminal_inverted_repeat',
@@ -506,11 +595,11 @@ def outputIndividual(mhits, mDNA, proteomes, morfsMerged):
 					strand, # IS element is DNA transposon and not stranded but usually labeled by strand of Tpase main ORF.
 					'.',
 					';'.join(['ID=tir'+ID, 'parent=is'+ID])
-					), file = fp4gff)
+					))
 
 			# output .out file
 			#print(fmtStrPrediction.format(
-			print(fmtStrPredictionNoSeq.format(
+			lines.append(fmtStrPredictionNoSeq.format(
 				seqid, # NCBI sequence ID
 				family, # family name
 				cluster, # cluster id
@@ -520,8 +609,7 @@ def outputIndividual(mhits, mDNA, proteomes, morfsMerged):
 				score, irId, irLen, nGaps, # characteristics of tir 
 				orfBegin, orfEnd, strand, len4orf, # orf, probably virtual ORF
 				best1domE, ov, # hmmhit
-				),
-				file = fp)
+				))
 
 			# summarize
 			if family in familySumBySeq.keys():
@@ -533,25 +621,25 @@ def outputIndividual(mhits, mDNA, proteomes, morfsMerged):
 			
 			# output sequence of IS element
 			if strand == '-':
-				fna4is = tools.complementDNA(seq[isBegin-1: isEnd], '1')[::-1]
+				fna4is = seq.revcomp(isBegin-1, isEnd)
 			else:
 				fna4is = seq[isBegin-1: isEnd]
-			head4fna4is = '_'.join([hit['orf'][0], str(isBegin), str(isEnd), strand])
+			head4fna4is = '_'.join([hit.orf[0], str(isBegin), str(isEnd), strand])
 			des = cluster
 			head4fna4is = ' '.join([head4fna4is, des])
 			fasta4fna4is = tools.fasta_format(head4fna4is, fna4is)
-			fp4isfna.write(fasta4fna4is)
+			seqs4isfna.append(fasta4fna4is)
 
 			# ORF
-			orfStr = '_'.join([str(x) for x in hit['orf'][1:]])
-			head4fna4orf = '_'.join([hit['orf'][0], orfStr])
+			orfStr = '_'.join([str(x) for x in hit.orf[1:]])
+			head4fna4orf = '_'.join([hit.orf[0], orfStr])
 
 			orfs4merged = []
 			for orf in orfsMerged:
 				# The merged orfs must be located at the same strand.
-				#if  hit['orf'][1] <= orf[1] and hit['orf'][2] >= orf[2] and hit['orf'][3] == orf[3]:
+				#if  hit.orf[1] <= orf[1] and hit.orf[2] >= orf[2] and hit.orf[3] == orf[3]:
 				# The merged orfs may be located at the different strands.
-				if  hit['orf'][1] <= orf[1] and hit['orf'][2] >= orf[2]:
+				if  hit.orf[1] <= orf[1] and hit.orf[2] >= orf[2]:
 					orfs4merged.append(orf)
 					# A hit is created by two merged ORFs.
 					# At most two ORF hits (ORFs )can be merged into a larger virtual ORF, 
@@ -569,38 +657,32 @@ def outputIndividual(mhits, mDNA, proteomes, morfsMerged):
 					faa4orf1 = proteins[head4faa4orf1]
 					fasta4faa4orf1 = tools.fasta_format('{} {} merged in virtual ORF {}'.format(
 						head4faa4orf1, orf1str, orfStr), faa4orf1)
-					fp4orffaa.write(fasta4faa4orf1)
+					seqs4orffaa.append(fasta4faa4orf1)
 
 					# nucleic acid sequence
 					head4fna4orf1 = '_'.join([orf1[0], orf1str])
 					if orf1[3] == '-':
-						fna4orf1 = tools.complementDNA(seq[orf1[1]-1: orf1[2]], '1')[::-1]
+						fna4orf1 = seq.revcomp(orf1[1]-1, orf1[2])
 					else:
 						fna4orf1 = seq[orf1[1]-1: orf1[2]]
 					fasta4fna4orf1 = tools.fasta_format('{} {} merged in virtual ORF {}'.format(
 						head4fna4orf1, orf1str, orfStr), fna4orf1)
-					fp4orffna.write(fasta4fna4orf1)
+					seqs4orffna.append(fasta4fna4orf1)
 			else:
 				# amino acid sequence
 				faa4orf = proteins[head4fna4orf]
 				fasta4faa4orf = tools.fasta_format(head4fna4orf, faa4orf)
-				fp4orffaa.write(fasta4faa4orf)
+				seqs4orffaa.append(fasta4faa4orf)
 
 				# nucleic acid sequence
 				if strand == '-':
-					fna4orf = tools.complementDNA(seq[orfBegin-1: orfEnd], '1')[::-1]
+					fna4orf = seq.revcomp(orfBegin-1, orfEnd)
 				else:
 					fna4orf = seq[orfBegin-1: orfEnd]
 				fasta4fna4orf = tools.fasta_format(head4fna4orf, fna4orf)
-				fp4orffna.write(fasta4fna4orf)
+				seqs4orffna.append(fasta4fna4orf)
 
-		fp4isfna.close()
-		fp4orffna.close()
-		fp4orffaa.close()
-		fp4gff.close()
-		fp.close()
-
-		print('{:<11} {:>6} {:>7} {:>15}'.format('family', 'nIS', '%Genome', 'bps4IS'), file=fp4sum)
+		lines4sum.append('{:<11} {:>6} {:>7} {:>15}'.format('family', 'nIS', '%Genome', 'bps4IS'))
 		#print('-' * 18, file=fp4sum)
 		nis4seq = 0
 		bps4seq = 0
@@ -608,14 +690,23 @@ def outputIndividual(mhits, mDNA, proteomes, morfsMerged):
 		for family in sorted(familySumBySeq.keys()):
 			nis = familySumBySeq[family]
 			bps4family = bpsBySeq[family]
-			print('{:<11} {:>6} {:>7.2g} {:>15}'.format(family, nis, 
-				(bps4family/len4DNA)*100, bps4family), file=fp4sum)
+			lines4sum.append('{:<11} {:>6} {:>7.2g} {:>15}'.format(family, nis, 
+				(bps4family/len4DNA)*100, bps4family))
 			nis4seq += nis
 			bps4seq += bps4family
 
-		print('{:<11} {:>6} {:>7.2g} {:>15} {:>15}'.format('total', nis4seq, 
-			(bps4seq/len4DNA)*100, bps4seq, len4DNA), file=fp4sum)
-		fp4sum.close()
+		lines4sum.append('{:<11} {:>6} {:>7.2g} {:>15} {:>15}'.format('total', nis4seq, 
+			(bps4seq/len4DNA)*100, bps4seq, len4DNA))
+
+		# compression4output is applied to all prediction files but .sum
+		compression = constants.compression4output
+		suffix = tools.suffix4compression[compression]
+		tools.writeFile(outFile + suffix, tools.join4lines(lines), compression)
+		tools.writeFile(sumFile, tools.join4lines(lines4sum))
+		tools.writeFile(gffFile + suffix, tools.join4lines(lines4gff), compression)
+		tools.writeFile(outFile4isfna + suffix, ''.join(seqs4isfna), compression)
+		tools.writeFile(outFile4orffna + suffix, ''.join(seqs4orffna), compression)
+		tools.writeFile(outFile4orffaa + suffix, ''.join(seqs4orffaa), compression)
 		if nis4seq == 0:
 			print('No valid IS element was found for', seqid)
 
@@ -624,12 +715,12 @@ def outputIndividual(mhits, mDNA, proteomes, morfsMerged):
 # 
 # mhits: {accid: hits, ..., accid: hits}
 # hits: [hit, ..., hit]
-# hit: {'orf': orf, 'tirs': tirs, 'hmmhit': hmmhit, 'occurence': occurence, 'isScore': isScore}
+# hit: ISHit, record with attributes orf, tirs, hmmhit, bd, ncopy4is, sim4is, ncopy4orf, sim4orf and isScore
 # orf: (accid, begin, end, strand)
 # tirs: [tir, ..., tir]
 # tir: (score, irId, irLen, nGaps, start1, end1, start2, end2, seq1, seq2)
 # hmmhit: (clusterName, best_1_domain_E-value, full_sequence_E-value, overlap_number)
-# occurence: {'ncopy4orf': ncopy4orf, 'sim4orf': sim4orf, 'ncopy4is': ncopy4is, 'sim4is': sim4is}
+# ncopy4orf, sim4orf, ncopy4is, sim4is: occurence of IS element
 # 	ncopy4orf: copy number of the specific Tpase ORF with sim > constants.sim4iso in same DNA sequence
 # 	ncopy4is: copy number of the specific IS element with sim > constants.sim4iso in same DNA sequence
 # 	sim4orf: Tpase ORF with identicalBases/lengthOfAlignment > sim are regarded as the same Tpase
@@ -638,7 +729,10 @@ def outputIndividual(mhits, mDNA, proteomes, morfsMerged):
 #		'score': isScore, 'ncopy4orf': ncopy4orf, 'ncopy4is': ncopy4is, 'irSim': irSim}
 #
 # orgfileid: org/fileid, character string, e.g. HMASM/SRS078176.scaffolds.fa
-def outputIS4multipleSeqOneFile(mhits, mDNA, proteomes, morfsMerged, orgfileid):
+# output: None to write the predictions in mhits into new files which are closed on return, or
+#	the files opened by openOutput4oneFile() to append the predictions in mhits, which is the
+#	part of the sequences in DNA file, refer to pred4chunks()
+def outputIS4multipleSeqOneFile(mhits, mDNA, proteomes, morfsMerged, orgfileid, output=None):
 	#fmtStrPrediction = '{:<60} # NCBI sequence ID
 	#		{:<11} # family
 	#		{:<59} # subgroup (cluster) ID
@@ -660,51 +754,21 @@ def outputIS4multipleSeqOneFile(mhits, mDNA, proteomes, morfsMerged, orgfileid):
 	#		'E-value', 'ov', # hmmhit: evalue4best1domain, overlap number output by hmmer
 	#		
 	#
-	fmtStrTitlePredictionNoSeq = '{:<60} {:<11} {:<59} {:>12} {:>12} {:>6} {:>8} {:>12} {:>12} {:>12} {:>12} {:>5} {:>4} {:>5} {:>5} {:>12} {:>12} {:>6} {:>7} {:>9} {:>2}'
 	fmtStrPredictionNoSeq = '{:<60} {:<11} {:<59} {:>12} {:>12} {:>6} {:>8} {:>12} {:>12} {:>12} {:>12} {:>5} {:>4} {:>5} {:>5} {:>12} {:>12} {:>6} {:>7} {:>9.2g} {:>2}'
-
-	fmtStrTitleSum = '{:<60} {:<11} {:>6} {:>7} {:>15} {:>15}'
 	fmtStrSum = '{:<60} {:<11} {:>6} {:>7.2f} {:>15} {:>15}'
 
-	common4output = os.path.join(constants.dir4prediction, orgfileid)
-	outFile = '.'.join([common4output, 'out'])
-	sumFile = '.'.join([common4output, 'sum'])
-	gffFile =  '.'.join([common4output, 'gff'])
-
-	tools.makedir(os.path.dirname(outFile))
-
-	fp = open(outFile, 'w')
-	print(fmtStrTitlePredictionNoSeq.format(
-		'seqID', # sequence ID
-		'family', # family name from ISfinder
-		'cluster', # cluster ID created by CD-hit clustering
-		'isBegin', 'isEnd', 'len4is', # boundary and length of IS element
-		'ncopy4is', # copy number of IS element
-		'start1', 'end1', 'start2', 'end2', # boundary of tir
-		'score', 'irId', 'irLen', 'nGaps', # characteristics of tir: 
-		'orfBegin', 'orfEnd', 'strand', 'len4orf', # tpase ORF: orfBegin, orfEnd, strand, length
-		'E-value', 'ov', # hmmhit: best1domain e-value and overlap number output by hmmer
-		), 
-		file = fp)
-	print('#', '-' * 139, file = fp)
-
-	fp4sum = open(sumFile, 'w')
-	print(fmtStrTitleSum.format(
-		'# seqid', 'family', 'nIS', '%Genome', 'bps4IS', 'dnaLen'), file=fp4sum)
-	nis4seqTotal = 0
-	bps4seqTotal = 0
-	len4DNATotal = 0
-
-	fp4gff = open(gffFile, 'w')
-	print('##gff-version 3', file = fp4gff)
-
-	outFile4isfna = '.'.join([common4output, 'is', 'fna'])
-	outFile4orffna = '.'.join([common4output, 'orf', 'fna'])
-	outFile4orffaa = '.'.join([common4output, 'orf', 'faa'])
-	fp4isfna = open(outFile4isfna, 'w')
-	fp4orffna = open(outFile4orffna, 'w')
-	fp4orffaa = open(outFile4orffaa, 'w')
-
+	if output is None:
+		fps = openOutput4oneFile(orgfileid)
+	else:
+		fps = output
+	fp, fp4sum, fp4gff, fp4isfna, fp4orffna, fp4orffaa = fps['files']
+	# the lines (and FASTA records) of each prediction file are collected and written at once
+	lines = []
+	lines4sum = []
+	lines4gff = []
+	seqs4isfna = []
+	seqs4orffna = []
+	seqs4orffaa = []
 
 	#print(fmtStrTitlePrediction.format(
 	# sort keys of dictionary
@@ -716,7 +780,7 @@ def outputIS4multipleSeqOneFile(mhits, mDNA, proteomes, morfsMerged, orgfileid):
 		org, fileid, seq = mDNA[seqid]
 
 		# proteomes: {seqid: (filename, genes), ..., seqid: (filename, genes)}
-		#	genes: {orfseqid: faa, ..., orfseqid: faa}
+		#	genes: tools.FastaIndex, {orfseqid: faa, ..., orfseqid: faa}
 		#	orfseqid: 'seqid_orfid', orfid = 'begin_end_strand'
 
 		if seqid not in proteomes.keys():
@@ -729,9 +793,9 @@ def outputIS4multipleSeqOneFile(mhits, mDNA, proteomes, morfsMerged, orgfileid):
 			orfsMerged = set()
 
 		# sort by isBegin if tirs exist, else by orfBegin
-		#hits.sort(key = lambda x: x['tirs'][0][-6] if len(x['tirs'])>0 and len(x['tirs'][0])>0 else x['orf'][1])
+		#hits.sort(key = lambda x: x.tirs[0][-6] if len(x.tirs)>0 and len(x.tirs[0])>0 else x.orf[1])
 		# sort by isBegin
-		hits.sort(key = lambda x: x['bd'][0])
+		hits.sort(key = lambda x: x.bd[0])
 		# familySumBySeq: {'family1': nis4family1, ..., 'familyn': nis4familyn}
 		# bpsBySeq: {'family1': bps, ..., 'familyn': bps}
 		familySumBySeq = {}
@@ -741,23 +805,19 @@ def outputIS4multipleSeqOneFile(mhits, mDNA, proteomes, morfsMerged, orgfileid):
 		IDnum = 0 
 		#for hit in hits:
 		for hitID, hit in enumerate(hits):
-			orfBegin, orfEnd, strand = hit['orf'][1:]
+			orfBegin, orfEnd, strand = hit.orf[1:]
 			len4orf = orfEnd - orfBegin + 1
-			cluster, best1domE, fullSeqE, ov, = hit['hmmhit']
-			if 'IS200_IS605_' in cluster:
-				family = 'IS200/IS605'
-			else:
-				family = cluster.split('_',1)[0]
-			occurence = hit['occurence']
-			ncopy4is, sim4is, ncopy4orf, sim4orf = occurence['ncopy4is'], occurence['sim4is'], occurence['ncopy4orf'], occurence['sim4orf']
-			if len(hit['tirs']) > 0:
-				tirs = hit['tirs']
+			cluster, best1domE, fullSeqE, ov, = hit.hmmhit
+			family = tools.familyInfo(cluster).family
+			ncopy4is, sim4is, ncopy4orf, sim4orf = hit.ncopy4is, hit.sim4is, hit.ncopy4orf, hit.sim4orf
+			if len(hit.tirs) > 0:
+				tirs = hit.tirs
 				score, irId, irLen, nGaps, start1, end1, start2, end2, seq1, seq2 = tirs[0]
 				#isBegin, isEnd = start1, end2
 			else:
 				score, irId, irLen, nGaps, start1, end1, start2, end2, seq1, seq2 = (0, 0, 0, 0, 0, 0, 0, 0, '-', '-')
 				#isBegin, isEnd = orfBegin, orfEnd
-			isBegin, isEnd = hit['bd']
+			isBegin, isEnd = hit.bd
 			len4is = isEnd - isBegin + 1
 
 			# output .gff file
@@ -768,7 +828,7 @@ def outputIS4multipleSeqOneFile(mhits, mDNA, proteomes, morfsMerged, orgfileid):
 			ID = str(IDnum)
 			# IS element
 			isid = '_'.join([seqid, 'IS', ID])
-			print('{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}'.format(
+			lines4gff.append('{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}'.format(
 				seqid, # sequence ID
 				'ISEScan',
 				'insertion_sequence',
@@ -778,13 +838,13 @@ def outputIS4multipleSeqOneFile(mhits, mDNA, proteomes, morfsMerged, orgfileid):
 				strand, # IS element is DNA transposon and not stranded but usually labeled by strand of Tpase main ORF.
 				'.',
 				';'.join(['ID='+isid, 'family='+family, 'cluster='+str(cluster)])
-				), file = fp4gff)
+				))
 			# with TIR
 			tirid = '_'.join([isid,'TIR'])
 			parentid = isid
 			if irLen > 0:
 				# the first part of TIR
-				print('{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}'.format(
+				lines4gff.append('{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}'.format(
 					seqid, # NCBI sequence ID
 					'ISEScan',
 					'terminal_inverted_repeat',
@@ -794,9 +854,9 @@ def outputIS4multipleSeqOneFile(mhits, mDNA, proteomes, morfsMerged, orgfileid):
 					strand, # IS element is DNA transposon and not stranded but usually labeled by strand of Tpase main ORF.
 					'.',
 					';'.join(['ID='+tirid, 'parent='+isid])
-					), file = fp4gff)
+					))
 				# the second part of TIR
-				print('{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}'.format(
+				lines4gff.append('{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}'.format(
 					seqid, # NCBI sequence ID
 					'ISEScan',
 					'terminal_inverted_repeat',
@@ -806,11 +866,11 @@ def outputIS4multipleSeqOneFile(mhits, mDNA, proteomes, morfsMerged, orgfileid):
 					strand, # IS element is DNA transposon and not stranded but usually labeled by strand of Tpase main ORF.
 					'.',
 					';'.join(['ID='+tirid, 'parent='+isid])
-					), file = fp4gff)
+					))
 
 			# output .out file
 			#print(fmtStrPrediction.format(
-			print(fmtStrPredictionNoSeq.format(
+			lines.append(fmtStrPredictionNoSeq.format(
 				seqid, # NCBI sequence ID
 				family, # family name
 				cluster, # cluster id
@@ -820,8 +880,7 @@ def outputIS4multipleSeqOneFile(mhits, mDNA, proteomes, morfsMerged, orgfileid):
 				score, irId, irLen, nGaps, # characteristics of tir 
 				orfBegin, orfEnd, strand, len4orf, # orf, probably virtual ORF
 				best1domE, ov, # hmmhit
-				),
-				file = fp)
+				))
 
 			# summarize
 			if family in familySumBySeq.keys():
@@ -833,25 +892,25 @@ def outputIS4multipleSeqOneFile(mhits, mDNA, proteomes, morfsMerged, orgfileid):
 			
 			# output sequence of IS element
 			if strand == '-':
-				fna4is = tools.complementDNA(seq[isBegin-1: isEnd], '1')[::-1]
+				fna4is = seq.revcomp(isBegin-1, isEnd)
 			else:
 				fna4is = seq[isBegin-1: isEnd]
-			head4fna4is = '_'.join([hit['orf'][0], str(isBegin), str(isEnd), strand])
+			head4fna4is = '_'.join([hit.orf[0], str(isBegin), str(isEnd), strand])
 			des = cluster
 			head4fna4is = ' '.join([head4fna4is, des])
 			fasta4fna4is = tools.fasta_format(head4fna4is, fna4is)
-			fp4isfna.write(fasta4fna4is)
+			seqs4isfna.append(fasta4fna4is)
 
 			# ORF
-			orfStr = '_'.join([str(x) for x in hit['orf'][1:]])
-			head4fna4orf = '_'.join([hit['orf'][0], orfStr])
+			orfStr = '_'.join([str(x) for x in hit.orf[1:]])
+			head4fna4orf = '_'.join([hit.orf[0], orfStr])
 
 			orfs4merged = []
 			for orf in orfsMerged:
 				# The merged orfs must be located at the same strand.
-				#if  hit['orf'][1] <= orf[1] and hit['orf'][2] >= orf[2] and hit['orf'][3] == orf[3]:
+				#if  hit.orf[1] <= orf[1] and hit.orf[2] >= orf[2] and hit.orf[3] == orf[3]:
 				# The merged orfs may be located at the different strands.
-				if  hit['orf'][1] <= orf[1] and hit['orf'][2] >= orf[2]:
+				if  hit.orf[1] <= orf[1] and hit.orf[2] >= orf[2]:
 					orfs4merged.append(orf)
 					# A hit is created by two merged ORFs.
 					# At most two ORF hits (ORFs )can be merged into a larger virtual ORF, 
@@ -869,30 +928,30 @@ def outputIS4multipleSeqOneFile(mhits, mDNA, proteomes, morfsMerged, orgfileid):
 					faa4orf1 = proteins[head4faa4orf1]
 					fasta4faa4orf1 = tools.fasta_format('{} {} merged in virtual ORF {}'.format(
 						head4faa4orf1, orf1str, orfStr), faa4orf1)
-					fp4orffaa.write(fasta4faa4orf1)
+					seqs4orffaa.append(fasta4faa4orf1)
 
 					# nucleic acid sequence
 					head4fna4orf1 = '_'.join([orf1[0], orf1str])
 					if orf1[3] == '-':
-						fna4orf1 = tools.complementDNA(seq[orf1[1]-1: orf1[2]], '1')[::-1]
+						fna4orf1 = seq.revcomp(orf1[1]-1, orf1[2])
 					else:
 						fna4orf1 = seq[orf1[1]-1: orf1[2]]
 					fasta4fna4orf1 = tools.fasta_format('{} {} merged in virtual ORF {}'.format(
 						head4fna4orf1, orf1str, orfStr), fna4orf1)
-					fp4orffna.write(fasta4fna4orf1)
+					seqs4orffna.append(fasta4fna4orf1)
 			else:
 				# amino acid sequence
 				faa4orf = proteins[head4fna4orf]
 				fasta4faa4orf = tools.fasta_format(head4fna4orf, faa4orf)
-				fp4orffaa.write(fasta4faa4orf)
+				seqs4orffaa.append(fasta4faa4orf)
 
 				# nucleic acid sequence
 				if strand == '-':
-					fna4orf = tools.complementDNA(seq[orfBegin-1: orfEnd], '1')[::-1]
+					fna4orf = seq.revcomp(orfBegin-1, orfEnd)
 				else:
 					fna4orf = seq[orfBegin-1: orfEnd]
 				fasta4fna4orf = tools.fasta_format(head4fna4orf, fna4orf)
-				fp4orffna.write(fasta4fna4orf)
+				seqs4orffna.append(fasta4fna4orf)
 
 		#print('>'+seqid, file=fp4sum)
 		#print('-' * 18, file=fp4sum)
@@ -902,22 +961,93 @@ def outputIS4multipleSeqOneFile(mhits, mDNA, proteomes, morfsMerged, orgfileid):
 		for family in sorted(familySumBySeq.keys()):
 			nis = familySumBySeq[family]
 			bps4family = bpsBySeq[family]
-			print(fmtStrSum.format(
+			lines4sum.append(fmtStrSum.format(
 				seqid, family, nis, 
-				(bps4family/len4DNA)*100, bps4family, len4DNA), file=fp4sum)
+				(bps4family/len4DNA)*100, bps4family, len4DNA))
 			nis4seq += nis
 			bps4seq += bps4family
-		nis4seqTotal += nis4seq
-		bps4seqTotal += bps4seq
+		fps['nis4seqTotal'] += nis4seq
+		fps['bps4seqTotal'] += bps4seq
+		fps['nis4seq'] = nis4seq
+	fp.write(tools.join4lines(lines))
+	fp4sum.write(tools.join4lines(lines4sum))
+	fp4gff.write(tools.join4lines(lines4gff))
+	fp4isfna.write(''.join(seqs4isfna))
+	fp4orffna.write(''.join(seqs4orffna))
+	fp4orffaa.write(''.join(seqs4orffaa))
+
+	if output is None:
+		# The sequences without IS also need to be counted in len4DNATotal.
+		len4DNATotal = sum([len(v[2]) for v in mDNA.values()])
+		closeOutput4oneFile(fps, len4DNATotal)
+
+# Return output, the prediction files of orgfileid opened for outputIS4multipleSeqOneFile(), where the
+# title lines are written
+# output: {'fileid': fileid, 'files': files, 'nis4seqTotal': nis4seqTotal, 'bps4seqTotal': bps4seqTotal,
+#	'nis4seq': nis4seq}
+# files: (fp, fp4sum, fp4gff, fp4isfna, fp4orffna, fp4orffaa), files of .out, .sum, .gff, .is.fna,
+#	.orf.fna and .orf.faa
+# nis4seqTotal, bps4seqTotal: number of IS elements and bps covered by IS elements written so far
+# nis4seq: number of IS elements in the last sequence written
+def openOutput4oneFile(orgfileid):
+	fmtStrTitlePredictionNoSeq = '{:<60} {:<11} {:<59} {:>12} {:>12} {:>6} {:>8} {:>12} {:>12} {:>12} {:>12} {:>5} {:>4} {:>5} {:>5} {:>12} {:>12} {:>6} {:>7} {:>9} {:>2}'
+	fmtStrTitleSum = '{:<60} {:<11} {:>6} {:>7} {:>15} {:>15}'
+
+	common4output = os.path.join(constants.dir4prediction, orgfileid)
+	outFile = '.'.join([common4output, 'out'])
+	sumFile = '.'.join([common4output, 'sum'])
+	gffFile =  '.'.join([common4output, 'gff'])
+
+	tools.makedir(os.path.dirname(outFile))
+
+	# compression4output is applied to all prediction files but .sum
+	compression = constants.compression4output
+	suffix = tools.suffix4compression[compression]
+	fp = tools.openFile(outFile + suffix, 'w', compression)
+	print(fmtStrTitlePredictionNoSeq.format(
+		'seqID', # sequence ID
+		'family', # family name from ISfinder
+		'cluster', # cluster ID created by CD-hit clustering
+		'isBegin', 'isEnd', 'len4is', # boundary and length of IS element
+		'ncopy4is', # copy number of IS element
+		'start1', 'end1', 'start2', 'end2', # boundary of tir
+		'score', 'irId', 'irLen', 'nGaps', # characteristics of tir: 
+		'orfBegin', 'orfEnd', 'strand', 'len4orf', # tpase ORF: orfBegin, orfEnd, strand, length
+		'E-value', 'ov', # hmmhit: best1domain e-value and overlap number output by hmmer
+		), 
+		file = fp)
+	print('#', '-' * 139, file = fp)
+
+	fp4sum = tools.openFile(sumFile, 'w')
+	print(fmtStrTitleSum.format(
+		'# seqid', 'family', 'nIS', '%Genome', 'bps4IS', 'dnaLen'), file=fp4sum)
+
+	fp4gff = tools.openFile(gffFile + suffix, 'w', compression)
+	print('##gff-version 3', file = fp4gff)
+
+	outFile4isfna = '.'.join([common4output, 'is', 'fna'])
+	outFile4orffna = '.'.join([common4output, 'orf', 'fna'])
+	outFile4orffaa = '.'.join([common4output, 'orf', 'faa'])
+	fp4isfna = tools.openFile(outFile4isfna + suffix, 'w', compression)
+	fp4orffna = tools.openFile(outFile4orffna + suffix, 'w', compression)
+	fp4orffaa = tools.openFile(outFile4orffaa + suffix, 'w', compression)
+	return {'fileid': os.path.basename(orgfileid),
+		'files': (fp, fp4sum, fp4gff, fp4isfna, fp4orffna, fp4orffaa),
+		'nis4seqTotal': 0, 'bps4seqTotal': 0, 'nis4seq': 0}
+
+# Write the total line into .sum file and close the prediction files opened by openOutput4oneFile()
+# len4DNATotal: total length of all sequences in DNA file, including the sequences without IS
+def closeOutput4oneFile(output, len4DNATotal):
+	fmtStrSum = '{:<60} {:<11} {:>6} {:>7.2f} {:>15} {:>15}'
+	fp, fp4sum, fp4gff, fp4isfna, fp4orffna, fp4orffaa = output['files']
+	fileid = output['fileid']
+	nis4seqTotal, bps4seqTotal = output['nis4seqTotal'], output['bps4seqTotal']
 
-	# The sequences without IS also need to be counted in len4DNATotal.
-	len4DNATotal = sum([len(v[2]) for v in mDNA.values()])
-	
 	#fileid = os.path.basename(sumFile).rsplit('.',1)[0]
 	print(fmtStrSum.format(
 		fileid, 'total', 
 		nis4seqTotal, (bps4seqTotal/len4DNATotal)*100, bps4seqTotal, len4DNATotal), file=fp4sum)
-	if nis4seq == 0:
+	if output['nis4seq'] == 0:
 		print('No valid IS element was found for', fileid)
 		
 	fp4isfna.close()
@@ -965,8 +1095,8 @@ def convertHit2orfHit(hit):
 	# queryName: 'IS1_0.faa', 'IS110_3|IS110||ISKOL6|'
 	orfStr = compoundID.rsplit('_', 3)
 	#orf = (orfStr[0].rstrip('|').rsplit('|',1)[-1], int(orfStr[-3]), int(orfStr[-2]), orfStr[-1])
-	orf = (orfStr[0], int(orfStr[-3]), int(orfStr[-2]), orfStr[-1])
-	familyName = queryName.split('.', 1)[0]
+	orf = (sys.intern(orfStr[0]), int(orfStr[-3]), int(orfStr[-2]), orfStr[-1])
+	familyName = sys.intern(queryName.split('.', 1)[0])
 	return (orf, familyName, best1domainEvalue, fullSequenceEvalue, overlapNumber)
 
 
@@ -1045,6 +1175,28 @@ def mergeOrfs(mOrfHits, maxDistBetweenOrfs):
 		morfsMerged[accid] = orfsMerged
 	return (morfHitsCopy, morfsMerged)
 
+# Number the ORF hits with integers, return mOrfHits.
+# The integer ID instead of the string built from orf, e.g. 'NC_000915.1_20_303_+', is used as
+# the key of ispairs, mboundary and mTIR in the search of full-length IS elements.
+# IDs are assigned in the order of sorted seqid and then begin of orf, so that the same input
+# always gets the same IDs.
+#
+# morfHits: {accid: orfHits, ..., accid: orfHits}
+# orfHits: [orfhit, ..., orfhit]
+# orfhit: (orf, familyName, best_1_domain_E-value, full_sequence_E-value, overlap_number, orfid)
+# orf: (accid, begin, end, strand)
+# orfid: integer, ID of orfhit
+def numberOrfHits(mOrfHits):
+	morfHitsNumbered = {}
+	orfid = 0
+	for accid in sorted(mOrfHits):
+		orfHits = []
+		for orfhit in mOrfHits[accid]:
+			orfHits.append(orfhit + (orfid,))
+			orfid += 1
+		morfHitsNumbered[accid] = orfHits
+	return morfHitsNumbered
+
 
 # assumed: there are no orfs overlapped in genome.
 # morfhitsNeighbors: {seqid: orfhitsNeighbors, ..., seqid: orfhitsNeighbors}
@@ -1101,7 +1253,7 @@ steps to identify full-length IS elements in a genome DNA sequence:
 #
 # mhits: {accid: hits, ..., accid: hits}
 # hits: [hit, ..., hit]
-# hit: {'orf': orf, 'tirs': tirs, 'hmmhit': hmmhit}
+# hit: ISHit, record with attributes orf, tirs and hmmhit
 # orf: (accid, begin, end, strand)
 # tirs: [tir, ..., tir]
 # tir: (score, irId, irLen, nGaps, start1, end1, start2, end2, seq1, seq2)
@@ -1112,14 +1264,9 @@ def writeOrfExt2file(orfExtSeqFile, orfhits, dnaseq):
 	fasta = []
 	for orfhit in orfhits:
 		orf, familyName = orfhit[:2]
-		# familyName example: 'IS200/IS605_4|IS200/IS605|IS1341|ISCARN12|',
-		# 	'IS30_0', 'IS110_25|IS110||ISLIN1|'
-		if '|' in familyName:
-			familyCluster = familyName.split('|',1)[0]
-		else:
-			familyCluster = familyName
-		family, cluster = familyCluster.rsplit('_', 1)
-		maxLen4is = constants.minMaxLen4is[family][1]
+		fam = tools.familyInfo(familyName)
+		familyCluster, family = fam.familyCluster, fam.family
+		maxLen4is = fam.minMaxLen4is[1]
 		#minLen4is = constants.minMaxLen4is[family][0]
 		orfLen = orf[2] - orf[1] + 1
 		if orfLen >= maxLen4is:
@@ -1147,18 +1294,18 @@ def writeOrfExt2file(orfExtSeqFile, orfhits, dnaseq):
 	fp.write('\n'.join(fasta)+'\n')
 	fp.close()
 
-def writeOrfExt2fileOnStream(orfhits, dnaseq):
+# Return (fasta, orfext)
+# fasta: character string, ORF extended sequences in fasta format, with the index of orfhit 
+#	in orfhits plus offset as header, e.g. '>0', '>11'
+# orfext: numpy structured array of dtype tools.orfExtDtype, layout of each ORF extended sequence
+def writeOrfExt2fileOnStream(orfhits, dnaseq, offset=0):
 	fasta = []
-	for orfhit in orfhits:
+	orfext = numpy.empty(len(orfhits), dtype=tools.orfExtDtype)
+	for i, orfhit in enumerate(orfhits):
 		orf, familyName = orfhit[:2]
-		# familyName example: 'IS200/IS605_4|IS200/IS605|IS1341|ISCARN12|',
-		# 	'IS30_0', 'IS110_25|IS110||ISLIN1|'
-		if '|' in familyName:
-			familyCluster = familyName.split('|',1)[0]
-		else:
-			familyCluster = familyName
-		family, cluster = familyCluster.rsplit('_', 1)
-		maxLen4is = constants.minMaxLen4is[family][1]
+		fam = tools.familyInfo(familyName)
+		family = fam.family
+		maxLen4is = fam.minMaxLen4is[1]
 		#minLen4is = constants.minMaxLen4is[family][0]
 		orfLen = orf[2] - orf[1] + 1
 		if orfLen >= maxLen4is:
@@ -1175,18 +1322,24 @@ def writeOrfExt2fileOnStream(orfhits, dnaseq):
 			e = 'Invalid sequence range: begin={} end={} orfBegin={} orfEnd={} maxLen4is={} family={}'.format(
 					begin, end, orf[1], orf[2], maxLen4is, family)
 			raise RuntimeError(e)
-		seq = dnaseq[begin-1: end]
 		if orf[3] == '-':
-			seq = tools.complementDNA(seq, '1')[::-1]
+			seq = dnaseq.revcomp(begin-1, end)
+		else:
+			seq = dnaseq[begin-1: end]
 		fastaSeq = '\n'.join(tools.chunkstring(seq, constants.fastaLineWidth))
-		headline = '>' + '_'.join([orf[0], familyCluster, str(begin), str(end), str(orf[1]), str(orf[2]), orf[3]])
+		headline = '>' + str(offset + i)
 		fasta.extend([headline, fastaSeq])
-	return '\n'.join(fasta)
+		orfext[i] = (begin, end, orf[1], orf[2], orf[3] == '-', fam.minMaxLen4is[0], fam.minMax4tpase[2])
+	return ('\n'.join(fasta), orfext)
 
 def writeDNA2file(fp, seqid, seq):
-	fastaSeq = '\n'.join(tools.chunkstring(seq, constants.fastaLineWidth))
 	headline = '>' + seqid
-	print(headline, fastaSeq, sep='\n', file=fp)
+	print(headline, file=fp)
+	# write long sequence block by block
+	step = constants.fastaLineWidth * 10000
+	for i in range(0, len(seq), step):
+		fastaSeq = '\n'.join(tools.chunkstring(seq[i: i+step], constants.fastaLineWidth))
+		print(fastaSeq, file=fp)
 
 def writeDNA2fileOnStream(seqid, seq):
 	fastaSeq = '\n'.join(tools.chunkstring(seq, constants.fastaLineWidth))
@@ -1257,7 +1410,7 @@ def getFullIS4seqOnStream(args):
 	#seq = tools.cleanDNA(seq)
 
 	# write the extended sequences of ORFs into a string file
-	orfExtSeqFile = writeOrfExt2fileOnStream(orfhits, seq)
+	orfExtSeqFile, orfext = writeOrfExt2fileOnStream(orfhits, seq)
 
 	#subject = writeDNA2fileOnStream(seqid, seq)
 	# write full-length dna sequence into a temporary file to be called by makeblastdb
@@ -1292,8 +1445,12 @@ def getFullIS4seqOnStream(args):
 	else:
 		nthreads = norfhits
 	#blastOut4orfExt, err = tools.doBlastnOnStream(query, blastdb, strand='both', task='megablast', 
-	blastOut4orfExt, err = tools.doBlastn2seqOnStream(query, fp.name, strand='both', task='megablast', 
-			perc_ident=constants.SIM4ISO)
+	#blastOut4orfExt, err = tools.doBlastn2seqOnStream(query, fp.name, strand='both', task='megablast', 
+	#		perc_ident=constants.SIM4ISO)
+	# the alignments are parsed and filtered while blastn is running
+	hits, err = tools.blastn2seqHits4dna(query, fp.name, orfext, strand='both', task='megablast', 
+			perc_ident=constants.SIM4ISO, label=seqid)
+	os.remove(fp.name)
 	if len(err) > 0:
 		#e = 'Blastn ISs in {} against {}: {}'.format(seqid, db, err)
 		e = 'Blastn ISs in {} against {}: {}'.format(seqid, seqid, err)
@@ -1301,31 +1458,71 @@ def getFullIS4seqOnStream(args):
 
 	# get copy number of ORF extended sequence
 	ispairs = {}
-	# ispairs: {qseqid:[hit, ...]}
-	# hit: {'qseqid':qseqid, 'sseqid':sseqid, 'orfBegin':orfBegin, 'orfEnd':orfEnd, 'length':length, ...}
-	for k, g in itertools.groupby(
-			sorted(tools.getBlastResult4dnaOnStream(blastOut4orfExt), key=lambda x: x['qseqid']), 
-			key=lambda x: x['qseqid']):
-		ispairs[k] = list(g)
-		ispairs[k].sort(key = lambda x: x['length'], reverse = True)
-	
+	# ispairs: {orfid: (orfhit, g), ...}
+	# g: numpy structured array of dtype tools.blastDtype4dna, alignments of the ORF extended sequence
+	#	sorted by length in reverse order
+	#
 	# orfhits: [orfhit, ..., orfhit]
-	# orfhit: (orf, familyName, best_1_domain_E-value, full_sequence_E-value, overlap_number)
+	# orfhit: (orf, familyName, best_1_domain_E-value, full_sequence_E-value, overlap_number, orfid)
 	# orf: (accid, begin, end, strand), example, ('NC_000915.1', 20, 303, '+')
-	for qseqid, g in ispairs.items():
-		orfstr4is = '_'.join(qseqid.rsplit('_', maxsplit=3)[1:])
-		for orfhit in orfhits:
-			orfstr = '_'.join([str(item) for item in orfhit[0][1:]])
-			if orfstr == orfstr4is:
-				break
-		for ispair in g:
-			ispair['orfhit'] = orfhit
+	qids, starts = numpy.unique(hits['qid'], return_index=True)
+	for qid, g in zip(qids.tolist(), numpy.split(hits, starts[1:])):
+		orfhit = orfhits[qid]
+		ispairs[orfhit[5]] = (orfhit, g)
 	return ispairs
 
+# Return mispairs4bucket, the copies of Tpase ORFs in a bucket of short DNA sequences, which are
+# found by one blastn process searching the ORF extended sequences of all DNA sequences in bucket
+# against all DNA sequences in bucket
+# mispairs4bucket: {seqid: ispairs, ..., seqid: ispairs}, refer to getFullIS4seqOnStream()
+# bucket: [args, ..., args], args: (seqid, orfhits, dna), refer to getFullIS4seqOnStream()
+#
+# The DNA sequences are written into one subject file with the index of sequence in bucket as
+# header, and only the alignments of each ORF extended sequence against its own DNA sequence are
+# kept, so that the copies are the same as those found by getFullIS4seqOnStream() for each sequence.
+def getFullIS4bucketOnStream(bucket):
+	queries = []
+	orfexts = []
+	# sids: index of DNA sequence in bucket for each ORF extended sequence
+	sids = []
+	# offsets: index of the first ORF extended sequence of each DNA sequence
+	offsets = []
+	nquery = 0
+	fp = tempfile.NamedTemporaryFile(mode='w', delete=False)
+	for sid, (seqid, orfhits, dna) in enumerate(bucket):
+		query, orfext = writeOrfExt2fileOnStream(orfhits, dna[2], nquery)
+		queries.append(query)
+		orfexts.append(orfext)
+		sids.append(numpy.full(len(orfhits), sid, dtype=numpy.int64))
+		offsets.append(nquery)
+		nquery += len(orfhits)
+		writeDNA2file(fp, str(sid), dna[2])
+	fp.close()
+	sids = numpy.concatenate(sids)
+
+	hits, err = tools.blastn2seqHits4dna('\n'.join(queries), fp.name, numpy.concatenate(orfexts), 
+			strand='both', task='megablast', perc_ident=constants.SIM4ISO, sids=sids,
+			label=','.join(args[0] for args in bucket))
+	os.remove(fp.name)
+	if len(err) > 0:
+		e = 'Blastn ISs in {} against {}: {}'.format(bucket[0][0], ','.join(args[0] for args in bucket), err)
+		raise RuntimeError(e)
+
+	mispairs4bucket = {args[0]: {} for args in bucket}
+	qids, starts = numpy.unique(hits['qid'], return_index=True)
+	for qid, g in zip(qids.tolist(), numpy.split(hits, starts[1:])):
+		sid = sids[qid]
+		seqid, orfhits = bucket[sid][:2]
+		# index of orfhit in orfhits of DNA sequence, same as getFullIS4seqOnStream()
+		g['qid'] -= offsets[sid]
+		orfhit = orfhits[qid - offsets[sid]]
+		mispairs4bucket[seqid][orfhit[5]] = (orfhit, g)
+	return mispairs4bucket
+
 # Return mhits:
 # mhits: {seqid: hits, ..., seqid: hits}
 # hits: [hit, ..., hit]
-# hit: {'orf': orf, 'tirs': tirs, 'hmmhit': hmmhit, 'bd': bd}
+# hit: ISHit, record with attributes orf, tirs, hmmhit and bd
 # orf: (seqid, begin, end, strand)
 # tirs: [tir, ..., tir]
 # tir: (score, irId, irLen, nGaps, start1, end1, start2, end2, seq1, seq2)
@@ -1333,47 +1530,44 @@ def getFullIS4seqOnStream(args):
 # bd: [start, end], boundary of hit (IS element)
 # 
 # mispairs: {seqid: ispairs, ..., seqid: ispairs}
-# ispairs: {qseqid: g, ..., qseqid: g}
-# g: [ispair, ..., ispair]
-# ispair: {'qseqid':qseqid, 'length':length, 'qstart':qstart, 'qend':qend, 'sstart':sstart, 'send':send,
-#		'nident':nident, 'qlen':qlen, 'slen':slen, 'pident':pident,
-#		'orfBegin':orfBegin, 'orfEnd':orfEnd, 'orfhit':orfhit, ...}
+# ispairs: {orfid: (orfhit, g), ..., orfid: (orfhit, g)}
+# g: numpy structured array of dtype tools.blastDtype4dna, [ispair, ..., ispair]
+# ispair: ('qid', 'length', 'qstart', 'qend', 'sstart', 'send', 'nident', 'qlen', 'slen', 'pident',
+#		'orfBegin', 'orfEnd')
 # 1. define IS boundary by TIR if TIR is available in an IS element
 # 2.1 define IS boundary by alignment if no TIR is available in a multiple-copy IS element and alignment 
 #	does not span/intersect multiple Tpase ORFs; else
 # 2.2 define IS boundary by ORF
 # 3. define IS boundary by ORF if no TIR is available in a single-copy IS element
+#
+# mTIR: {orfid: (familyName, orfid, tirs), ..., orfid: (familyName, orfid, tirs)}
 def mTIR2hits4ispair(mispairs, mTIR, morfhitsNeighbors):
 	mhits = {}
 	for seqid, ispairs in mispairs.items():
 		if len(ispairs) == 0:
 			continue
 		hits = []
-		for qseqid, g in ispairs.items():
+		for orfid, (orfhit, g) in ispairs.items():
 			orfhitsNeighbors = morfhitsNeighbors[seqid]
-			hit = {}
-			orfhit = g[0]['orfhit']
 			orf = orfhit[0]
-			orfStr = '_'.join([str(item) for item in orf])
-			hit['orf'] = orf
-			hit['hmmhit'] = orfhit[1:]
-			if orfStr not in mTIR:
-				hit['tirs'] = []
+			if orfid not in mTIR:
+				tirs = []
 			else:
-				hit['tirs'] = mTIR[orfStr][2]
+				tirs = mTIR[orfid][2]
+			hit = ISHit(orf, orfhit[1:5], tirs)
 
 			ncopy = len(g)
 
 			# IS element with TIR, with boundary defined by the first TIR
-			if len(hit['tirs']) > 0 and len(hit['tirs'][0]) > 0:
-				tir = hit['tirs'][0]
-				hit['bd'] = [tir[-6], tir[-3]]
+			if len(hit.tirs) > 0 and len(hit.tirs[0]) > 0:
+				tir = hit.tirs[0]
+				hit.bd = [tir[-6], tir[-3]]
 			# multiple-copy IS element without TIR, with boundary defined by 
 			# the longest blast alignment, namely, g[1] because g[0] is the 
 			# alignment of query and itself.
 			elif ncopy > 1:
-				#hit['bd'] = [g[1]['qstart'], g[1]['qend']]
-				qstart, qend = g[1]['qstart'], g[1]['qend']
+				#hit.bd = [g[1]['qstart'], g[1]['qend']]
+				qstart, qend = int(g[1]['qstart']), int(g[1]['qend'])
 
 				# if aligned region spans two or more Tpases, eg. composite transposon, 
 				# the current hit in the aligned region is trimmed to the tpase ORF.
@@ -1388,25 +1582,27 @@ def mTIR2hits4ispair(mispairs, mTIR, morfhitsNeighbors):
 				if (before != None and qstart <= before[0][2]) or (after != None and qend >= after[0][1]):
 					qstart, qend = orf[1], orf[2]
 				'''
-				hit['bd'] = [qstart, qend]
+				hit.bd = [qstart, qend]
 			# single-copy IS element without TIR, with boundary defined by ORF
 			else:
-				hit['bd'] = [orf[1], orf[2]]
+				hit.bd = [orf[1], orf[2]]
 
 			# add copy number info to hit (IS element)
-			hit['occurence'] = {}
-			hit['occurence']['ncopy4is'] = ncopy
-			hit['occurence']['ncopy4orf'] = 0
-			hit['occurence']['sim4orf'] = 0.0
-			hit['occurence']['sim4is'] = 0.0
+			hit.ncopy4is = ncopy
 
 			hits.append(hit)
 		if len(hits) > 0:
-			hits.sort(key = lambda x: x['bd'][0])
+			hits.sort(key = lambda x: x.bd[0])
 			mhits[seqid] = hits
 	return mhits
 
-def getFullIS(mOrfHits, mDNA, maxDist4ter2orf, minDist4ter2orf, morfhitsNeighbors):
+# Return mispairs, the copies of Tpase ORFs found by blastn in each DNA sequence
+# mispairs: {seqid: ispairs, ..., seqid: ispairs}
+# ispairs: {orfid: (orfhit, g), ...}, refer to getFullIS4seqOnStream()
+# nthread: maximal number of blastn processes running at the same time, constants.nthread if it is None
+def getCopies4orfHits(mOrfHits, mDNA, nthread=None):
+	if nthread is None:
+		nthread = constants.nthread
 	mispairs = {}
 	margs = []
 	for seqid, orfHits in mOrfHits.items():
@@ -1414,10 +1610,13 @@ def getFullIS(mOrfHits, mDNA, maxDist4ter2orf, minDist4ter2orf, morfhitsNeighbor
 			continue
 		args = (seqid, orfHits, mDNA[seqid])
 		margs.append(args)
+	# the longest sequence is submitted first, longest processing time first
+	margs.sort(key = lambda args: len(args[2][2]), reverse=True)
 	'''
 	for args in margs:
 		mispairs[seqid] = getFullIS4seqOnStream(args)
 	'''
+	margs = bucket4seqs(chunk4seqs(margs, nthread), nthread)
 
 	nseq = len(margs)
 	'''
@@ -1426,23 +1625,95 @@ def getFullIS(mOrfHits, mDNA, maxDist4ter2orf, minDist4ter2orf, morfhitsNeighbor
 	else:
 		nproc = nseq
 	'''
-	if nseq > constants.nthread:
-		nthread = constants.nthread
-	else:
+	if nseq < nthread:
 		nthread = nseq
 
 	#with concurrent.futures.ProcessPoolExecutor(max_workers = nproc) as executor:
 	with concurrent.futures.ThreadPoolExecutor(max_workers = nthread) as executor:
-		future2args = {executor.submit(getFullIS4seqOnStream, args): args for args in margs}
+		future2args = {}
+		for args in margs:
+			if isinstance(args, list):
+				future2args[executor.submit(getFullIS4bucketOnStream, args)] = args
+			else:
+				future2args[executor.submit(getFullIS4seqOnStream, args)] = args
 		for future in concurrent.futures.as_completed(future2args):
 			args = future2args[future]
 			try:
 				ispairs = future.result()
 			except Exception as e:
-				print('{} generated an exception: {}'.format(args[0], e))
+				if isinstance(args, list):
+					seqids = ','.join(item[0] for item in args)
+				else:
+					seqids = args[0]
+				print('{} generated an exception: {}'.format(seqids, e))
 			else:
-				mispairs[args[0]] = ispairs
-
+				if isinstance(args, list):
+					mispairs.update(ispairs)
+				elif args[0] not in mispairs.keys():
+					mispairs[args[0]] = ispairs
+				else:
+					mispairs[args[0]].update(ispairs)
+	# the copies of ORFs in the sequence split into chunks are kept in the same order as orfHits
+	for seqid, ispairs in mispairs.items():
+		orfids = [orfhit[5] for orfhit in mOrfHits[seqid] if orfhit[5] in ispairs.keys()]
+		mispairs[seqid] = {orfid: ispairs[orfid] for orfid in orfids}
+	return mispairs
+
+# Return margs4chunk, where the ORF hits in each DNA sequence not shorter than constants.size4bucket
+# are split into chunks according to the share of the sequence in the total length of all sequences,
+# so that the copies of ORFs in a long sequence, e.g. a complete chromosome, are searched by several
+# blastn processes at the same time.
+# Note: blastn ignores -num_threads when subject is given by -subject.
+#
+# margs4chunk: [args, ..., args], args: (seqid, orfhits, dna), refer to getFullIS4seqOnStream(),
+#	where orfhits of a long sequence may be a chunk of its ORF hits
+# nthread: maximal number of blastn processes running at the same time
+def chunk4seqs(margs, nthread):
+	total = sum(len(args[2][2]) for args in margs)
+	margs4chunk = []
+	for args in margs:
+		seqid, orfhits, dna = args
+		nchunk = min(int(nthread * len(dna[2]) / total), len(orfhits))
+		if len(dna[2]) < constants.size4bucket or nchunk < 2:
+			margs4chunk.append(args)
+			continue
+		size = math.ceil(len(orfhits) / nchunk)
+		for i in range(0, len(orfhits), size):
+			margs4chunk.append((seqid, orfhits[i: i+size], dna))
+	return margs4chunk
+
+# Return margs4bucket, where the DNA sequences shorter than constants.size4bucket are packed into
+# buckets balanced by the total length of sequences, and the longer sequences are left alone
+# margs4bucket: [item, ..., item], sorted by the total length of sequences in reverse order
+# item: args or bucket, args: (seqid, orfhits, dna), refer to getFullIS4seqOnStream()
+# bucket: [args, ..., args], searched by getFullIS4bucketOnStream()
+# nthread: short sequences are packed into at least nthread buckets if there are so many sequences,
+#	in order to keep all threads busy
+def bucket4seqs(margs, nthread):
+	dnaLen = lambda args: len(args[2][2])
+	margs4bucket = []
+	shortArgs = []
+	for args in margs:
+		if dnaLen(args) < constants.size4bucket:
+			shortArgs.append(args)
+		else:
+			margs4bucket.append(args)
+	nbucket = max(math.ceil(sum(dnaLen(args) for args in shortArgs) / constants.size4bucket), nthread)
+	if nbucket >= len(shortArgs):
+		margs4bucket.extend(shortArgs)
+	else:
+		for bucket in tools.partitionLPT(shortArgs, dnaLen, nbucket):
+			# same order as the sequences searched one by one
+			bucket.sort(key = dnaLen, reverse=True)
+			margs4bucket.append(bucket)
+	cost = lambda item: sum(dnaLen(args) for args in item) if isinstance(item, list) else dnaLen(item)
+	margs4bucket.sort(key = cost, reverse=True)
+	return margs4bucket
+
+# Return mHits, IS elements with TIRs searched in the regions around Tpase ORFs, refer to mTIR2hits4ispair()
+# mispairs: {seqid: ispairs, ..., seqid: ispairs}, returned by getCopies4orfHits()
+# nthread: number of threads aligning the regions around Tpase ORFs, refer to is_analysis.findIRbySSW()
+def getFullIS(mispairs, mDNA, maxDist4ter2orf, minDist4ter2orf, morfhitsNeighbors, nthread=1):
 	mInput4ssw, mboundary = is_analysis.prepare4ssw2findIRbyDNAbyFar4ispair(
 			mispairs, mDNA, maxDist4ter2orf, minDist4ter2orf, morfhitsNeighbors)
 
@@ -1453,7 +1724,7 @@ def getFullIS(mOrfHits, mDNA, maxDist4ter2orf, minDist4ter2orf, morfhitsNeighbor
 	#filters = constants.filters4ssw_default
 	TIRfilters = []
 	for filter in filters:
-		TIRs = is_analysis.findIRbySSW(mInput4ssw, filter)
+		TIRs = is_analysis.findIRbySSW(mInput4ssw, filter, nthread)
 		TIRfilters.extend([(TIR, filter) for TIR in TIRs])
 
 	bestTIRfilters = is_analysis.checkTIRseq(TIRfilters)
@@ -1471,6 +1742,7 @@ def getFullIS(mOrfHits, mDNA, maxDist4ter2orf, minDist4ter2orf, morfhitsNeighbor
 	# 2.2 define IS boundary by ORF
 	# 3. define IS boundary by ORF if no TIR is available in a single-copy IS element
 	mHits = mTIR2hits4ispair(mispairs, mTIR, morfhitsNeighbors)
+	metrics.count('ntir', sum(len(hit.tirs) > 0 for hits in mHits.values() for hit in hits))
 
 	return mHits
 
@@ -1480,26 +1752,26 @@ def getFullIS(mOrfHits, mDNA, maxDist4ter2orf, minDist4ter2orf, morfhitsNeighbor
 #	tir found in mHitsByFar is used.
 # mhits: {seqid: hits, ..., seqid: hits}
 # hits: [hit, ..., hit]
-# hit: {'orf': orf, 'tirs': tirs, 'hmmhit': hmmhit, 'bd': bd, 'occurence': occurence}
+# hit: ISHit, record with attributes orf, tirs, hmmhit, bd, ncopy4is, sim4is, ncopy4orf and sim4orf
 # orf: (seqid, begin, end, strand)
 # tirs: [tir, ..., tir]
 # tir: (score, irId, irLen, nGaps, start1, end1, start2, end2, seq1, seq2)
 # hmmhit: (familyName, best_1_domain_E-value, full_sequence_E-value, overlap_number)
 # bd: [start, end], boundary of hit (IS element)
-# occurence: {'ncopy4orf': ncopy4orf, 'sim4orf': sim4orf, 'ncopy4is': ncopy4is, 'sim4is': sim4is}
+# ncopy4orf, sim4orf, ncopy4is, sim4is: occurence of IS element
 # 
 def chooseHits(mHitsByNear, mHitsByFar):
 	mhits = {}
 	for accid, hitsByNear in mHitsByNear.items():
 		hitsByFar = mHitsByFar[accid]
 		hits = []
-		hitsByNear.sort(key = lambda x: x['orf'][1])
-		hitsByFar.sort(key = lambda x: x['orf'][1])
+		hitsByNear.sort(key = lambda x: x.orf[1])
+		hitsByFar.sort(key = lambda x: x.orf[1])
 		for hitpair in zip(hitsByNear, hitsByFar):
 			'''
-			if len(hitpair[0]['tirs']) > 0:
+			if len(hitpair[0].tirs) > 0:
 				hit = hitpair[0]
-			elif len(hitpair[1]['tirs']) > 0:
+			elif len(hitpair[1].tirs) > 0:
 				hit = hitpair[1]
 				print('tir not in near region but in far region', hit)
 			else:
@@ -1508,12 +1780,12 @@ def chooseHits(mHitsByNear, mHitsByFar):
 			# sort two hits by score of tir, and get the hit with greater score
 			# Note: the hitpair[0] will be returned if two hits have the same score.
 			hit = sorted(hitpair, 
-					key = lambda x: tools.irScore(x['tirs'][0]) if len(x['tirs'])>0 else 0, 
+					key = lambda x: tools.irScore(x.tirs[0]) if len(x.tirs)>0 else 0, 
 					reverse=True)[0]
 
 			hits.append(hit)
 			#print('hello choose hit', hit)
-		hits.sort(key = lambda x: x['bd'][0])
+		hits.sort(key = lambda x: x.bd[0])
 		mhits[accid] = hits
 	return mhits
 
@@ -1526,32 +1798,26 @@ def refineHits(mHits):
 	for accid in mHits.keys():
 		hitsCopy = []
 		for hit in mHits[accid]:
-			familyName = hit['hmmhit'][0]
-			if '|' in familyName:
-				familyCluster = familyName.split('|',1)[0]
-			else:
-				familyCluster = familyName
-			family, cluster = familyCluster.rsplit('_', 1)
-			minLen4is = constants.minMaxLen4is[family][0]
-			begin, end = hit['bd']
+			minLen4is = tools.familyInfo(hit.hmmhit[0]).minMaxLen4is[0]
+			begin, end = hit.bd
 			isLen = end - begin + 1
 			if isLen < minLen4is:
-				print('remove short hit (partial IS element)', isLen, hit['bd'], hit['orf'])
+				print('remove short hit (partial IS element)', isLen, hit.bd, hit.orf)
 				continue
 
-			#if hit['hmmhit'][2] > evalue_cutoff:
+			#if hit.hmmhit[2] > evalue_cutoff:
 			#	continue
 
 			# test evalue and number of Tpase copies (IS copies)
-			if hit['hmmhit'][2] > evalue4singleCopy and hit['occurence']['ncopy4is'] < 2:
+			if hit.hmmhit[2] > evalue4singleCopy and hit.ncopy4is < 2:
 				# filter out hits without TIR
-				if len(hit['tirs']) == 0:
+				if len(hit.tirs) == 0:
 					continue
 				# filter out hits with gaps in TIR (alignment of left hand rigth hand TIR sequences)
-				elif hit['tirs'][0][3] > 0:
+				elif hit.tirs[0][3] > 0:
 					continue
 				# filter out hits with irId/irLen < irSim4singleCopy (default 0.85)
-				elif hit['tirs'][0][1]/hit['tirs'][0][2] < irSim4singleCopy:
+				elif hit.tirs[0][1]/hit.tirs[0][2] < irSim4singleCopy:
 					continue
 
 			hitsCopy.append(hit)
@@ -1559,8 +1825,8 @@ def refineHits(mHits):
 			print('Warning: no valid hit found for {}'.format(accid))
 			continue
 		# sort hit by begin of orf
-		#hitsCopy.sort(key=lambda x: x['orf'][1])
-		hitsCopy.sort(key=lambda x: x['bd'][0])
+		#hitsCopy.sort(key=lambda x: x.orf[1])
+		hitsCopy.sort(key=lambda x: x.bd[0])
 		mhitsCopy[accid] = hitsCopy
 	
 	newkeys = mhitsCopy.keys()
@@ -1574,16 +1840,15 @@ def refineHits(mHits):
 #
 # mhits: {accid: hits, ..., accid: hits}
 # hits: [hit, ..., hit]
-# hit: {'orf': orf, 'tirs': tirs, 'hmmhit': hmmhit, 'occurence': occurence}
+# hit: ISHit, isScore of hit is set in place and no copy of hit is made
 # 
 # mhitsNew: {accid: hitsnew, ..., accid: hitsnew}
-# hitsnew: [hitnew, ..., hitnew]
-# hitnew: {'orf': orf, 'tirs': tirs, 'hmmhit': hmmhit, 'occurence': occurence, 'isScore': isScore}
+# hitsnew: [hit, ..., hit]
 # orf: (accid, begin, end, strand)
 # tirs: [tir, ..., tir]
 # tir: (score, irId, irLen, nGaps, start1, end1, start2, end2, seq1, seq2)
 # hmmhit: (familyName, best_1_domain_E-value, full_sequence_E-value, overlap_number)
-# occurence: {'ncopy4orf': ncopy4orf, 'sim4orf': sim4orf, 'ncopy4is': ncopy4is, 'sim4is': sim4is}
+# ncopy4orf, sim4orf, ncopy4is, sim4is: occurence of IS element
 # ncopy4orf: copy number of the specific Tpase ORF with sim > constants.sim4iso in same DNA sequence
 # ncopy4is: copy number of the specific IS element with sim > constants.sim4iso in same DNA sequence
 # sim4orf: Tpase ORF with identicalBases/lengthOfAlignment > sim are regarded as the same Tpase
@@ -1595,10 +1860,9 @@ def scoreHits(mhits):
 	mhitsNew = {}
 	for accid in mhits:
 		hits = []
-		for item in mhits[accid]:
-			hit = {}
+		for hit in mhits[accid]:
 			isScore = {}
-			isScore['evalue'], isScore['tir'], isScore['dr'], isScore['occurence'], isScore['irSim'], isScore['ncopy4orf'], isScore['ncopy4is'] = scoreHit(item)
+			isScore['evalue'], isScore['tir'], isScore['dr'], isScore['occurence'], isScore['irSim'], isScore['ncopy4orf'], isScore['ncopy4is'] = scoreHit(hit)
 
 			isScore['score'] = isScore['evalue'] + isScore['tir'] + isScore['dr'] + isScore['occurence']
 
@@ -1606,12 +1870,7 @@ def scoreHits(mhits):
 			#if isScore['score'] < constants.isScore:
 			#	continue
 
-			hit['isScore'] = isScore
-			hit['orf'] = item['orf']
-			hit['hmmhit'] = item['hmmhit']
-			hit['tirs'] = item['tirs']
-			hit['occurence'] = item['occurence']
-			hit['bd'] = item['bd']
+			hit.isScore = isScore
 			hits.append(hit)
 		mhitsNew[accid] = hits
 	return mhitsNew
@@ -1620,9 +1879,9 @@ def scoreHit(hit):
 	# score for full_sequence_E-value of hmm hit
 	# Option1:
 	'''
-	if hit['hmmhit'][2] > 0:
+	if hit.hmmhit[2] > 0:
 		# log(x), x > 0 
-		score4evalue = - math.log(hit['hmmhit'][2], 10)
+		score4evalue = - math.log(hit.hmmhit[2], 10)
 	else:
 		# if x == 0 or close to zero like 10**(-sys.float_info.min_10_exp)
 		score4evalue = - sys.float_info.min_10_exp
@@ -1639,8 +1898,8 @@ def scoreHit(hit):
 
 	# Score for TIR.
 	# We simply use the first tir if multiple tirs available for a hit.
-	if len(hit['tirs']) > 0 and len(hit['tirs'][0]) > 0:
-		score, irId, irLen = hit['tirs'][0][:3]
+	if len(hit.tirs) > 0 and len(hit.tirs[0]) > 0:
+		score, irId, irLen = hit.tirs[0][:3]
 		irSim = irId/irLen
 		'''
 		#if irSim < constants.minIrIdentity:
@@ -1670,10 +1929,10 @@ def scoreHit(hit):
 	# Fbeta attaches beta times as much importance to ncopy4is as ncopy4orf.
 	# In our practice, we use beta = 2, let F2 = 5 * (ncopy4is+ ncopy4orf-1)**2 / (ncopy4is + 4*ncopy4orf)
 	#
-	ncopy4is = hit['occurence']['ncopy4is']
-	ncopy4orf = hit['occurence']['ncopy4orf']
+	ncopy4is = hit.ncopy4is
+	ncopy4orf = hit.ncopy4orf
 	'''
-	sim4is = hit['occurence']['sim4is']
+	sim4is = hit.sim4is
 	sum = (ncopy4is + ncopy4orf -1)
 	f2 = 5 * sum * sum / (ncopy4is + 4*ncopy4orf)
 	scale4is = 10
@@ -1688,12 +1947,160 @@ def scoreHit(hit):
 	return (score4evalue, score4tir, score4dr, score4occurence, irSim, ncopy4orf, ncopy4is)
 
 
+# Identify IS elements in the DNA sequences with ORF hits, the stages after HMM hits are grouped by
+# DNA sequence, return (mHits, morfsMerged)
+# args: (mOrfHits, mDNA, nthread)
+# nthread: maximal number of blastn processes running at the same time in getCopies4orfHits(), and
+#	number of threads aligning the regions around Tpase ORFs in getFullIS()
+#
+# morfHits: {seqid: orfHits, ..., seqid: orfHits}
+# mDNA:	{seqid: (org, fileid, sequence), ..., seqid: (org, fileid, sequence)}
+# mHits: {seqid: hits, ..., seqid: hits}
+# morfsMerged: {seqid: orfsMerged, ..., seqid: orfsMerged}
+def pred4seqs(args):
+	mOrfHits, mDNA, nthread = args
+
+	# fingerprints of the stages, each of which depends on the fingerprint of the previous stage and
+	# the settings used by the stage, refer to constants.constants4stage,
+	# the checkpoint of a stage is used if it is available, refer to tools.loadCheckpoint()
+	key4merge = tools.fingerprint(mOrfHits, fingerprint4dna(mDNA), tools.fingerprint4constants('merge'))
+	key4copy = tools.fingerprint('copy', key4merge, tools.fingerprint4constants('copy'))
+	key4near = tools.fingerprint('near', key4copy, tools.fingerprint4constants('near'))
+	key4far = tools.fingerprint('far', key4copy, tools.fingerprint4constants('far'))
+	key4refine = tools.fingerprint('refine', key4near, key4far, tools.fingerprint4constants('refine'))
+	result = tools.loadCheckpoint('refine', key4refine)
+	if result is not None:
+		return result
+
+	# each stage is measured by metrics.Stage, refer to metrics.py
+	result = tools.loadCheckpoint('merge', key4merge)
+	if result is None:
+		with metrics.Stage('mergeOrfs'):
+			# Merge orfs if two orfs with distance < maxDistBetweenOrfs
+			maxDistBetweenOrfs = constants.maxDistBetweenOrfs
+			mOrfHits, morfsMerged = mergeOrfs(mOrfHits, maxDistBetweenOrfs)
+			mOrfHits = numberOrfHits(mOrfHits)
+
+			#print('hitNeighors() begins at', datetime.datetime.now().ctime())
+			# search TIR for multiple-copy IS element candidate and single-copy IS element candidate
+			morfhitsNeighbors = hitNeighors(mOrfHits)
+			metrics.count('norf', sum(len(orfHits) for orfHits in mOrfHits.values()))
+		tools.saveCheckpoint('merge', key4merge, (mOrfHits, morfsMerged, morfhitsNeighbors))
+	else:
+		mOrfHits, morfsMerged, morfhitsNeighbors = result
+
+	mHitsByNear = tools.loadCheckpoint('near', key4near)
+	mHitsByFar = tools.loadCheckpoint('far', key4far)
+	if mHitsByNear is None or mHitsByFar is None:
+		# copies of Tpase ORFs are shared by the searches of TIR in the near and far regions
+		mispairs = tools.loadCheckpoint('copy', key4copy)
+		if mispairs is None:
+			#print('getFullIS() begins at', datetime.datetime.now().ctime())
+			with metrics.Stage('copy'):
+				mispairs = getCopies4orfHits(mOrfHits, mDNA, nthread)
+			tools.saveCheckpoint('copy', key4copy, mispairs)
+
+	minDist4ter2orf = constants.minDist4ter2orf
+	if mHitsByNear is None:
+		# look for tir in the neighboring region of Tpase ORF in case of single-copy IS
+		maxDist4ter2orf = constants.outerDist4ter2tpase[0]
+		with metrics.Stage('near'):
+			mHitsByNear = getFullIS(mispairs, mDNA, maxDist4ter2orf, minDist4ter2orf, morfhitsNeighbors, 
+					nthread)
+		tools.saveCheckpoint('near', key4near, mHitsByNear)
+
+	if mHitsByFar is None:
+		# look for tir in the widen region of Tpase ORF in case of single-copy IS
+		maxDist4ter2orf = constants.outerDist4ter2tpase[1]
+		with metrics.Stage('far'):
+			mHitsByFar = getFullIS(mispairs, mDNA, maxDist4ter2orf, minDist4ter2orf, morfhitsNeighbors, 
+					nthread)
+		tools.saveCheckpoint('far', key4far, mHitsByFar)
+
+	with metrics.Stage('refine'):
+		# choose the tir between mHitsByNear and mHitsByFar:
+		# rule: keep tir near Tpase ORF if tir found in mHitsByNear, else use
+		#       tir found in mHitsByFar.
+		mHits = chooseHits(mHitsByNear, mHitsByFar)
+		#mHits = mHitsByFar
+
+		#for hits in mHits.values():
+		#	for hit in hits:
+		#		print('raw hit', hit.bd, hit.orf, hit.hmmhit, hit.occurence(), hit.tirs)
+
+		# remove hits that are partial IS elements identified by length, evalue and irId/irLen
+		if constants.removeShortIS == True:
+			mHits = refineHits(mHits)
+		metrics.count('nis', sum(len(hits) for hits in mHits.values()))
+
+	with metrics.Stage('overlap'):
+		# remove redundant IS elements with same boundary and same TIR
+		mHits = removeRedundantIS(mHits)
+		mHits = removeOverlappedHits(mHits)
+
+		# Calculate socore for each hit and then attach score to hit
+		#print('Begin scoring hits at', datetime.datetime.now().ctime())
+		mHits = scoreHits(mHits)
+		#print('Finish scoring hits at', datetime.datetime.now().ctime())
+		metrics.count('nis', sum(len(hits) for hits in mHits.values()))
+
+	tools.saveCheckpoint('refine', key4refine, (mHits, morfsMerged))
+	return (mHits, morfsMerged)
+
+# Return fingerprint of DNA sequences, made of the identifiers and lengths of sequences and the
+# modification time of the stores holding them
+# mDNA:	{seqid: (org, fileid, sequence), ..., seqid: (org, fileid, sequence)}
+# sequence: dnastore.PackedSeq
+def fingerprint4dna(mDNA):
+	dnas = []
+	for seqid in sorted(mDNA.keys()):
+		org, fileid, seq = mDNA[seqid]
+		dnas.append((seqid, org, fileid, len(seq), os.path.getmtime(seq.store.store)))
+	return tools.fingerprint(dnas)
+
+# Run pred4seqs(args) in a worker process of pred4seqsInParallel(), return (mHits, morfsMerged, stages)
+# stages: metrics of the stages run by pred4seqs(), which are merged into the metrics of the parent
+#	process, refer to metrics.merge()
+def pred4seqsInWorker(args):
+	# the worker is forked with the metrics of the parent process and it is reused for partitions
+	metrics.reset()
+	mHits, morfsMerged = pred4seqs(args)
+	return (mHits, morfsMerged, metrics.stages)
+
+# Run pred4seqs() in nproc processes, each process handles a partition of DNA sequences, return (mHits, morfsMerged)
+# The sorted seqids are dealt into partitions in turn and the results are merged in the order of partitions,
+# so the predictions are same as those from pred4seqs() running all sequences in one process.
+def pred4seqsInParallel(mOrfHits, mDNA, nproc):
+	seqids = sorted(seqid for seqid, orfHits in mOrfHits.items() if len(orfHits) > 0)
+	if len(seqids) < nproc:
+		nproc = len(seqids)
+	if nproc == 0:
+		return ({}, {})
+	nthread = max(1, constants.nthread // nproc)
+	margs = []
+	# partitions of sequences with nearly equal total length, refer to tools.partitionLPT()
+	for seqids4part in tools.partitionLPT(seqids, lambda seqid: len(mDNA[seqid][2]), nproc):
+		seqids4part.sort()
+		mOrfHits4part = {seqid: mOrfHits[seqid] for seqid in seqids4part}
+		mDNA4part = {seqid: mDNA[seqid] for seqid in seqids4part}
+		margs.append((mOrfHits4part, mDNA4part, nthread))
+
+	mHits = {}
+	morfsMerged = {}
+	with concurrent.futures.ProcessPoolExecutor(max_workers = nproc) as executor:
+		for mHits4part, morfsMerged4part, stages4part in executor.map(pred4seqsInWorker, margs):
+			mHits.update(mHits4part)
+			morfsMerged.update(morfsMerged4part)
+			metrics.merge(stages4part)
+	return (mHits, morfsMerged)
+
 # Input: fileids
 # fileids: [(fileid, org), ...], e.g. NC_000913, SRS078176.scaffolds
 # filenames: [(filename,org), ...], e.g. NC_000913.fna, SRS078176.scaffolds.fa
 #
 # Return a list of hmmHitsFiles
 # tblout_list: [hmmHitsFile, ...]
+# hmmHitsFile: binary hits file written by writeBinaryHits() if it is up to date, otherwise tbloutFile
 # tbloutFile: created by hmmer (phmmer or hmmsearch) run as the following command,
 #	phmmer --tblout phmmerHitsFile --max --noali --cpu nthread seqFile databaseFile
 # seqFile: profile HMM models file, created by hmmbuild in HMMer package
@@ -1711,11 +2118,13 @@ def prepare4tblout_list(hmm_path, fileids):
 		#if os.path.isfile(hmmFile):
 		fileName = '.'.join([hmmFileName, filename, 'faa'])
 		tblout = os.path.join(hmm_path, org, fileName)
+		# HMM hits file might be compressed, refer to constants.compression4intermediate
+		tblout = tools.compressedFile(tblout) or tblout
 		if os.path.isfile(tblout):
 			if os.stat(tblout).st_size == 0:
 				print('Empty file:', tblout)
 			else:
-				tblout_list.append(tblout)
+				tblout_list.append(hitsFile4tblout(tblout))
 		else:
 			print('No such file', tblout)
 
@@ -1723,11 +2132,13 @@ def prepare4tblout_list(hmm_path, fileids):
 		#if os.path.isfile(faaFile):
 		fileName = '.'.join([faaFileName, filename, 'faa'])
 		tblout = os.path.join(hmm_path, org, fileName)
+		# HMM hits file might be compressed, refer to constants.compression4intermediate
+		tblout = tools.compressedFile(tblout) or tblout
 		if os.path.isfile(tblout):
 			if os.stat(tblout).st_size == 0:
 				print('Empty file:', tblout)
 			else:
-				tblout_list.append(tblout)
+				tblout_list.append(hitsFile4tblout(tblout))
 		else:
 			print('No such file', tblout)
 	return tblout_list
@@ -1740,51 +2151,16 @@ def outputHits(hits, outfile):
 	fp.write(''.join(lines))
 	fp.close()
 
-def pred(args):
-	print('pred begins at', datetime.datetime.now().ctime())
-
-	fileids = []
-	# fileids: [(fileid, org), ...]
-	filenames = []
-	# filenames: [(filename,org), ...], e.g. NC_000913.fna, SRS078176.scaffolds.fa
-	#
-	# mDNA:	{seqid: (org, fileid, sequence), ..., seqid: (org, fileid, sequence)}
-	mDNA = {}
-	dnaFiles = tools.rdDNAlist(args['dna_list'])
-	for item in dnaFiles:
-		file, org = item
-		filename = os.path.basename(file)
-		#fileid = filename.rsplit('.', 1)[0]
-		fileid = filename
-		fileids.append((fileid, org))
-
-		# seqs: [seq, ...]
-		# seq: (id, seq)
-		seqs = tools.getFasta(file)
-		if len(seqs) > 0 and len(seqs[0]) > 0:
-			#mDNA[seqs[0][0]] = (org, fileid, seqs[0][1])
-			for seq in seqs:
-				mDNA[seq[0]] = (org, fileid, seq[1])
-		else:
-			print('Warning: no sequence found in', file)
-	fileids.sort(key = operator.itemgetter(0))
-
-	# Get hmmsearch hits and write the sorted hits into a file
-
-	if 'hitsFile' in args.keys():
-		tblout_list = args['hitsFile']
-	else:
-		hmm_path = args['path_to_hmmsearch_results'].strip()
-		tblout_list = prepare4tblout_list(hmm_path, fileids)
-	if len(tblout_list) == 0:
-		print('No results returned by HMM search was found for sequences in', args['dna_list'])
-		return 0
-
+# Return mOrfHits, ORF hits grouped by DNA sequence, converted from the HMM hits in tblout_list,
+# or None if no hit is found for a DNA sequence
+# tblout_list: [hmmHitsFile, ...], refer to prepare4tblout_list()
+# mOrfHits: {seqid: orfHits, ..., seqid: orfHits}, refer to convertHits2orfHits()
+def hmmHits2orfHits(tblout_list):
 	#print('Processing tblout files at', datetime.datetime.now().ctime())	
 	mtblout_hits_sorted = []
 	for tblout in tblout_list:
 		#seqids, tblout_hits_sorted = process_tblout(tblout)
-		tblout_hits_sorted = process_tblout(tblout)
+		tblout_hits_sorted = loadHits(tblout)
 		# seqids: {}, set of sequence identifiers in a dnaFile with multiple sequences included
 		#
 		# tblout_hits_sorted: [hit, ...]
@@ -1799,6 +2175,7 @@ def pred(args):
 		# overlap: integer, overlap number, how many of envelopes overlap other envelopes; 
 		#	be careful when ov > 0refer to hmmsearch manual for details
 
+		metrics.count('nhit', len(tblout_hits_sorted))
 		if len(tblout_hits_sorted) == 0:
 			print('Warning: no hit returned by HMM search in', tblout)
 			continue
@@ -1933,62 +2310,18 @@ def pred(args):
 
 	#print('Convert hits to orfHits at', datetime.datetime.now().ctime())
 	mOrfHits = convertHits2orfHits(mtblout_hits_sorted)
-	#print('Finish converting hits to orfHits at', datetime.datetime.now().ctime())
-	
-	# Merge orfs if two orfs with distance < maxDistBetweenOrfs
-	maxDistBetweenOrfs = constants.maxDistBetweenOrfs
-	mOrfHits, morfsMerged = mergeOrfs(mOrfHits, maxDistBetweenOrfs)
-
-
-	#print('hitNeighors() begins at', datetime.datetime.now().ctime())
-	# search TIR for multiple-copy IS element candidate and single-copy IS element candidate
-	minDist4ter2orf = constants.minDist4ter2orf
-	morfhitsNeighbors = hitNeighors(mOrfHits)
-
-	#print('getFullIS() begins at', datetime.datetime.now().ctime())
-	# look for tir in the neighboring region of Tpase ORF in case of single-copy IS
-	maxDist4ter2orf = constants.outerDist4ter2tpase[0]
-	mHitsByNear = getFullIS(mOrfHits, mDNA, maxDist4ter2orf, minDist4ter2orf, morfhitsNeighbors)
-
-	# look for tir in the widen region of Tpase ORF in case of single-copy IS
-	maxDist4ter2orf = constants.outerDist4ter2tpase[1]
-	mHitsByFar = getFullIS(mOrfHits, mDNA, maxDist4ter2orf, minDist4ter2orf, morfhitsNeighbors)
-
-	# choose the tir between mHitsByNear and mHitsByFar:
-	# rule: keep tir near Tpase ORF if tir found in mHitsByNear, else use
-	#       tir found in mHitsByFar.
-	mHits = chooseHits(mHitsByNear, mHitsByFar)
-	#mHits = mHitsByFar
-
-	#for hits in mHits.values():
-	#	for hit in hits:
-	#		print('raw hit', hit['bd'], hit['orf'], hit['hmmhit'], hit['occurence'], hit['tirs'])
-
-	# remove hits that are partial IS elements identified by length, evalue and irId/irLen
-	if constants.removeShortIS == True:
-		mHits = refineHits(mHits)
-
-	# remove redundant IS elements with same boundary and same TIR
-	mHits = removeRedundantIS(mHits)
-	mHits = removeOverlappedHits(mHits)
-
-	# Calculate socore for each hit and then attach score to hit
-	#print('Begin scoring hits at', datetime.datetime.now().ctime())
-	mHits = scoreHits(mHits)
-	#print('Finish scoring hits at', datetime.datetime.now().ctime())
-
-	#--------------------------
-	# Output predictions, mHits
-
+	return mOrfHits
+
+# Return proteomes, the index of genes for each genome sequence, where the protein sequences are not
+# loaded but read from proteome file only for the ORFs of IS elements when they are output
+# proteomes: {seqid: (filename, genes), ...}
+# genes: tools.FastaIndex, {cdsid: seq, ...}, all genes in proteome file
+# cdsid: example, SRS075404_LANL_scaffold_1_1_414_+, C3691328_7626_8378_-
+# seq: protein sequence
+# fileids: [(fileid, org), ...], e.g. NC_000913.fna, SRS078176.scaffolds.fa
+def getProteomes(path_to_proteome, fileids):
 	#print('Begin reading protein database at', datetime.datetime.now().ctime())
-	# Get full lists of genes for each genome sequence
-	# proteomes: {seqid: (filename, genes), ...}
-	# genes: {cdsid: seq, ...}
-	# cdsid: example, SRS075404_LANL_scaffold_1_1_414_+, C3691328_7626_8378_-
-	# seq: protein sequence
 	proteomes = {}
-	path_to_proteome = args['path_to_proteome'].strip()
-	# fileids: [(fileid, org), ...], e.g. NC_000913.fna, SRS078176.scaffolds.fa
 	for item in fileids:
 		filename, org = item
 		#proteome_file = os.path.join(path_to_proteome, org, fileid + '.fna.faa')
@@ -1996,47 +2329,234 @@ def pred(args):
 		if os.stat(proteome_file).st_size == 0:
 			print('Empty file:', proteome_file)
 			continue
-		#seqid, genes = tools.getcds(proteome_file)
-		# cdss: [(seqid, cdsid,seq), ...]
+		genes = tools.FastaIndex(proteome_file)
 		# seqid: sequence id, e.g. SRS075404_LANL_scaffold_1, C3691328
-		# cdsid: cds identifier, e.g. SRS075404_LANL_scaffold_1_1_414_+, C3691328_7626_8378_-
-		# seq: protein sequence
-		cdss = tools.getcds(proteome_file)
-		# group cdss by seqid
-		cdss.sort(key=operator.itemgetter(0))
-		for seqid,cdsgroup in itertools.groupby(cdss, key=operator.itemgetter(0)):
-			genes = {seqid_cdsid_seq[1]:seqid_cdsid_seq[2] for seqid_cdsid_seq in cdsgroup}
+		for seqid in set(cdsid.rsplit('_',maxsplit=3)[0] for cdsid in genes.keys()):
 			proteomes[seqid] = (filename, genes)
 	#print('Finish reading protein database at', datetime.datetime.now().ctime())
+	return proteomes
+
+# Return chunks, [seqids, ..., seqids], where the sequences with ORF hits are split in order of seqid
+# into chunks, the estimated memory used for each chunk is not more than constants.mem4pred MB
+# unless a chunk holds only one sequence.
+# The memory used for a sequence is estimated as constants.mem4orfhit bytes for each ORF hit, most
+# of which is used by the alignments of ORF extended sequences and the regions searched for TIR.
+def chunks4seqs(mOrfHits):
+	chunks = []
+	seqids = []
+	mem4chunk = 0
+	for seqid in sorted(mOrfHits.keys()):
+		mem4seq = len(mOrfHits[seqid]) * constants.mem4orfhit
+		if len(seqids) > 0 and mem4chunk + mem4seq > constants.mem4pred * (1 << 20):
+			chunks.append(seqids)
+			seqids = []
+			mem4chunk = 0
+		seqids.append(seqid)
+		mem4chunk += mem4seq
+	if len(seqids) > 0:
+		chunks.append(seqids)
+	return chunks
+
+# Identify IS elements in DNA sequences chunk by chunk and append them to the prediction files, where
+# the ORF hits and the intermediate results of a chunk are released before the next chunk, so that the
+# memory used to identify IS elements does not grow with the number of sequences in DNA files. The
+# ORF hits and proteomes of all sequences are loaded by pred() before the first chunk, refer to
+# constants.mem4pred. The predictions are the same as those identified in all sequences at once,
+# because each DNA sequence is processed independently.
+#
+# mOrfHits: {seqid: orfHits, ..., seqid: orfHits}, the ORF hits of a chunk are removed from it
+# mDNA:	{seqid: (org, fileid, sequence), ..., seqid: (org, fileid, sequence)}
+# dnaTypes: {seqid: dnaType, ...}, refer to pred()
+# proteomes: {seqid: (filename, genes), ...}, refer to getProteomes()
+def pred4chunks(mOrfHits, mDNA, dnaTypes, proteomes):
+	orgfiles = set(os.path.join(v[0],v[1]) for v in mDNA.values()) 
+	norgfiles = len(orgfiles)
+	if norgfiles == 0:
+		e = 'Error: cannot get organism name (directory name holding genome sequence FASTA file) and FASTA sequence file name!'
+		raise RuntimeError(e)
+	# the rows of sequences are written into catalog at first and those of IS elements chunk by chunk
+	if constants.catalog4pred == True:
+		catalog.addPredictions(mDNA, {}, dnaTypes)
+
+	chunks = chunks4seqs(mOrfHits)
+	# output: files opened for all chunks if all sequences are in one DNA file, refer to openOutput4oneFile()
+	output = None
+	nis = 0
+	for i, seqids in enumerate(chunks):
+		print('Identify IS elements in chunk {} of {} with {} sequences at {}'.format(
+			i+1, len(chunks), len(seqids), datetime.datetime.now().ctime()))
+		mOrfHits4chunk = {seqid: mOrfHits.pop(seqid) for seqid in seqids}
+		mDNA4chunk = {seqid: mDNA[seqid] for seqid in seqids}
+		if constants.nproc4pred > 1:
+			mHits, morfsMerged = pred4seqsInParallel(mOrfHits4chunk, mDNA4chunk, constants.nproc4pred)
+		else:
+			mHits, morfsMerged = pred4seqs((mOrfHits4chunk, mDNA4chunk, constants.nthread))
+
+		with metrics.Stage('output'):
+			if constants.catalog4pred == True:
+				mhits4catalog = {seqid: hits for seqid, hits in mHits.items() if seqid in proteomes.keys()}
+				catalog.appendPredictions(mDNA4chunk, mhits4catalog)
+
+			nis4chunk = sum([len(hits) for hits in mHits.values()])
+			if nis4chunk > 0 and norgfiles > 1:
+				outputIndividual(mHits, mDNA4chunk, proteomes, morfsMerged)
+			elif nis4chunk > 0:
+				orgfileid = next(iter(orgfiles))
+				if output is None:
+					output = openOutput4oneFile(orgfileid)
+				outputIS4multipleSeqOneFile(mHits, mDNA4chunk, proteomes, morfsMerged, orgfileid, output)
+		nis += nis4chunk
+		del mOrfHits4chunk, mDNA4chunk, mHits, morfsMerged
+		dnastore.revcomp4seq.cache_clear()
+
+	if output is not None:
+		# The sequences without IS also need to be counted in len4DNATotal.
+		closeOutput4oneFile(output, sum([len(v[2]) for v in mDNA.values()]))
+	if nis == 0:
+		print('No IS element was identified for', sorted(seqid for seqids in chunks for seqid in seqids))
+
+# Return file4metrics, the file holding the metrics of stages in the run for dna_list, which is
+#	dir4prediction/org/fileid.metrics.json next to the predictions if dna_list holds only one DNA file,
+#	dir4prediction/org/org.metrics.json if all DNA files in dna_list belong to organism org, e.g. the
+#	temporary dna_list of an organism written by batch4pred.pred4org(),
+#	otherwise dir4prediction/basename(dna_list).metrics.json, refer to metrics.py.
+def file4metrics(dna_list):
+	dnaFiles = tools.rdDNAlist(dna_list)
+	if len(dnaFiles) == 1:
+		file, org = dnaFiles[0]
+		return os.path.join(constants.dir4prediction, org, os.path.basename(file) + '.metrics.json')
+	orgs = set(org for file, org in dnaFiles)
+	if len(orgs) == 1 and '' not in orgs:
+		org = orgs.pop()
+		return os.path.join(constants.dir4prediction, org, org + '.metrics.json')
+	return os.path.join(constants.dir4prediction, os.path.basename(dna_list) + '.metrics.json')
 
-	# Output IS element list and sequence for each DNA sequence into .out, .gff and .fna files, respectively.
+def pred(args):
+	print('pred begins at', datetime.datetime.now().ctime())
+	# the stages of isPredict() are kept in metrics if pred is called by isPredict()
+	if 'hitsFile' not in args.keys():
+		metrics.reset()
+	file4metrics4run = file4metrics(args['dna_list'])
+
+	fileids = []
+	# fileids: [(fileid, org), ...]
+	filenames = []
+	# filenames: [(filename,org), ...], e.g. NC_000913.fna, SRS078176.scaffolds.fa
 	#
 	# mDNA:	{seqid: (org, fileid, sequence), ..., seqid: (org, fileid, sequence)}
-	orgfiles = set(os.path.join(v[0],v[1]) for v in mDNA.values()) 
-	norgfiles = len(orgfiles)
-	# mHits: {accid: hits, ..., accid: hits}
-	# hits: [hit, ..., hit]
-	if sum([len(hits) for hits in mHits.values()]) == 0:
-		print('No IS element was identified for', sorted(mHits.keys()))
-		print('End in pred', datetime.datetime.now().ctime())
-		return 0
+	# sequence: dnastore.PackedSeq
+	mDNA = {}
+	# dnaTypes: {seqid: dnaType, ...}, refer to tools.dnaType4header(), required only by catalog
+	dnaTypes = {}
+	dnaFiles = tools.rdDNAlist(args['dna_list'])
+	for item in dnaFiles:
+		file, org = item
+		filename = os.path.basename(file)
+		#fileid = filename.rsplit('.', 1)[0]
+		fileid = filename
+		fileids.append((fileid, org))
 
-	if norgfiles > 1:
-		outputIndividual(mHits, mDNA, proteomes, morfsMerged)
-	elif norgfiles == 1:
-		# output ISs in all sequences into one file
-		if len(mHits) > 0:
-			outputIS4multipleSeqOneFile(mHits, mDNA, proteomes, morfsMerged, orgfiles.pop())
+		# sequences are read from the 2-bit packed store of file instead of being loaded into memory
+		# store: dnastore.DNAStore, {seqid: seq, ...}
+		# seq: dnastore.PackedSeq, which can be sliced like character string
+		store = dnastore.getStore(file, org, fileid)
+		if len(store) > 0:
+			#mDNA[seqs[0][0]] = (org, fileid, seqs[0][1])
+			for seqid in store.seqids:
+				mDNA[seqid] = (org, fileid, store[seqid])
+			if constants.catalog4pred == True:
+				# the sequence lines before the first header line are stored as seqid '' without header
+				headers = tools.headers4fasta(file)
+				for seqid in store.seqids:
+					dnaTypes[seqid] = tools.dnaType4header(headers.get(seqid, ''))
 		else:
-			print('No IS element was found for {}'.format(mHits.keys()))
+			print('Warning: no sequence found in', file)
+	fileids.sort(key = operator.itemgetter(0))
+
+	# Get hmmsearch hits and write the sorted hits into a file
+
+	if 'hitsFile' in args.keys():
+		tblout_list = args['hitsFile']
 	else:
-		e = 'Error: cannot get organism name (directory name holding genome sequence FASTA file) and FASTA sequence file name!'
-		raise RuntimeError(e)
+		hmm_path = args['path_to_hmmsearch_results'].strip()
+		tblout_list = prepare4tblout_list(hmm_path, fileids)
+	if len(tblout_list) == 0:
+		print('No results returned by HMM search was found for sequences in', args['dna_list'])
+		if constants.catalog4pred == True:
+			catalog.addPredictions(mDNA, {}, dnaTypes)
+		metrics.write(file4metrics4run)
+		return 0
+
+	# HMM hits are converted into ORF hits, which are saved in checkpoint 'hits' keyed by the hits files
+	key4hits = tools.fingerprint([(file, os.path.getsize(file), os.path.getmtime(file)) for file in tblout_list],
+			tools.fingerprint4constants('hits'))
+	mOrfHits = tools.loadCheckpoint('hits', key4hits)
+	if mOrfHits is None:
+		with metrics.Stage('tblout'):
+			mOrfHits = hmmHits2orfHits(tblout_list)
+		if mOrfHits is None:
+			if constants.catalog4pred == True:
+				catalog.addPredictions(mDNA, {}, dnaTypes)
+			metrics.write(file4metrics4run)
+			return
+		tools.saveCheckpoint('hits', key4hits, mOrfHits)
+	#print('Finish converting hits to orfHits at', datetime.datetime.now().ctime())
+
+	# Each DNA sequence is processed independently from here on
+	# The sequences are processed chunk by chunk in bounded memory if constants.mem4pred > 0
+	if constants.mem4pred > 0:
+		proteomes = getProteomes(args['path_to_proteome'].strip(), fileids)
+		pred4chunks(mOrfHits, mDNA, dnaTypes, proteomes)
+		metrics.write(file4metrics4run)
+		print('End in pred', datetime.datetime.now().ctime())
+		return
+
+	if constants.nproc4pred > 1:
+		mHits, morfsMerged = pred4seqsInParallel(mOrfHits, mDNA, constants.nproc4pred)
+	else:
+		mHits, morfsMerged = pred4seqs((mOrfHits, mDNA, constants.nthread))
+
+	#--------------------------
+	# Output predictions, mHits
+
+	with metrics.Stage('output'):
+		proteomes = getProteomes(args['path_to_proteome'].strip(), fileids)
+
+		# Replace the records of DNA files in catalog, where the IS elements are recorded only for
+		# the sequences whose predictions are output below
+		if constants.catalog4pred == True:
+			mhits4catalog = {seqid: hits for seqid, hits in mHits.items() if seqid in proteomes.keys()}
+			catalog.addPredictions(mDNA, mhits4catalog, dnaTypes)
+
+		# Output IS element list and sequence for each DNA sequence into .out, .gff and .fna files, respectively.
+		#
+		# mDNA:	{seqid: (org, fileid, sequence), ..., seqid: (org, fileid, sequence)}
+		orgfiles = set(os.path.join(v[0],v[1]) for v in mDNA.values()) 
+		norgfiles = len(orgfiles)
+		# mHits: {accid: hits, ..., accid: hits}
+		# hits: [hit, ..., hit]
+		nis = sum([len(hits) for hits in mHits.values()])
+		if nis == 0:
+			print('No IS element was identified for', sorted(mHits.keys()))
+		elif norgfiles > 1:
+			outputIndividual(mHits, mDNA, proteomes, morfsMerged)
+		elif norgfiles == 1:
+			# output ISs in all sequences into one file
+			if len(mHits) > 0:
+				outputIS4multipleSeqOneFile(mHits, mDNA, proteomes, morfsMerged, orgfiles.pop())
+			else:
+				print('No IS element was found for {}'.format(mHits.keys()))
+		else:
+			e = 'Error: cannot get organism name (directory name holding genome sequence FASTA file) and FASTA sequence file name!'
+			raise RuntimeError(e)
 
 	# Output predictions, mHits
 	#--------------------------
 
+	metrics.write(file4metrics4run)
 	print('End in pred', datetime.datetime.now().ctime())
+	if nis == 0:
+		return 0
 
 
 if __name__ == "__main__":
@@ -0,0 +1,60 @@
+# Run with: python3 -m unittest discover tests
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+dir4repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, dir4repo)
+
+import constants
+import batch4pred
+
+# Copy the bundled NC_012624.fna with its proteome and hmmsearch results into dir4org as fileid,
+# where seqid is renamed to NC_012624.<version> to keep the sequences of an organism distinct.
+def copyGenome(dir4org, fileid, version):
+	files = [(os.path.join(dir4repo, 'NC_012624.fna'), os.path.join(dir4org, fileid))]
+	for dir in ('proteome', 'hmm'):
+		for filename in os.listdir(os.path.join(dir4repo, dir)):
+			if not filename.endswith('NC_012624.fna.faa'):
+				continue
+			file = os.path.join(dir, os.path.basename(dir4org), filename.replace('NC_012624.fna', fileid))
+			files.append((os.path.join(dir4repo, dir, filename), file))
+	for src, dst in files:
+		os.makedirs(os.path.dirname(dst), exist_ok=True)
+		with open(src, 'r') as fp:
+			text = fp.read()
+		with open(dst, 'w') as fp:
+			fp.write(text.replace('NC_012624.1|', 'NC_012624.{}|'.format(version)))
+	return os.path.join(dir4org, fileid)
+
+@unittest.skipIf(shutil.which(constants.blastn) is None, 'blastn is not available')
+class TestWork(unittest.TestCase):
+	def setUp(self):
+		self.cwd = os.getcwd()
+		self.dir4test = tempfile.mkdtemp()
+		os.chdir(self.dir4test)
+		self.nproc4pred = constants.nproc4pred
+		# pred.pred4seqsInParallel() starts its processes in the process of the organism
+		constants.nproc4pred = 2
+
+	def tearDown(self):
+		constants.nproc4pred = self.nproc4pred
+		os.chdir(self.cwd)
+		shutil.rmtree(self.dir4test)
+
+	def test_work4twoFiles(self):
+		files = [copyGenome('org', 'one.fna', 1), copyGenome('org', 'two.fna', 2)]
+		batch4pred.enqueue({'org': files})
+		batch4pred.work('proteome', 'hmm')
+
+		self.assertEqual(batch4pred.status4queue(), {'todo': 0, 'claimed': 0, 'done': 1, 'failed': 0})
+		for fileid in ('one.fna', 'two.fna'):
+			file = os.path.join(constants.dir4prediction, 'org', fileid + '.sum')
+			self.assertTrue(os.path.isfile(file), file)
+		file = os.path.join(constants.dir4prediction, 'org', 'org.metrics.json')
+		self.assertTrue(os.path.isfile(file), file)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,69 @@
+# Run with: python3 -m unittest discover tests
+import os
+import sys
+import shutil
+import filecmp
+import tempfile
+import unittest
+
+dir4repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, dir4repo)
+
+import constants
+import pred
+
+# Copy the bundled NC_012624.fna with its proteome and hmmsearch results into the current directory,
+# where the DNA file holds the bundled sequence nseq times as NC_012624.1, NC_012624.2, ...
+def copyGenome(nseq):
+	for dir in ('proteome', 'hmm'):
+		os.makedirs(dir)
+	for file in ['NC_012624.fna'] + [os.path.join(dir, filename) for dir in ('proteome', 'hmm')
+			for filename in os.listdir(os.path.join(dir4repo, dir)) if filename.endswith('NC_012624.fna.faa')]:
+		with open(os.path.join(dir4repo, file), 'r') as fp:
+			text = fp.read()
+		with open(file, 'w') as fp:
+			for i in range(nseq):
+				fp.write(text.replace('NC_012624.1|', 'NC_012624.{}|'.format(i+1)))
+	with open('dna.list', 'w') as fp:
+		fp.write('NC_012624.fna\n')
+
+@unittest.skipIf(shutil.which(constants.blastn) is None, 'blastn is not available')
+class TestPred4chunks(unittest.TestCase):
+	def setUp(self):
+		self.cwd = os.getcwd()
+		self.dir4test = tempfile.mkdtemp()
+		os.chdir(self.dir4test)
+		self.mem4pred, self.mem4orfhit = constants.mem4pred, constants.mem4orfhit
+
+	def tearDown(self):
+		constants.mem4pred, constants.mem4orfhit = self.mem4pred, self.mem4orfhit
+		os.chdir(self.cwd)
+		shutil.rmtree(self.dir4test)
+
+	# Run pred.pred() on dna.list with mem4pred and return the directory holding the predictions
+	def pred(self, mem4pred):
+		constants.mem4pred = mem4pred
+		pred.pred({'dna_list': 'dna.list', 'path_to_proteome': 'proteome', 'path_to_hmmsearch_results': 'hmm'})
+		dir4prediction = 'prediction{}'.format(mem4pred)
+		os.rename(constants.dir4prediction, dir4prediction)
+		return dir4prediction
+
+	def assertSamePredictions(self, dir1, dir2):
+		files = sorted(file for file in os.listdir(dir1) if not file.endswith('.metrics.json'))
+		self.assertEqual(files, sorted(file for file in os.listdir(dir2) if not file.endswith('.metrics.json')))
+		self.assertGreater(len(files), 0)
+		match, mismatch, errors = filecmp.cmpfiles(dir1, dir2, files, shallow=False)
+		self.assertEqual(mismatch + errors, [])
+
+	def test_pred4chunks(self):
+		copyGenome(1)
+		self.assertSamePredictions(self.pred(0), self.pred(1))
+
+	# each sequence is processed in its own chunk and appended to the same prediction files
+	def test_pred4chunks4seqs(self):
+		copyGenome(2)
+		constants.mem4orfhit = 1 << 20
+		self.assertSamePredictions(self.pred(0), self.pred(1))
+
+if __name__ == '__main__':
+	unittest.main()
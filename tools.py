@@ -1,12 +1,26 @@
 import io
+import gzip
+import mmap
+import collections
+import numpy
+import tempfile
+import threading
 import csv
 import glob
+import shutil
+import hashlib
+import pickle
 import os.path
 import constants
+import dnastore
+import metrics
 import re
 import sys
 import itertools
 import subprocess, shlex
+import signal
+import atexit
+import datetime
 import errno # for makedir()
 
 
@@ -137,6 +151,20 @@ def gene2pep(table='11', geneSeq=''):
 	return ''.join(pep)
 	
 
+# Return seq broken into lines of width characters, same as '\n'.join(chunkstring(seq, width)).
+# Long sequence is viewed as the rows of a matrix and the line breaks are added as a column at once.
+def wrapSeq(seq, width):
+	nrow = len(seq) // width
+	if nrow < 16 or not seq.isascii():
+		return '\n'.join(chunkstring(seq, width))
+	block = numpy.empty((nrow, width+1), dtype=numpy.uint8)
+	block[:, :width] = numpy.frombuffer(seq.encode('ascii'), dtype=numpy.uint8, count=nrow*width).reshape(nrow, width)
+	block[:, width] = ord('\n')
+	rest = seq[nrow*width:]
+	if len(rest) > 0:
+		return block.tobytes().decode('ascii') + rest
+	return block.tobytes().decode('ascii')[:-1]
+
 # Format sequence into FASTA format and return it with header
 # header: messeage for header line in fasta format
 # seq: sequence to format into FASTA with 50 single-letter codes per line
@@ -147,7 +175,7 @@ def fasta_format(header, seq):
 	#for row in chunkstring(seq, lineWidth):
 	#	fasta_seq += row + '\n'
 
-	fasta_seq = '\n'.join(chunkstring(seq, lineWidth))
+	fasta_seq = wrapSeq(seq, lineWidth)
 	fasta = '{}\n{}\n'.format(header, fasta_seq)
 	#fasta = header + '\n' + fasta_seq
 	return fasta
@@ -160,76 +188,460 @@ def fastaFormat(header, seq):
 	fasta = '\n'.join([header, fasta_seq])
 	return fasta
 
-# get both compound identifier and content of fasta sequence
-# seqs: [(id, seq), ..., (id, seq)]
-# seq: character string
-def getFasta(fastaFile):
-	fp = open(fastaFile, 'r')
-	seqs = []
+# characters removed from both ends of each line in FASTA file
+blank4fasta = ' \t\r\n\b\x0b\x0c'
+
+# magic number at the beginning of compressed file, BGZF file is a gzip file
+magic4compression = {'gz': b'\x1f\x8b', 'zst': b'\x28\xb5\x2f\xfd'}
+# suffix appended to the name of file compressed in the format, refer to constants.compression4output
+suffix4compression = {'': '', 'gz': '.gz', 'bgzf': '.gz', 'zst': '.zst'}
+
+# Return the compression format of file by its magic number, 'gz' (including BGZF), 'zst', or '' if
+# file is not compressed.
+def compression4file(file):
+	with open(file, 'rb') as fp:
+		magic = fp.read(4)
+	for compression, magic4file in magic4compression.items():
+		if magic.startswith(magic4file):
+			return compression
+	return ''
+
+# Return the existing compressed file of file, file.gz or file.zst, or None if it does not exist
+def compressedFile(file):
+	for suffix in ('.gz', '.zst'):
+		if os.path.isfile(file + suffix):
+			return file + suffix
+	return None
+
+# zstandard is an optional package, it is required only to read or write zstd-compressed file
+def importZstd():
+	try:
+		import zstandard
+	except ImportError:
+		e = 'Error: python package zstandard is required to read or write zstd-compressed file!'
+		raise RuntimeError(e)
+	return zstandard
+
+# Binary file written by compression command through its stdin, e.g. 'pigz -c > file'
+class PipeWriter(io.RawIOBase):
+	def __init__(self, cmd, file):
+		self.cmd = cmd
+		self.fp = open(file, 'wb')
+		self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=self.fp)
+
+	def writable(self):
+		return True
+
+	def write(self, b):
+		return self.process.stdin.write(b)
+
+	def close(self):
+		if self.closed:
+			return
+		self.process.stdin.close()
+		returncode = self.process.wait()
+		self.fp.close()
+		super().close()
+		if returncode != 0:
+			e = 'Error: {} returns {}'.format(' '.join(self.cmd), returncode)
+			raise RuntimeError(e)
+
+# Return file object of file, mode: 'r', 'w', 'rb' or 'wb'
+# Compressed file is decompressed on the fly in read mode whatever its name is. In write mode, file
+# is compressed in compression format:
+#	'': no compression
+#	'gz': by pigz with constants.nthread threads if it is available, otherwise by gzip module
+#	'bgzf': by bgzip with constants.nthread threads, block-compressed gzip file which can be read
+#		by any gzip reader, file is compressed by gzip module if bgzip is not available
+#	'zst': by zstandard package with constants.nthread threads
+def openFile(file, mode='r', compression=''):
+	binary = mode.endswith('b')
+	if mode[0] == 'r':
+		compression = compression4file(file)
+		if compression == 'gz':
+			fp = gzip.open(file, 'rb')
+		elif compression == 'zst':
+			fp = io.BufferedReader(importZstd().ZstdDecompressor().stream_reader(open(file, 'rb'), closefd=True))
+		else:
+			return open(file, mode)
+	elif compression in ('gz', 'bgzf'):
+		level = str(constants.level4compression)
+		if compression == 'gz' and shutil.which(constants.pigz) is not None:
+			cmd = [constants.pigz, '-c', '-' + level, '-p', str(constants.nthread)]
+		elif compression == 'bgzf' and shutil.which(constants.bgzip) is not None:
+			cmd = [constants.bgzip, '-c', '-l', level, '-@', str(constants.nthread)]
+		else:
+			if compression == 'bgzf':
+				print('Warning: no bgzip was found, compress', file, 'by gzip module instead')
+			cmd = None
+		if cmd is None:
+			fp = gzip.open(file, 'wb', compresslevel=constants.level4compression)
+		else:
+			fp = io.BufferedWriter(PipeWriter(cmd, file))
+	elif compression == 'zst':
+		cctx = importZstd().ZstdCompressor(level=constants.level4compression, threads=constants.nthread)
+		fp = cctx.stream_writer(open(file, 'wb'), closefd=True)
+	elif compression == '':
+		return open(file, mode)
+	else:
+		e = 'Error: unknown compression format {}'.format(compression)
+		raise RuntimeError(e)
+	if binary:
+		return fp
+	return io.TextIOWrapper(fp)
+
+# Return text of lines, each line ends with '\n', '' if there is no line
+def join4lines(lines):
+	if len(lines) == 0:
+		return ''
+	return '\n'.join(lines) + '\n'
+
+# Write text into file at once, where file is compressed in compression format, refer to openFile()
+def writeFile(file, text, compression=''):
+	with openFile(file, 'w', compression) as fp:
+		fp.write(text)
+
+# Compress file into file.gz or file.zst and remove file, return the compressed file, or file if
+# file has been compressed or compression is ''.
+def compressFile(file, compression):
+	if compression == '' or compression4file(file) != '':
+		return file
+	outfile = file + suffix4compression[compression]
+	tmpfile = '{}.{}.tmp'.format(outfile, os.getpid())
+	with open(file, 'rb') as fin, openFile(tmpfile, 'wb', compression) as fout:
+		shutil.copyfileobj(fin, fout, 1 << 20)
+	os.replace(tmpfile, outfile)
+	os.remove(file)
+	return outfile
+
+# Decompress file into outfile
+def decompressFile(file, outfile):
+	with openFile(file, 'rb') as fin, open(outfile, 'wb') as fout:
+		shutil.copyfileobj(fin, fout, 1 << 20)
+
+# Return fingerprint of objs, the SHA-1 digest of their repr() which is decided only by the values of
+# objs made of built-in types, e.g. str, int, float, tuple, list, set and dict
+def fingerprint(*objs):
+	sha1 = hashlib.sha1()
+	for obj in objs:
+		sha1.update(repr(obj).encode())
+	return sha1.hexdigest()
+
+# Return fingerprint of the settings in constants but constants.ignored4checkpoint
+# stage: None for all settings, or name of stage for only the settings used by stage and the settings
+#	not listed in constants.constants4stage
+def fingerprint4constants(stage=None):
+	listed = set(itertools.chain.from_iterable(constants.constants4stage.values()))
+	settings = []
+	for name, value in sorted(vars(constants).items()):
+		if name.startswith('_') or name in constants.ignored4checkpoint:
+			continue
+		if stage is not None and name in listed and name not in constants.constants4stage[stage]:
+			continue
+		if isinstance(value, (str, int, float, tuple, list, set, frozenset, dict)):
+			if isinstance(value, (set, frozenset)):
+				value = sorted(value)
+			settings.append((name, value))
+	return fingerprint(settings)
+
+# Return the checkpoint file of stage whose input and settings have fingerprint key
+def checkpointFile(stage, key):
+	return os.path.join(constants.dir4checkpoint, '.'.join([stage, key, 'pkl']))
+
+# Return the result of stage saved by saveCheckpoint(), or None if the checkpoint is not available
+def loadCheckpoint(stage, key):
+	if constants.checkpoint4pred != True:
+		return None
+	file = checkpointFile(stage, key)
+	if not os.path.isfile(file):
+		return None
+	try:
+		with open(file, 'rb') as fp:
+			return pickle.load(fp)
+	except (EOFError, pickle.UnpicklingError) as e:
+		print('Warning: broken checkpoint', file, e)
+		return None
+
+# Save result of stage into its checkpoint file, where key is the fingerprint of the input and
+# settings of stage
+def saveCheckpoint(stage, key, result):
+	if constants.checkpoint4pred != True:
+		return
+	file = checkpointFile(stage, key)
+	makedir(os.path.dirname(file))
+	tmpfile = '{}.{}.tmp'.format(file, os.getpid())
+	with open(tmpfile, 'wb') as fp:
+		pickle.dump(result, fp, protocol=pickle.HIGHEST_PROTOCOL)
+	os.replace(tmpfile, file)
+
+# Scheduling of tasks by longest processing time first (LPT): the tasks with the largest estimated
+# cost, e.g. size of DNA sequence or proteome, are started first, so that a large task does not
+# start last and decide when all tasks finish.
+#
+# Yield func(args) for args in margs, in the same order as executor.map(func, margs), where the
+# tasks are submitted to executor in the decreasing order of cost(args).
+def mapLPT(executor, func, margs, cost):
+	futures = [None] * len(margs)
+	for i in sorted(range(len(margs)), key = lambda i: cost(margs[i]), reverse=True):
+		futures[i] = executor.submit(func, margs[i])
+	for future in futures:
+		yield future.result()
+
+# Return parts: [items, ..., items], items partitioned into n parts with nearly equal sums of cost,
+# where each item, in the decreasing order of cost(item), is put into the part with the least cost.
+def partitionLPT(items, cost, n):
+	parts = [[] for i in range(n)]
+	costs = [0] * n
+	for item in sorted(items, key = cost, reverse=True):
+		i = costs.index(min(costs))
+		parts[i].append(item)
+		costs[i] += cost(item)
+	return parts
+
+# Return id, the first word in header of FASTA record, '' if header is blank, e.g. the header '' of
+# the sequence lines before the first header line, refer to iterFasta()
+def id4header(header):
+	return (header.split(maxsplit=1) or [''])[0]
+
+# Read FASTA file record by record, yield (header, seq)
+# header: character string, header line without '>', e.g. 'NC_000913.3 Escherichia coli str. K-12'
+# seq: character string, sequence lines joined without line breaks and blanks at both ends of lines
+#
+# Blank lines are skipped and the lines before the first header line are taken as a record with
+# header ''. Compressed file is decompressed on the fly. Uncompressed file is memory-mapped
+# and each record is cut out of it at once, only the records with blanks other than '\n' in
+# sequence lines are read line by line. The file with blanks before '>' of header line is read line
+# by line as compressed file.
+def iterFasta(file):
+	if compression4file(file) != '':
+		with openFile(file, 'r') as fp:
+			yield from iterFastaLines(fp)
+		return
+	if os.path.getsize(file) == 0:
+		return
+	with open(file, 'rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+		if indentedHeader4fasta(mm) == True:
+			with open(file, 'r', encoding='latin-1') as fp4lines:
+				yield from iterFastaLines(fp4lines)
+			return
+		size = len(mm)
+		if mm[:1] == b'>':
+			pos = 0
+		else:
+			# lines before the first header line
+			pos = mm.find(b'\n>')
+			pos = size if pos < 0 else pos + 1
+			seq = fastaBlock2seq(mm[:pos])
+			if seq != '':
+				yield ('', seq)
+		while pos < size:
+			eol = mm.find(b'\n', pos)
+			if eol < 0:
+				eol = size
+			header = mm[pos+1: eol].decode('latin-1').strip(blank4fasta)
+			end = mm.find(b'\n>', eol)
+			end = size if end < 0 else end + 1
+			yield (header, fastaBlock2seq(mm[eol: end]))
+			pos = end
+
+# Return True if there are blanks before '>' of any header line in FASTA file mapped by mm, where
+# the header lines cannot be found by '\n>'
+def indentedHeader4fasta(mm):
+	return re.search(b'(?:^|\n)[' + re.escape(blank4fasta.replace('\n', '').encode()) + b']+>', mm) is not None
+
+# Return seq, the sequence in block which holds the sequence lines of a record
+def fastaBlock2seq(block):
+	for c in (b'\r', b' ', b'\t', b'\b', b'\x0b', b'\x0c'):
+		if c in block:
+			break
+	else:
+		# fast path, only line breaks need be removed
+		return block.replace(b'\n', b'').decode('latin-1')
+	lines = (line.strip(blank4fasta) for line in block.decode('latin-1').split('\n'))
+	return ''.join(lines)
+
+# iterFasta() on lines of FASTA file
+def iterFastaLines(fp):
+	header = None
 	seq = []
-	id = ''
 	for line in fp:
-		if line.replace('\b','').strip() == '':
+		line = line.strip(blank4fasta)
+		if line == '':
 			continue # remove blank line
 		if line[0] == '>':
-			if len(seq) > 0:
-				seqs.append((id, ''.join(seq)))
-			id = line[1:].split(maxsplit=1)[0]
+			if header is not None or len(seq) > 0:
+				yield (header or '', ''.join(seq))
+			header = line[1:]
 			seq = []
 			continue
-		seq.append(line.strip())
-	if len(seq) > 0:
-		seqs.append((id, ''.join(seq)))
-	else:
+		seq.append(line)
+	if header is not None or len(seq) > 0:
+		yield (header or '', ''.join(seq))
+
+# Return faidx, the index of FASTA file like the .fai index created by 'samtools faidx', and write it
+# into file.fai if file.fai does not exist or is older than file.
+# faidx: {id: (length, offset, linebases, linewidth), ...}
+# id: the first word of header
+# length: length of sequence
+# offset: offset of the first base in file
+# linebases, linewidth: number of bases and bytes of each sequence line, both are 0 if the lengths of
+#	lines are not same (except the last line) in the record
+#
+# Note: compressed file and the file with blanks before '>' of header line are not indexed and None
+#	is returned.
+def indexFasta(file):
+	faifile = file + '.fai'
+	if os.path.isfile(faifile) and os.path.getmtime(faifile) >= os.path.getmtime(file):
+		faidx = {}
+		with open(faifile, 'r') as fp:
+			for line in fp:
+				items = line.split('\t')
+				faidx[items[0]] = tuple(int(x) for x in items[1:5])
+		return faidx
+	if compression4file(file) != '':
+		return None
+	if os.path.getsize(file) > 0:
+		with open(file, 'rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+			if indentedHeader4fasta(mm) == True:
+				return None
+
+	faidx = {}
+	with open(file, 'rb') as fp:
+		id = None
+		offset = 0
+		for line in fp:
+			if line[:1] == b'>':
+				if id is not None:
+					faidx[id] = (length, start, linebases, linewidth)
+				id = line[1:].decode('latin-1').split(maxsplit=1)[0]
+				start = offset + len(line)
+				length, linebases, linewidth = 0, 0, 0
+				fixed, short = True, False
+			elif id is not None:
+				seq = line.strip(blank4fasta.encode())
+				bases = len(seq)
+				length += bases
+				if fixed == True:
+					if (short == True or bases == 0 or bases != len(line.rstrip(b'\r\n')) or 
+							b' ' in seq or b'\t' in seq):
+						# line following a short line, blank line or blanks in line
+						fixed = False
+						linebases, linewidth = 0, 0
+					elif linebases == 0:
+						linebases, linewidth = bases, len(line)
+					elif bases > linebases or len(line) - bases > linewidth - linebases:
+						fixed = False
+						linebases, linewidth = 0, 0
+					elif bases < linebases or len(line) < linewidth:
+						# the last line of record might be shorter
+						short = True
+			offset += len(line)
+		if id is not None:
+			faidx[id] = (length, start, linebases, linewidth)
+	try:
+		with open(faifile, 'w') as fp:
+			for id, value in faidx.items():
+				fp.write('\t'.join([id] + [str(x) for x in value]) + '\n')
+	except OSError:
+		print('Warning: cannot write index file', faifile)
+	return faidx
+
+# Return the sequence of id in FASTA file, or None if id is not found in file
+# faidx: index returned by indexFasta(file), it is created if it is None
+def fetchFasta(file, id, faidx=None):
+	if faidx is None:
+		faidx = indexFasta(file)
+	if faidx is None:
+		# no random access to compressed file
+		for header, seq in iterFasta(file):
+			if id4header(header) == id:
+				return seq
+		return None
+	if id not in faidx:
+		return None
+	length, offset, linebases, linewidth = faidx[id]
+	if length == 0:
+		return ''
+	with open(file, 'rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+		if linebases > 0:
+			# fixed-width lines: view the full lines as rows of a matrix without copying them and
+			# drop the line breaks, then append the last line
+			nrow = length // linebases
+			if nrow > 0 and offset + nrow*linewidth > len(mm):
+				# no line break at the end of file
+				nrow -= 1
+			rows = numpy.frombuffer(mm, dtype=numpy.uint8, count=nrow*linewidth, offset=offset)
+			seq = rows.reshape(nrow, linewidth)[:, :linebases].tobytes()
+			rest = length - nrow*linebases
+			if rest > 0:
+				start = offset + nrow*linewidth
+				seq += mm[start: start+rest]
+			del rows
+			return seq.decode('latin-1')
+		end = mm.find(b'\n>', offset)
+		end = len(mm) if end < 0 else end + 1
+		return fastaBlock2seq(mm[offset: end])
+
+# Read-only dict-like view of FASTA file, {id: seq, ...}, where only the index of file is kept in
+# memory and seq is read from file by fetchFasta() when it is looked up.
+# The sequences are loaded into memory if file cannot be indexed, e.g. compressed file.
+class FastaIndex(object):
+	def __init__(self, file):
+		self.file = file
+		self.faidx = indexFasta(file)
+		if self.faidx is None:
+			self.seqs = {id4header(header): seq for header, seq in iterFasta(file)}
+		else:
+			self.seqs = None
+
+	def __len__(self):
+		return len(self.keys())
+
+	def __contains__(self, id):
+		return id in self.keys()
+
+	def __iter__(self):
+		return iter(self.keys())
+
+	def keys(self):
+		if self.seqs is None:
+			return self.faidx.keys()
+		return self.seqs.keys()
+
+	def __getitem__(self, id):
+		if self.seqs is not None:
+			return self.seqs[id]
+		if id not in self.faidx:
+			raise KeyError(id)
+		return fetchFasta(self.file, id, self.faidx)
+
+# get both compound identifier and content of fasta sequence, the records without sequence are dropped
+# seqs: [(id, seq), ..., (id, seq)]
+# seq: character string
+def getFasta(fastaFile):
+	seqs = [(id4header(header), seq) for header, seq in iterFasta(fastaFile) if len(seq) > 0]
+	if len(seqs) == 0:
 		print('No sequence in', fastaFile)
-	fp.close()
 	return seqs
 
+# get both compound identifier and content of fasta sequence, the records without sequence are dropped
+# except the last record, which is dropped if it is the sequence lines without header line
 # seqs: [(id, seq), ..., (id, seq)]
 # seq: character string
 def getFasta_idseq(fastaFile):
-	fp = open(fastaFile, 'r')
-	seqs = []
-	seq = []
-	id = ''
-	for line in fp:
-		if line.strip() == '':
-			continue # remove blank line
-		if line[0] == '>':
-			if len(seq) > 0:
-				seqs.append((id, ''.join(seq)))
-				seq = []
-			id = line[1:].split(maxsplit=1)[0]
-			continue
-		seq.append(line.strip())
-	if len(id) > 0:
-		seqs.append((id, ''.join(seq)))
-	else:
+	seqs = [(id4header(header), seq) for header, seq in iterFasta(fastaFile)]
+	seqs = [record for record in seqs[:-1] if len(record[1]) > 0] + [record for record in seqs[-1:] if len(record[0]) > 0]
+	if len(seqs) == 0:
 		print('No sequence in', fastaFile)
-	fp.close()
 	return seqs
 
-# get both header and content of fasta sequence
+# get both header and content of fasta sequence, the records without sequence are dropped except
+# the last record
 # seqs: [(header, seq), ..., (header, seq)]
 # seq: character string
 def getFastaFull(file):
-	fp = open(file, 'r')
-	seqs = []
-	seq = []
-	for line in fp:
-		line = line.replace('\b', '').strip()
-		if line == '':
-			continue # remove blank line
-		if line[0] == '>':
-			if len(seq) > 0:
-				seqs.append((header, ''.join(seq)))
-				seq = []
-			header = line[1:] # header
-			continue
-		seq.append(line)
-	seqs.append((header, ''.join(seq)))
-	fp.close()
-	return seqs
+	seqs = list(iterFasta(file))
+	return [record for record in seqs[:-1] if len(record[1]) > 0] + seqs[-1:]
 
 # write IS elements in a genome into a csv file
 # genome_is: list, [] or [['ISDge6', 'IS5', 'ISL2', '-', '-', '-', '-', '36785', '36563', '802', '1024', '802', 'Partial'],
@@ -853,6 +1265,155 @@ def intergap(p1, p2):
 	gap = max(a, c) - min(b, d) - 1
 	return gap
 
+# Return timeout (seconds) of tool for input of size bytes, refer to constants.timeout4tool
+def timeout4tool(tool, size):
+	seconds, seconds4MB = constants.timeout4tool[tool]
+	return seconds + seconds4MB * size / (1 << 20)
+
+# Kill process and its child processes, where process is started by startTool() and is the leader
+# of its process group
+def killTool(process):
+	killGroup4tool(process.pid)
+
+def killGroup4tool(pid):
+	try:
+		os.killpg(pid, signal.SIGKILL)
+	except ProcessLookupError:
+		pass
+
+# The tools run in their own process groups, so that they are not killed with the process group of
+# python, e.g. by Ctrl-C or 'kill -- -pgid'. Instead, the running tools are killed by the handlers
+# of SIGTERM and SIGINT and at exit of python, and no tool is started after that.
+# groups4tool: {pid, ..., pid}, process groups of the tools started by current process
+groups4tool = set()
+stop4tool = threading.Event()
+# handlers4signal: {signum: handler, ...}, handlers replaced by stopTools4signal()
+handlers4signal = {}
+
+# Return process of cmd started like subprocess.Popen(cmd, **kwargs) in a new process group
+def startTool(cmd, **kwargs):
+	if stop4tool.is_set():
+		e = 'Error: {} is not started because the tools are being stopped'.format(cmd[0] if isinstance(cmd, list) else cmd)
+		raise RuntimeError(e)
+	process = subprocess.Popen(cmd, start_new_session=True, **kwargs)
+	groups4tool.add(process.pid)
+	if stop4tool.is_set():
+		# stopTools() ran before process was recorded
+		killTool(process)
+	return process
+
+# Raise RuntimeError if process of tool was killed by stopTools(), whose output is not complete
+def endTool(process, tool):
+	groups4tool.discard(process.pid)
+	if stop4tool.is_set() and process.returncode is not None and process.returncode < 0:
+		e = 'Error: {} is killed because the tools are stopped'.format(tool)
+		raise RuntimeError(e)
+
+# Kill the running tools and do not start any tool
+def stopTools():
+	stop4tool.set()
+	for pid in list(groups4tool):
+		killGroup4tool(pid)
+
+def stopTools4signal(signum, frame):
+	stopTools()
+	handler = handlers4signal[signum]
+	if callable(handler):
+		handler(signum, frame)
+	else:
+		# the default action of signal, e.g. terminating python for SIGTERM
+		signal.signal(signum, handler)
+		os.kill(os.getpid(), signum)
+
+# The handlers of signals can be set only in the main thread
+if threading.current_thread() is threading.main_thread():
+	for signum in (signal.SIGTERM, signal.SIGINT):
+		handler = signal.getsignal(signum)
+		if handler in (signal.SIG_IGN, None):
+			continue
+		handlers4signal[signum] = handler
+		signal.signal(signum, stopTools4signal)
+atexit.register(stopTools)
+# the child process forked by python, e.g. a worker of ProcessPoolExecutor, does not own the tools
+os.register_at_fork(after_in_child=groups4tool.clear)
+
+# Record the run of tool on input which is killed for timeout, refer to constants.file4timeout
+def logTimeout(tool, input, timeout, ntry):
+	print('Warning: {} on {} is killed after {:.0f} seconds, try {} of {}'.format(
+		tool, input, timeout, ntry, constants.retry4tool + 1))
+	makedir(os.path.dirname(os.path.abspath(constants.file4timeout)))
+	with open(constants.file4timeout, 'a') as fp:
+		print(datetime.datetime.now().ctime(), tool, input, '{:.0f}'.format(timeout), ntry, sep='\t', file=fp)
+
+# Kill process by timer if it runs longer than timeout seconds, expired is True if it is killed
+class ToolTimer(object):
+	def __init__(self, process, timeout):
+		self.process = process
+		self.expired = False
+		self.timer = threading.Timer(timeout, self.kill)
+		self.timer.daemon = True
+		self.timer.start()
+
+	def kill(self):
+		self.expired = True
+		killTool(self.process)
+
+	def cancel(self):
+		self.timer.cancel()
+
+# Run cmd of tool like subprocess.call(), return returncode of cmd, or None if cmd is killed for timeout
+# in all runs
+# input: input file of tool, whose size decides timeout, refer to timeout4tool()
+# size: size of input in bytes, size of input file if it is None
+#
+# cmd is run in a new process group by startTool(), which is killed if it runs out of time or the
+# caller is interrupted, and cmd is run again at most constants.retry4tool times for timeout.
+def callTool(tool, cmd, input, size=None, **kwargs):
+	if size is None:
+		size = os.path.getsize(input)
+	timeout = timeout4tool(tool, size)
+	for ntry in range(1, constants.retry4tool + 2):
+		process = startTool(cmd, **kwargs)
+		try:
+			process.wait(timeout=timeout)
+		except subprocess.TimeoutExpired:
+			killTool(process)
+			process.wait()
+			logTimeout(tool, input, timeout, ntry)
+			continue
+		except BaseException:
+			killTool(process)
+			process.wait()
+			raise
+		finally:
+			endTool(process, tool)
+		return process.returncode
+	return None
+
+# Run cmd of tool with query fed through stdin like subprocess.Popen().communicate(), return (out, err),
+# where err tells the timeout if cmd is killed for timeout in all runs, refer to callTool()
+def communicateTool(tool, cmd, query, input, size):
+	timeout = timeout4tool(tool, size)
+	for ntry in range(1, constants.retry4tool + 2):
+		process = startTool(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+				universal_newlines=True)
+		metrics.count('n' + tool)
+		try:
+			out, err = process.communicate(input=query, timeout=timeout)
+		except subprocess.TimeoutExpired:
+			killTool(process)
+			process.communicate()
+			logTimeout(tool, input, timeout, ntry)
+			continue
+		except BaseException:
+			killTool(process)
+			process.wait()
+			raise
+		finally:
+			endTool(process, tool)
+		return (out, err)
+	return ('', '{} on {} is killed after {:.0f} seconds'.format(tool, input, timeout))
+
 # makeblastdb -dbtype nucl -in output4FragGeneScan1.19_illumina_5/NC_002754.1.fna.ffn -out blastdb/NC_002754.1.fna.ffn
 def seq2blastdb(seqFile, db):
 	cmd = constants.makeblastdb
@@ -937,9 +1498,7 @@ def doBlastnOnStream(query, db, strand='both', task='megablast', perc_ident=100,
 		'-outfmt', outfmt
 		]
 	do_cmd = shlex.split(' '.join(cmd))
-	blastn = subprocess.Popen(do_cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-			universal_newlines=True)
-	out, err = blastn.communicate(input=query)
+	out, err = communicateTool('blastn', do_cmd, query, db, len(query))
 	return (out, err)
 
 # blastn -query query -subject subject ....
@@ -959,11 +1518,96 @@ def doBlastn2seqOnStream(query, subject, strand='both', task='megablast', perc_i
 		'-task', task, '-word_size', wordsize, '-outfmt', outfmt
 		]
 	do_cmd = shlex.split(' '.join(cmd))
-	blastn = subprocess.Popen(do_cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-			universal_newlines=True)
-	out, err = blastn.communicate(input=query)
+	out, err = communicateTool('blastn', do_cmd, query, subject, os.path.getsize(subject) + len(query))
 	return (out, err)
 
+def write2pipe(pipe, content):
+	try:
+		pipe.write(content)
+		pipe.close()
+	except BrokenPipeError:
+		pass
+
+# Run blastn like doBlastn2seqOnStream but parse the output on the fly, return (hits, err)
+# The query is fed to blastn in a separate thread while the tabular output is read from the pipe
+# and filtered by parseBlastLines4dna() in chunks of constants.nline4blastout lines as blastn 
+# emits it, so that the whole output is never held as one string.
+#
+# hits: numpy structured array of dtype blastDtype4dna, refer to getBlastResult4dnaOnStream()
+# err: character string, standard error of blastn
+# orfext: numpy structured array of dtype orfExtDtype
+# sids: None if subject is one DNA sequence, or numpy array of the indexes of DNA sequences in
+#	subject, where subject contains multiple DNA sequences with the indexes as headers, e.g. '>0',
+#	and only the alignments of each query against the DNA sequence sids[qid] are kept
+# label: name of the DNA sequences in subject, e.g. seqid, which is logged instead of subject if
+#	blastn is killed for timeout, because subject is usually a temporary file removed by the caller
+#
+# The output of blastn killed for timeout is discarded without being parsed, where the last line
+# might be incomplete, and blastn is run again, refer to callTool().
+def blastn2seqHits4dna(query, subject, orfext, strand='both', task='megablast', perc_ident=100, sids=None,
+		label=None):
+	if label is None:
+		label = subject
+	blast = constants.blastn
+	outfmt = shlex.quote('6 qseqid sseqid pident length mismatch gapopen qstart qend sstart send evalue bitscore nident qlen slen')
+	perc_identity = str(perc_ident)
+	if task == 'blastn-short':
+		wordsize = '7'
+	elif task == 'megablast':
+		wordsize = '28' # default value for megablast
+	else:
+		wordsize = '11' # default value for blastn
+	cmd = [blast, 
+		'-subject', subject, '-perc_identity', perc_identity, '-strand', strand, '-dust', 'no', 
+		'-task', task, '-word_size', wordsize, '-outfmt', outfmt
+		]
+	if sids is not None:
+		# all DNA sequences in subject are reported for each query
+		cmd.extend(['-max_target_seqs', str(int(sids.max()) + 1)])
+	do_cmd = shlex.split(' '.join(cmd))
+	# blastn is killed and run again if it runs out of time, refer to callTool()
+	timeout = timeout4tool('blastn', os.path.getsize(subject) + len(query))
+	for ntry in range(1, constants.retry4tool + 2):
+		with tempfile.TemporaryFile(mode='w+') as fperr:
+			blastn = startTool(do_cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=fperr,
+					universal_newlines=True)
+			metrics.count('nblastn')
+			timer = ToolTimer(blastn, timeout)
+			try:
+				feeder = threading.Thread(target=write2pipe, args=(blastn.stdin, query))
+				feeder.start()
+				chunks = []
+				while True:
+					lines = list(itertools.islice(blastn.stdout, constants.nline4blastout))
+					if len(lines) == 0 or timer.expired == True:
+						break
+					if not lines[-1].endswith('\n'):
+						# the last line is cut off when blastn is killed while writing it
+						lines.pop()
+					chunks.append(parseBlastLines4dna(lines, orfext, sids))
+				blastn.stdout.close()
+				feeder.join()
+				blastn.wait()
+			except BaseException:
+				killTool(blastn)
+				blastn.wait()
+				raise
+			finally:
+				timer.cancel()
+				endTool(blastn, 'blastn')
+			fperr.seek(0)
+			err = fperr.read()
+		if timer.expired == False:
+			break
+		logTimeout('blastn', label, timeout, ntry)
+		chunks = []
+		err = 'blastn on {} is killed after {:.0f} seconds'.format(label, timeout)
+	if len(chunks) == 0:
+		hits = numpy.empty(0, dtype=blastDtype4dna)
+	else:
+		hits = numpy.concatenate(chunks)
+	return (hits[numpy.lexsort((-hits['length'], hits['qid']))], err)
+
 # Get IS element copy number from the file output by blast search
 # The output is produed by blastn with options:
 # -outfmt '6 qseqid sseqid pident length mismatch gapopen qstart qend sstart send nident qlen slen' \
@@ -1060,111 +1704,84 @@ def getBlastResult(file, min4coverage):
 
 	return hits
 
-def getBlastResult4dnaOnStream(filec):
-	fp = io.StringIO(filec)
-	hits = []
-	for line in fp:
-		words = line.split()
-
-		# check the coverage of aligned length vs min(querylen, subjectlen)
-		# ignore the alignment with aligned length < isMin (usually isMin = 400, namely, shortest IS element)
-		length = int(words[3])
-		#if length < constants.isMin:
-		#	continue
-
-		#items = words[0].rsplit('_', maxsplit=6)
-		#minLen4is = int(items[1]) # minimal length of IS in the specific family which ORF belongs to
-
-		# word[0]: seqid_family_cluster_seqbegin_seqend_orfBegin_orfEnd_orfStrand
-		items = words[0].rsplit('_', maxsplit=7)
-		family = items[1]
-		# cluster = items[2]
-		minLen4is = constants.minMaxLen4is[family][0]
-		if length < minLen4is:
-			continue
-
-		seqbegin = int(items[3])
-		seqend = int(items[4])
-		orfBegin = int(items[5])
-		orfEnd = int(items[6])
-		orfStrand = items[7]
-
-		qlen = int(words[13])
-		if seqend-seqbegin+1 != qlen:
-			e = 'Error: different lengths for query sequence {}: {}({}-{}+1) {}'.format(
-				words[0], seqend-seqbegin+1, seqend, seqbegin, qlen)
-			RuntimeError(e)
-		start = int(words[6])
-		end = int(words[7])
-		move = start - 1
-		if orfStrand == '+':
-			qstart = seqbegin + move
-			qend = qstart + length - 1
-		else:
-			qend = seqend - move
-			qstart = qend - length + 1
-
-		orfLen = orfEnd - orfBegin + 1
-		intersect = intersection((orfBegin, orfEnd), (qstart, qend))
-		if intersect < 1:
-			continue
-		copy = False
-		#minLen4orf4tpase = constants.minMax4tpase[family][0]
-		#maxLen4orf4tpase = constants.minMax4tpase[family][1]
-		minLen4orf4pep = constants.minMax4tpase[family][2]
-		#
-		# Note: it means gene prediction may be not accuracy when predicted ORF is longer 
-		#	than the longest tpase ORF in IS family in ISfinder.
-		#if intersect < orfLen*constants.minOverlap4orf2aligned:
-		# 
-		# alignment overlapped with whole orf or part of orf
-		#if orfLen <= maxLen4orf and intersect >= orfLen*constants.minOverlap4orf2aligned:
-		#if orfLen <= maxLen4orf and intersect >= orfLen*0.9:
-		#
-		# alignment covers the full orf, namely, length >= orfLen and intersect == orfLen
-		#if orfLen <= maxLen4orf and qstart <= orfBegin < orfEnd <= qend:
-		#if orfLen <= maxLen4orf and intersect == orfLen:
-		#if orfLen <= maxLen4orf and intersect == orfLen:
-		#	copy = True
-		# alignment overlapped with part of orf
-		#if orfLen > maxLen4orf and intersect >= orfLen*constants.minOverlap4orf2aligned4longORF:
-		#if orfLen > maxLen4orf and intersect >= orfLen*0.5:
-		#if orfLen > maxLen4orf and intersect >= minLen4orf:
-
-		if orfLen >= minLen4orf4pep:
-			if intersect >= minLen4orf4pep:
-				copy = True
-		else:
-			if intersect >= orfLen:
-				copy = True
-
-
-		if copy == False:
-			#print('intersection({}) between {} and {} in alignment is less than threshold: \n{}'.format(
-			#	intersect, (orfBegin, orfEnd, orfStrand), (qstart, qend), line))
-			continue
-		#else:
-			#print('hello copy', intersect, (orfBegin, orfEnd, orfStrand), (qstart, qend))
-
-		hit = {}
-
-		# words[0] example: 'gi|556503834|ref|NC_000913.3|_IS200/IS605_12_1502643_1505379_1503157_1504865_+'
-		hit['qseqid'] = words[0]
-		hit['orfBegin'] = orfBegin
-		hit['orfEnd'] = orfEnd
-		# words[1] example: 'gi|15896971|ref|NC_002754.1|
-		hit['sseqid'] = words[1]
-		hit['length'] = length
-		hit['qstart'] = qstart
-		hit['qend'] = qend
-		hit['sstart'] = int(words[8])
-		hit['send'] = int(words[9])
-		hit['nident'] = int(words[12])
-		hit['qlen'] = qlen
-		hit['slen'] = int(words[14])
-		hit['pident'] = float(words[2])
-
-		hits.append(hit)
+# Each ORF extended sequence is written with its index in orfhits as the FASTA header, e.g. '>0', '>11',
+# and the layout of the extended sequence is kept in orfext, a numpy structured array of dtype orfExtDtype
+# indexed by the same index, so that the query of an alignment is resolved by indexing instead of
+# parsing a compound ID like 'gi|556503834|ref|NC_000913.3|_IS200/IS605_12_1502643_1505379_1503157_1504865_+'.
+#
+# seqbegin, seqend: boundary of the ORF extended sequence in DNA sequence
+# orfBegin, orfEnd: boundary of ORF in DNA sequence
+# minus: True if ORF is on the reverse strand
+# minLen4is: minimal length of IS element in the family which ORF belongs to
+# minLen4orf4pep: minimal length of Tpase ORF in the family which ORF belongs to
+orfExtDtype = [('seqbegin', numpy.int64), ('seqend', numpy.int64),
+		('orfBegin', numpy.int64), ('orfEnd', numpy.int64), ('minus', numpy.bool_),
+		('minLen4is', numpy.int64), ('minLen4orf4pep', numpy.int64)]
+
+# Alignment of ORF extended sequence (query) against DNA sequence, where qid is the index of query 
+# in orfext and qstart/qend are converted to the coordinates in DNA sequence.
+blastDtype4dna = [('qid', numpy.int64), ('length', numpy.int64), ('qstart', numpy.int64), ('qend', numpy.int64),
+		('sstart', numpy.int64), ('send', numpy.int64), ('nident', numpy.int64), ('qlen', numpy.int64),
+		('slen', numpy.int64), ('pident', numpy.float64), ('orfBegin', numpy.int64), ('orfEnd', numpy.int64)]
+
+# Return hits, a numpy structured array of dtype blastDtype4dna, sorted by qid and then by length
+# in reverse order, in which only the alignments which are long enough (>= minLen4is) and
+# cover the Tpase ORF are kept.
+#
+# filec: output of blastn with "-outfmt '6 qseqid sseqid pident length mismatch gapopen qstart qend 
+#	sstart send evalue bitscore nident qlen slen'"
+# orfext: numpy structured array of dtype orfExtDtype
+def getBlastResult4dnaOnStream(filec, orfext):
+	hits = parseBlastLines4dna(filec.splitlines(), orfext)
+	return hits[numpy.lexsort((-hits['length'], hits['qid']))]
+
+# Return hits, the alignments in lines kept in the same order as in lines
+# lines: [line, ..., line], lines of blastn output, refer to getBlastResult4dnaOnStream()
+# sids: None or numpy array of the indexes of DNA sequences, refer to blastn2seqHits4dna()
+def parseBlastLines4dna(lines, orfext, sids=None):
+	words = ' '.join(lines).split()
+	if len(words) == 0:
+		return numpy.empty(0, dtype=blastDtype4dna)
+	cols = numpy.array(words).reshape(-1, 15)
+	qid = cols[:, 0].astype(numpy.int64)
+	length = cols[:, 3].astype(numpy.int64)
+	ext = orfext[qid]
+
+	# ignore the alignment with aligned length < minimal length of IS element in the family
+	# which ORF belongs to
+	keep = length >= ext['minLen4is']
+	# ignore the alignment against the DNA sequence other than the one where query is extracted
+	if sids is not None:
+		keep &= cols[:, 1].astype(numpy.int64) == sids[qid]
+
+	# convert the coordinates in ORF extended sequence to the coordinates in DNA sequence
+	move = cols[:, 6].astype(numpy.int64) - 1
+	qstart = numpy.where(ext['minus'], ext['seqend'] - move - length + 1, ext['seqbegin'] + move)
+	qend = qstart + length - 1
+
+	orfBegin, orfEnd = ext['orfBegin'], ext['orfEnd']
+	orfLen = orfEnd - orfBegin + 1
+	intersect = numpy.minimum(orfEnd, qend) - numpy.maximum(orfBegin, qstart) + 1
+	minLen4orf4pep = ext['minLen4orf4pep']
+	# Note: it means gene prediction may be not accuracy when predicted ORF is longer 
+	#	than the longest tpase ORF in IS family in ISfinder.
+	# alignment overlapped with part of long orf or with whole short orf
+	copy = numpy.where(orfLen >= minLen4orf4pep, intersect >= minLen4orf4pep, intersect >= orfLen)
+	keep &= (intersect >= 1) & copy
+
+	hits = numpy.empty(numpy.count_nonzero(keep), dtype=blastDtype4dna)
+	hits['qid'] = qid[keep]
+	hits['length'] = length[keep]
+	hits['qstart'] = qstart[keep]
+	hits['qend'] = qend[keep]
+	hits['sstart'] = cols[keep, 8].astype(numpy.int64)
+	hits['send'] = cols[keep, 9].astype(numpy.int64)
+	hits['nident'] = cols[keep, 12].astype(numpy.int64)
+	hits['qlen'] = cols[keep, 13].astype(numpy.int64)
+	hits['slen'] = cols[keep, 14].astype(numpy.int64)
+	hits['pident'] = cols[keep, 2].astype(numpy.float64)
+	hits['orfBegin'] = orfBegin[keep]
+	hits['orfEnd'] = orfEnd[keep]
 	return hits
 
 # create dir if it does not exist yet
@@ -1198,24 +1815,15 @@ def get_proteome(proteome_file):
 # cdss: [(seqid, id,seq), ...]
 # seqid: sequence identifier, e.g. SRS075404_LANL_scaffold_1, C3691328
 # id: cds identifier, e.g. SRS075404_LANL_scaffold_1_1_414_+, C3691328_7626_8378_-
+#
+# The records without sequence are dropped except the last record.
 def getcds(file):
 	cdss = []
-	seq = []
-	with open(file, 'r') as fp:
-		for line in fp:
-			line = line.strip()
-			if line == '':
-				continue # remove blank line
-			if line[0] == '>':
-				if len(seq) > 0:
-					cdss.append((seqid, id,''.join(seq)))
-				id = line[1:].split(maxsplit=1)[0]
-				seqid = id.rsplit('_',maxsplit=3)[0]
-				seq = []
-				continue
-			seq.append(line)
-	cdss.append((seqid, id,''.join(seq)))
-	return cdss
+	for header, seq in iterFasta(file):
+		id = id4header(header)
+		seqid = id.rsplit('_',maxsplit=3)[0]
+		cdss.append((seqid, id, seq))
+	return [cds for cds in cdss[:-1] if len(cds[2]) > 0] + cdss[-1:]
 
 
 # read genebank .fna file and return the identifier of sequence
@@ -1230,6 +1838,15 @@ def rdGbFna(file):
 	fp.close()
 	return seqid
 
+# read genebank .fna file and return the identifiers of all sequences, same as rdGbFna() for each sequence
+def rdGbFnaIds(file):
+	seqids = []
+	with openFile(file, 'r') as fp:
+		for line in fp:
+			if line[:1] == '>':
+				seqids.append(line.strip().split(maxsplit=1)[0][1:])
+	return seqids
+
 # read genebank .faa file and return the peptide sequences
 # prot: [p, ..., p]
 # p: {'id': id, 'pid': pid, 'seq': seq, ...}
@@ -1309,88 +1926,119 @@ def gb2fgs4protein(gbFna, gbFaa, gbPtt, fgs):
 #	start and end are int, strand is character
 #   pep: amino acid sequence, character string
 # seq: nucleic acid sequence
+#
+# Return the first record in GenBank file, refer to iterGbk() for all records
 def rdGbk(gbkFile):
-	gbk = {}
-	gbk['prots'] = []
-	fp4gbkFile = open(gbkFile, 'r')
-	for line in fp4gbkFile:
-		if 'VERSION     ' == line[:12]:
-			items = line[12:].split(maxsplit=2)
-			gbk['accver'] = items[0]
-			if len(items) > 1:
-				gbk['gi'] = items[1]
-			continue
-		if '     CDS             ' == line[:21]:
-			if line[21] == 'c' and line[32].isdigit():
-				strand = '-'
-				coord = line[32:].strip().strip(')').strip().split('..', maxsplit=1)
-			elif line[21].isdigit():
-				strand = '+'
-				coord = line[21:].strip().split('..', maxsplit=1)
-			# not normal CDS, for example:
-			# '     CDS             join(58474..59052,59052..59279)'
-			# '     CDS             complement(join(380844..381259,382591..382872))'
-			else:
+	return next(iterGbk(gbkFile), None)
+
+# Read GenBank file record by record and yield gbk, refer to rdGbk(), where the records are
+# separated by line '//'. Compressed file is decompressed on the fly.
+# withSeq: seq is not kept in gbk if withSeq is False
+def iterGbk(gbkFile, withSeq=True):
+	with openFile(gbkFile, 'r') as fp:
+		gbk = {'prots': []}
+		# orf: CDS waiting for its translation
+		# pep: lines of translation being read
+		# seq: lines of nucleic acid sequence being read
+		orf, pep, seq = None, None, None
+		for line in fp:
+			if line[:2] == '//':
+				if seq is not None and withSeq == True:
+					gbk['seq'] = ''.join(seq).upper()
+				yield gbk
+				gbk = {'prots': []}
+				orf, pep, seq = None, None, None
 				continue
-			while True:
-				nextLine = next(fp4gbkFile)
-				if '                     /translation=' == nextLine[:34]:
-					nopep = False
-					break
-				# special case in NC_000913.gbk: 
-				# CDS(272847..273954) has no translated protein sequence.
-				elif len(nextLine[:21].strip()) > 0:
-					nopep = True
-					break
-			if nopep == True:
+			if seq is not None:
+				if withSeq == True:
+					seq.append(line[10:].strip().replace(' ',''))
 				continue
-			prot = {}
-			start, end = [int(x) for x in coord]
-			prot['orf'] = (start, end, strand)
-			gbk['prots'].append(prot)
-			pep = []
-			if nextLine[36:].strip()[-1] != '"':
-				pep.append(nextLine[36:].strip())
-			# short peptide sequence hold by a single line in .gbk file
-			else:
-				gbk['prots'][-1]['pep'] = nextLine[36:].strip()[:-1]
+			if pep is not None:
+				line = line.strip()
+				if line[-1:] == '"':
+					pep.append(line[:-1])
+					gbk['prots'].append({'orf': orf, 'pep': ''.join(pep)})
+					orf, pep = None, None
+				else:
+					pep.append(line)
 				continue
-			nextLine = next(fp4gbkFile).strip()
-			while nextLine[-1] != '"':
-				pep.append(nextLine)
-				nextLine = next(fp4gbkFile).strip()
-			pep.append(nextLine[:-1])
-			gbk['prots'][-1]['pep'] = ''.join(pep)
-			continue
-		if 'ORIGIN' == line.strip():
-			seq = []
-			nextLine = next(fp4gbkFile)
-			while nextLine[:2] != '//':
-				seq.append(nextLine[10:].strip().replace(' ',''))
-				nextLine = next(fp4gbkFile)
-			gbk['seq'] = ''.join(seq).upper()
-			fp4gbkFile.close()
-			return gbk
+			if 'VERSION     ' == line[:12]:
+				items = line[12:].split(maxsplit=2)
+				gbk['accver'] = items[0]
+				if len(items) > 1:
+					gbk['gi'] = items[1]
+				continue
+			# special case in NC_000913.gbk: 
+			# CDS(272847..273954) has no translated protein sequence, which ends at next feature.
+			if len(line[:21].strip()) > 0:
+				orf = None
+			if '     CDS             ' == line[:21]:
+				orf = gbkCDS2orf(line)
+				continue
+			if orf is not None and '                     /translation=' == line[:34]:
+				# line[34] is '"'
+				pep = line[35:].strip()
+				# short peptide sequence hold by a single line in .gbk file
+				if pep[-1:] == '"':
+					gbk['prots'].append({'orf': orf, 'pep': pep[:-1]})
+					orf, pep = None, None
+				else:
+					pep = [pep]
+				continue
+			if 'ORIGIN' == line.strip():
+				seq = []
+		# the last record without line '//'
+		if 'accver' in gbk or len(gbk['prots']) > 0:
+			if seq is not None and withSeq == True:
+				gbk['seq'] = ''.join(seq).upper()
+			yield gbk
+
+# Return orf, (start, end, strand), of CDS feature line in .gbk file, or None if it is not normal CDS,
+# for example:
+# '     CDS             join(58474..59052,59052..59279)'
+# '     CDS             complement(join(380844..381259,382591..382872))'
+# '     CDS             <1..206'
+def gbkCDS2orf(line):
+	loc = line[21:].strip()
+	strand = '+'
+	if loc[:11] == 'complement(' and loc[-1:] == ')':
+		loc = loc[11:-1].strip()
+		strand = '-'
+	coord = loc.split('..')
+	if len(coord) != 2 or not coord[0].isdigit() or not coord[1].isdigit():
+		return None
+	return (int(coord[0]), int(coord[1]), strand)
 
 
 # Convert GeneBank protein info (NC_000913.gbk) into FragGeneScan protein file format (NC_000913.fna.faa)
+# Each record in gbkFile is matched to the sequence in fnaFile by accession.version.
 def gbk2fgs4protein(fnaFile, gbkFile, fgsFile):
 	# make directories
 	makedir(os.path.dirname(fgsFile))
 
-	fp4fgsFile = open(fgsFile, 'w')
-	# seqid: eg. 'gi|15644634|ref|NC_000915.1|'
-	seqid = rdGbFna(fnaFile)
-	# gbk: {'accver':accver, 'gi':gi, 'prots':prots, 'seq':seq, ...}
-	gbk = rdGbk(gbkFile)
-	if seqid.strip('|').rsplit('|', maxsplit=1)[1] != gbk['accver']:
-		print('{} and {} may not the same sequence'.format(fnaFile, gbkFile))
-	for prot in gbk['prots']:
-		orfStr = '_'.join([str(x) for x in prot['orf']])
-		header = '_'.join([seqid, orfStr])
-		fasta = fastaFormat(header, prot['pep'])
-		print(fasta, file=fp4fgsFile)
+	# seqids: [seqid, ...], seqid: eg. 'gi|15644634|ref|NC_000915.1|', 'NC_000915.1'
+	seqids = rdGbFnaIds(fnaFile)
+	# seqid4accver: {accver: seqid, ...}
+	seqid4accver = {seqid.strip('|').rsplit('|', maxsplit=1)[-1]: seqid for seqid in seqids}
+	tmpfile = '{}.{}.tmp'.format(fgsFile, os.getpid())
+	fp4fgsFile = open(tmpfile, 'w')
+	for i, gbk in enumerate(iterGbk(gbkFile, withSeq=False)):
+		accver = gbk.get('accver', '')
+		if accver in seqid4accver:
+			seqid = seqid4accver[accver]
+		elif i == 0 and len(seqids) == 1:
+			seqid = seqids[0]
+			print('{} and {} may not the same sequence'.format(fnaFile, gbkFile))
+		else:
+			print('Warning: no sequence {} in {} was found in {}'.format(accver, gbkFile, fnaFile))
+			continue
+		for prot in gbk['prots']:
+			orfStr = '_'.join([str(x) for x in prot['orf']])
+			header = '_'.join([seqid, orfStr])
+			fasta = fastaFormat(header, prot['pep'])
+			print(fasta, file=fp4fgsFile)
 	fp4fgsFile.close()
+	os.replace(tmpfile, fgsFile)
 
 
 # For each orf, replace seqid with accid
@@ -1402,8 +2050,8 @@ def seqid2accid(mhits):
 		accid = seqid.rstrip('|').rsplit('|',1)[-1]
 		hitsNew = []
 		for hit in mhits[seqid]:
-			begin, end, strand = hit['orf'][1:]
-			hit['orf'] = (accid, begin, end, strand)
+			begin, end, strand = hit.orf[1:]
+			hit.orf = (accid, begin, end, strand)
 			hitsNew.append(hit)
 		mhitsNew[accid] = hitsNew
 	return mhitsNew
@@ -1418,8 +2066,8 @@ def seqid2fileid(mhits):
 		fileid = accid.split('.', maxsplit=1)[0]
 		hitsNew = []
 		for hit in mhits[seqid]:
-			begin, end, strand = hit['orf'][1:]
-			hit['orf'] = (fileid, begin, end, strand)
+			begin, end, strand = hit.orf[1:]
+			hit.orf = (fileid, begin, end, strand)
 			hitsNew.append(hit)
 		mhitsNew[fileid] = hitsNew
 	return mhitsNew
@@ -1634,6 +2282,39 @@ familyNames = [
 		'ISNCY',
 		]
 
+# Registry of the names of profile HMM models, each name is parsed only once into family and
+# cluster and the family-specific parameters are looked up at the same time, so the hot loops
+# in pred.py and is_analysis.py do not need to split the name and query constants for each ORF.
+#
+# familyName example: 'IS200/IS605_4|IS200/IS605|IS1341|ISCARN12|',
+#	'IS30_0', 'IS110_25|IS110||ISLIN1|'
+# familyCodes: {family: code, ..., family: code}, code is the index of family in the sorted
+#	family names, so that the same family gets the same integer code in all processes.
+# fam4hmm: {familyName: familyInfo, ..., familyName: familyInfo}
+# familyInfo: FamilyInfo(code, cluster, familyCluster, family, minMaxLen4is, minMax4tpase, minMax4tir)
+# code: integer, code of IS family
+# cluster: integer, cluster number within family, e.g. 4 for 'IS200/IS605_4'
+# familyCluster: character string, e.g. 'IS200/IS605_4'
+FamilyInfo = collections.namedtuple('FamilyInfo',
+		['code', 'cluster', 'familyCluster', 'family', 'minMaxLen4is', 'minMax4tpase', 'minMax4tir'])
+familyCodes = {family: code for code, family in enumerate(sorted(constants.minMaxLen4is))}
+fam4hmm = {}
+
+def familyInfo(familyName):
+	info = fam4hmm.get(familyName)
+	if info is not None:
+		return info
+	familyCluster = familyName.split('|',1)[0]
+	family, cluster = familyCluster.rsplit('_', 1)
+	if familyCluster in constants.minMax4tir:
+		minMax4tir = constants.minMax4tir[familyCluster]
+	else:
+		minMax4tir = constants.minMax4tir[family]
+	info = FamilyInfo(familyCodes[family], int(cluster), sys.intern(familyCluster), sys.intern(family),
+			constants.minMaxLen4is[family], constants.minMax4tpase[family], minMax4tir)
+	fam4hmm[familyName] = info
+	return info
+
 # output summarization for IS elements for an organism or multiple organisms
 # sum: {seqid: sum4seq, ..., seqid: sum4seq}
 # sum4seq: [] or [nis, %genome, bps4is, dnaLen4is, familySum, dnaLen, ngenome4is, ngenome, nplasmid4is, nplasmid, nphage4is, nphage]
@@ -1897,21 +2578,61 @@ def getSumFull(sumFileByOrg, org):
 def meta4genome(dir, org, fileid):
 	#fnafile = os.path.join(dir, org, fileid+'.fna')
 	fnafile = os.path.join(dir, org, fileid)
-	seqs = getFastaFull(fnafile)
-	# seqs: [(header, seq), ..., (header, seq)]
-	# get the first sequence in the fasta file which may contains one or multiple sequences
-	header, seq = seqs[0]
+	# get the first sequence in the fasta file which may contains one or multiple sequences,
+	# where only the header is read from fasta file and the length is read from the index of file
+	header = header4fasta(fnafile)
+	faidx = indexFasta(fnafile)
+	if header is None or id4header(header) == '' or faidx is None or id4header(header) not in faidx.keys():
+		# compressed file or the sequence lines before the first header line
+		header, seq = next(record for record in iterFasta(fnafile) if len(record[1]) > 0)
+		dnaLen = len(seq)
+	else:
+		dnaLen = faidx[id4header(header)][0]
 
 	metainfo = {}
-	metainfo['dnaLen'] = len(seq)
+	metainfo['dnaLen'] = dnaLen
+	metainfo['dnaType'] = dnaType4header(header)
+
+	return metainfo
+
+# Return header of the first record with sequence in FASTA file, '' if there are sequence lines
+# before the first header line, or None if there is no sequence in file.
+# The file is read only up to the first sequence line.
+def header4fasta(file):
+	header = ''
+	with openFile(file, 'r') as fp:
+		for line in fp:
+			line = line.strip(blank4fasta)
+			if line[:1] == '>':
+				header = line[1:].strip(blank4fasta)
+			elif line != '':
+				return header
+	return None
+
+# Return 0, 1 or 2 to represent phage or plasmid or genome DNA described by header of FASTA record
+def dnaType4header(header):
 	if 'phage' in header.lower():
-		metainfo['dnaType'] = 0
+		return 0
 	elif 'plasmid' in header.lower():
-		metainfo['dnaType'] = 1
+		return 1
 	else:
-		metainfo['dnaType'] = 2
+		return 2
 
-	return metainfo
+# Return headers: {seqid: header, ..., seqid: header}, the headers of records in FASTA file,
+# where seqid is the first word in header, the sequence lines are skipped without being joined.
+def headers4fasta(file):
+	headers = {}
+	with openFile(file, 'r') as fp:
+		for line in fp:
+			line = line.lstrip(blank4fasta)
+			if line[:1] == '>':
+				header = line[1:].strip(blank4fasta)
+				if header == '':
+					continue
+				seqid = header.split(maxsplit=1)[0]
+				if seqid not in headers:
+					headers[seqid] = header
+	return headers
 
 # Get mDNA from .fna file list like bacteria.fna.list
 # Return: [mDNA, fileids]
@@ -1930,11 +2651,11 @@ def fnaFileList2mDNA(filelist):
 		fileid = filename
 		fileids.append((fileid, org))
 
-		# seq: [(id, seq), ..., (id, seq)]
-		seqs = getFasta(dnafile)
+		# store: dnastore.DNAStore, 2-bit packed sequences in dnafile
+		store = dnastore.getStore(dnafile, org, fileid)
 		# simply get the first sequence in fasta file.
-		if len(seqs) > 0 and len(seqs[0]) > 0:
-			mDNA[seqs[0][0]] = (org, fileid, seqs[0][1])
+		if len(store) > 0:
+			mDNA[store.seqids[0]] = (org, fileid, store[store.seqids[0]])
 		else:
 			print('Warning: no sequence found in', dnafile)
 	dir4data = os.path.dirname(os.path.dirname(dnafile))
@@ -1958,21 +2679,58 @@ def checkTax(org, sum4is4genome, tax):
 		print('Warning: one organism has more than one taxid', org, acc2tax)
 		
 
+# Return the fingerprint of the files summarized by sum4org() for organism org, where the
+# .sum file of each DNA sequence and the DNA file are identified by their size and mtime
+# and a missing .sum file (DNA sequence without IS element) is identified by None
+#
+# items: [[fileid, seqid], ..., [fileid, seqid]]
+def fingerprint4sum(org, items, dir4data, dir4prediction):
+	files = []
+	for fileid, seqid in items:
+		for file in (os.path.join(dir4prediction, org, '.'.join([fileid, 'sum'])),
+				os.path.join(dir4data, org, fileid)):
+			if os.path.isfile(file):
+				stat = os.stat(file)
+				files.append((file, seqid, stat.st_size, stat.st_mtime_ns))
+			else:
+				files.append((file, seqid, None))
+	return fingerprint(files)
+
+# Write organism.sum, organism4genome.sum, organism4plasmid.sum and organism4phage.sum for
+# each organism in mDNA.
+# The files of an organism are written again only if the .sum file of any DNA sequence or any
+# DNA file in the organism changed since they were written, refer to fingerprint4sum(), where
+# the fingerprint is kept in file organism.sum.key in organism directory.
+# Return the list of organisms whose files are written.
 def sum4org(mDNA, dir4data, tax, dir4prediction=constants.dir4prediction):
 	orgid = {}
 	for seqid in sorted(mDNA.keys()):
 		org, fileid, seq = mDNA[seqid]
 		if org not in orgid.keys():
 			orgid[org] = []
+		orgid[org].append([fileid, seqid])
 
-		# Get meta info from  .fna file.
-		# Here we simply look for info for genome type.
-		# metainfo: {'dnaType': a}, a can be 0,1,2 to represent phage or plasmid or genome DNA
-		metainfo = meta4genome(dir4data, org, fileid)
+	orgs4update = []
+	for org in sorted(orgid.keys()):
+		path = os.path.join(dir4prediction, org)
+		keyfile = os.path.join(path, 'organism.sum.key')
+		key = fingerprint4sum(org, orgid[org], dir4data, dir4prediction)
+		sumfiles4org = [os.path.join(path, file) for file in ('organism.sum', 'organism4genome.sum',
+			'organism4plasmid.sum', 'organism4phage.sum')]
+		if os.path.isfile(keyfile) and all(os.path.isfile(file) for file in sumfiles4org):
+			with open(keyfile, 'r') as fp:
+				if fp.read().strip() == key:
+					continue
+		orgs4update.append(org)
 
-		orgid[org].append([fileid, seqid, metainfo['dnaType'], metainfo['dnaLen']])
+		for item in orgid[org]:
+			fileid, seqid = item
+			# Get meta info from  .fna file.
+			# Here we simply look for info for genome type.
+			# metainfo: {'dnaType': a}, a can be 0,1,2 to represent phage or plasmid or genome DNA
+			metainfo = meta4genome(dir4data, org, fileid)
+			item.extend([metainfo['dnaType'], metainfo['dnaLen']])
 
-	for org in sorted(orgid.keys()):
 		# Get summarization from .sum file of each seqid
 		# sum4is: {seqid: sum4seq, ..., seqid: sum4seq}
 		# sum4seq: [] or [nis, %genome, bps4is, len4DNA, familySum]
@@ -2049,6 +2807,9 @@ def sum4org(mDNA, dir4data, tax, dir4prediction=constants.dir4prediction):
 		output4sumFull(sum4is4plasmid, sumfile4org)
 		sumfile4org = os.path.join(path, 'organism4phage.sum')
 		output4sumFull(sum4is4phage, sumfile4org)
+		with open(keyfile, 'w') as fp:
+			fp.write(key + '\n')
+	return orgs4update
 	
 # return tax
 # tax: [seq2tax, ..., seq2tax]